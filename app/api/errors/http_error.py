@@ -18,4 +18,4 @@ async def http_error_handler(request: Request, exc: HTTPException) -> JSONRespon
     if request:
         pass
 
-    return JSONResponse({"errors": [exc.detail]}, status_code=exc.status_code)
+    return JSONResponse({"errors": [exc.detail]}, status_code=exc.status_code, headers=getattr(exc, "headers", None))
@@ -0,0 +1,26 @@
+"""Liveness / readiness probes."""
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.core.recommender import startup
+
+router = APIRouter()
+
+
+@router.get("/live")
+def live():
+    """
+    200 khi process đang chạy (kể cả lúc đang load / warm-up), 503 nếu startup lỗi: orchestrator
+    nên khởi động lại process.
+    """
+    return JSONResponse(startup.status(), status_code=200 if startup.live else 503)
+
+
+@router.get("/ready")
+def ready():
+    """
+    200 khi model + catalog đã load và warm-up xong (các route /recommend/ nhận request),
+    503 trước đó: orchestrator chỉ gửi traffic tới process đã sẵn sàng.
+    """
+    return JSONResponse(startup.status(), status_code=200 if startup.ready else 503)
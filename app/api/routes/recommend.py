@@ -1,12 +1,21 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+
+from app.core import recommender
+from app.core.recommender import sync_catalog, add_new_item, add_new_items, update_item, delete_item
+from app.api.services.result_cache import etag_for, etag_matches, result_key
+
+
+def require_ready():
+    # Model + catalog được load và warm-up ở nền (recommender.start): trả 503 cho tới khi xong
+    if not recommender.startup.ready:
+        raise HTTPException(status_code=503, detail=f"Service is starting ({recommender.startup.phase})",
+                            headers={"Retry-After": "5"})
 
-from app.core.recommender import model, embeddings, df
-from app.api.services.recommend_service import recommend, process_and_add_item
 
 # Tạo router FastAPI
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(require_ready)])
 
 # -------------------------------
 # Schema cho API /recommend
@@ -21,21 +30,100 @@ class QueryItem(BaseModel):
     address: str = ""
 
 @router.post("/")
-def get_recommendation(query: QueryItem, top_k: int = 10):
-    result = recommend(query.dict(), embeddings, df, model, top_k=top_k)
+def get_recommendation(query: QueryItem, request: Request, response: Response, top_k: int = 10,
+                       candidate_k: int = 100, radius_km: Optional[float] = None, category: Optional[str] = None,
+                       province: Optional[str] = None, product: Optional[str] = None,
+                       price_min: Optional[float] = None, price_max: Optional[float] = None,
+                       qty_min: Optional[float] = None, qty_max: Optional[float] = None):
+    """
+    category / province / product: chỉ trả về listing khớp (không phân biệt hoa thường)
+    price_min / price_max (đ/kg), qty_min / qty_max (kg): khoảng giá / số lượng bắt buộc
+
+    Response có ETag theo (query, tham số, version catalog); gửi lại If-None-Match sẽ nhận 304
+    cho tới khi catalog thay đổi.
+    """
+    filters = {"category": category, "province": province, "product": product,
+               "price_min": price_min, "price_max": price_max, "qty_min": qty_min, "qty_max": qty_max}
+    sync_catalog()
+    key = result_key(query.dict(), recommender.catalog.version, top_k=top_k, candidate_k=candidate_k,
+                     radius_km=radius_km, filters=filters)
+    headers = {"ETag": etag_for(key), "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        recommender.result_cache.record_not_modified()
+        return Response(status_code=304, headers=headers)
+
+    body = recommender.result_cache.get(key)
+    if body is None:
+        result = recommender.catalog.recommend(query.dict(), recommender.encoder, top_k=top_k,
+                                               candidate_k=candidate_k, radius_km=radius_km,
+                                               query_cache=recommender.query_cache, filters=filters)
+        body = {
+            "top_results": [
+                {"id": r[0], "score": r[1]}
+                for r in result
+            ]
+        }
+        recommender.result_cache.put(key, body)
+
+    response.headers.update(headers)
+    return body
+
+
+@router.post("/batch")
+def get_recommendation_batch(queries: List[QueryItem], top_k: int = 10, candidate_k: int = 100,
+                             radius_km: Optional[float] = None, category: Optional[str] = None,
+                             province: Optional[str] = None, product: Optional[str] = None,
+                             price_min: Optional[float] = None, price_max: Optional[float] = None,
+                             qty_min: Optional[float] = None, qty_max: Optional[float] = None):
+    """
+    Recommend cho nhiều query trong 1 request (1 lần encode, 1 phép nhân ma trận).
+    Kết quả trả về theo đúng thứ tự input; các filter áp dụng cho mọi query.
+    """
+    filters = {"category": category, "province": province, "product": product,
+               "price_min": price_min, "price_max": price_max, "qty_min": qty_min, "qty_max": qty_max}
+    sync_catalog()
+    results = recommender.catalog.recommend_batch([q.dict() for q in queries], recommender.encoder, top_k=top_k,
+                                                  candidate_k=candidate_k, radius_km=radius_km,
+                                                  query_cache=recommender.query_cache, filters=filters)
     return {
-        "top_results": [
-            {"id": r[0], "score": r[1]} 
-            for r in result
+        "results": [
+            {"top_results": [{"id": r[0], "score": r[1]} for r in result]}
+            for result in results
         ]
     }
 
 
+@router.get("/cache/stats")
+def get_cache_stats():
+    """Số lần hit/miss của cache vector query"""
+    return recommender.query_cache.stats()
+
+
+@router.get("/cache/result-stats")
+def get_result_cache_stats():
+    """Số lần hit/miss/304 của cache kết quả /recommend/"""
+    return recommender.result_cache.stats()
+
+
+@router.get("/encoder/stats")
+def get_encoder_stats():
+    """Số batch / số text đã encode qua micro-batcher"""
+    return recommender.encoder.stats() if hasattr(recommender.encoder, "stats") else {}
+
+
+@router.get("/catalog/stats")
+def get_catalog_stats():
+    """Bộ nhớ của catalog theo thành phần và số byte / listing, trạng thái đồng bộ của worker"""
+    sync_catalog()
+    catalog = recommender.catalog
+    return {**catalog.memory_report(), "sync": recommender.sync.stats(), "writer": recommender.writer.stats(),
+            "shards": catalog.shards.stats() if catalog.shards is not None else None}
+
+
 # -------------------------------
-# Schema cho API /add-item
+# Schema cho API /add-item, /items/{id}
 # -------------------------------
-class AddItemPayload(BaseModel):
-    id: str
+class ItemPayload(BaseModel):
     title: str
     content: str
     latitude: float
@@ -46,6 +134,9 @@ class AddItemPayload(BaseModel):
     price: str
     quantity: str
 
+class AddItemPayload(ItemPayload):
+    id: str
+
 @router.post("/add-item")
 def add_item_api(payload: AddItemPayload):
     """
@@ -63,4 +154,37 @@ def add_item_api(payload: AddItemPayload):
         "quantity": "4.779 kg"
     }
     """
-    return process_and_add_item(payload.dict(), model)
+    return add_new_item(payload.dict())
+
+
+@router.post("/add-items")
+def add_items_api(payloads: List[AddItemPayload]):
+    """
+    Thêm nhiều listing trong 1 request (cùng format với /add-item).
+    Encode theo batch; import rất lớn nên dùng: python -m app.api.services.catalog_import
+    """
+    return add_new_items([p.dict() for p in payloads])
+
+
+def _item_result(result: dict) -> dict:
+    if result["status"] == "not_found":
+        raise HTTPException(status_code=404, detail=result["message"])
+    return result
+
+
+@router.put("/items/{item_id}")
+def update_item_api(item_id: str, payload: ItemPayload):
+    """
+    Cập nhật listing (cùng format với /add-item, id lấy từ URL): bản cũ không còn được
+    recommend ngay sau khi request trả về, bản mới thay thế nó. 404 nếu không có listing này.
+    """
+    return _item_result(update_item(item_id, payload.dict()))
+
+
+@router.delete("/items/{item_id}")
+def delete_item_api(item_id: str):
+    """
+    Xoá listing (vd. đã bán hết): không còn được recommend ngay sau khi request trả về.
+    Row bị đánh tombstone, file catalog được compact ở nền. 404 nếu không có listing này.
+    """
+    return _item_result(delete_item(item_id))
@@ -0,0 +1,281 @@
+"""Nearest-neighbour indexes over the product embeddings.
+
+Two interchangeable backends expose the same `add` / `search` interface:
+
+- `ExactIndex`: brute-force cosine scan, used as the fallback and as ground truth.
+- `IVFFlatIndex`: inverted-file index (spherical k-means coarse quantizer with
+  flat vectors per list), searched by probing the `nprobe` closest lists.
+"""
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.api.services.topk import top_k_indices
+
+INDEX_FILE = Path(__file__).parent / "emb_files" / "ivf_index.npz"
+
+
+class ExactIndex:
+    """Brute-force cosine similarity over all vectors."""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = np.empty((0, vectors.shape[1]), dtype=np.float32)
+        self.add(vectors)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def add(self, vectors: np.ndarray):
+        """Appends vectors; their ids are the next row positions."""
+
+        vectors = _normalize(vectors)
+        self.vectors = np.vstack([self.vectors, vectors])
+
+    def search(self, query_vec: np.ndarray, k: int):
+        """Returns `(ids, scores)` of the `k` most similar rows, best first."""
+
+        scores = self.vectors @ _normalize(query_vec)[0]
+        ids = top_k_indices(scores, k)
+        return ids, scores[ids]
+
+
+class _InvertedList:
+    """Growable contiguous storage for the ids and vectors of one list."""
+
+    def __init__(self, dim: int, ids=None, vectors=None):
+        self.ids = np.empty(0, dtype=np.int64) if ids is None else ids
+        self.vectors = np.empty((0, dim), dtype=np.float32) if vectors is None else vectors
+        self.size = len(self.ids)
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray):
+        needed = self.size + len(ids)
+        if needed > len(self.ids):
+            self.reserve(max(needed, 2 * len(self.ids), 16) - self.size)
+
+        self.ids[self.size:needed] = ids
+        self.vectors[self.size:needed] = vectors
+        self.size = needed
+
+    def reserve(self, rows: int):
+        capacity = self.size + rows
+        if capacity > len(self.ids):
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_vecs = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+            grown_ids[:self.size] = self.ids[:self.size]
+            grown_vecs[:self.size] = self.vectors[:self.size]
+            self.ids, self.vectors = grown_ids, grown_vecs
+
+
+class IVFFlatIndex:
+    """IVF-flat index for normalized embeddings (inner product = cosine)."""
+
+    def __init__(self, centroids: np.ndarray, nprobe: int = 8):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        self.lists = [_InvertedList(self.dim) for _ in range(self.nlist)]
+        self.ntotal = 0
+
+    @property
+    def dim(self) -> int:
+        return self.centroids.shape[1]
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self):
+        return self.ntotal
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, nlist: int = None, nprobe: int = 8,
+              n_iter: int = 10, max_train: int = 100_000, seed: int = 0) -> "IVFFlatIndex":
+        """Trains the coarse quantizer on (a sample of) `vectors` and indexes them all.
+
+        nlist: number of inverted lists (default ~sqrt(N)); max_train: rows sampled for k-means
+        """
+
+        vectors = _normalize(vectors)
+        rng = np.random.default_rng(seed)
+        nlist = nlist or max(1, int(np.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+
+        train = vectors
+        if len(train) > max_train:
+            train = train[rng.choice(len(train), max_train, replace=False)]
+
+        centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = np.argmax(train @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, train)
+            counts = np.bincount(assign, minlength=nlist)
+            # Cluster rỗng giữ nguyên centroid cũ
+            filled = counts > 0
+            centroids[filled] = _normalize(sums[filled])
+
+        index = cls(centroids, nprobe=nprobe)
+        index.add(vectors)
+        return index
+
+    def add(self, vectors: np.ndarray):
+        """Appends vectors; their ids are the next row positions."""
+
+        vectors = _normalize(vectors)
+        ids = np.arange(self.ntotal, self.ntotal + len(vectors), dtype=np.int64)
+        assign = np.argmax(vectors @ self.centroids.T, axis=1)
+
+        for list_no in np.unique(assign):
+            mask = assign == list_no
+            self.lists[list_no].append(ids[mask], vectors[mask])
+        self.ntotal += len(vectors)
+
+    def reserve(self, rows: int):
+        """Makes room for `rows` more vectors, split over the lists in proportion to their size."""
+
+        for inverted in self.lists:
+            inverted.reserve(-(-inverted.size * rows // max(self.ntotal, 1)))
+
+    def search(self, query_vec: np.ndarray, k: int, nprobe: int = None):
+        """Returns `(ids, scores)` of the approximately `k` most similar rows, best first."""
+
+        query = _normalize(query_vec)[0]
+        probe = top_k_indices(self.centroids @ query, nprobe or self.nprobe)
+
+        ids = np.concatenate([self.lists[i].ids[:self.lists[i].size] for i in probe])
+        scores = np.concatenate([self.lists[i].vectors[:self.lists[i].size] @ query for i in probe])
+
+        best = top_k_indices(scores, k)
+        return ids[best], scores[best]
+
+    def save(self, path=INDEX_FILE):
+        """Writes the index as a single `.npz` file (atomic rename)."""
+
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp.npz")
+        sizes = np.array([lst.size for lst in self.lists], dtype=np.int64)
+        np.savez(
+            tmp,
+            centroids=self.centroids,
+            sizes=sizes,
+            ids=np.concatenate([lst.ids[:lst.size] for lst in self.lists]),
+            vectors=np.concatenate([lst.vectors[:lst.size] for lst in self.lists]),
+            nprobe=np.int64(self.nprobe),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=INDEX_FILE) -> "IVFFlatIndex":
+        """Reads an index written by `save`."""
+
+        with np.load(path) as data:
+            index = cls(data["centroids"], nprobe=int(data["nprobe"]))
+            offsets = np.concatenate([[0], np.cumsum(data["sizes"])])
+            ids, vectors = data["ids"], data["vectors"]
+
+        for list_no in range(index.nlist):
+            start, end = offsets[list_no], offsets[list_no + 1]
+            index.lists[list_no] = _InvertedList(index.dim, ids[start:end].copy(), vectors[start:end].copy())
+        index.ntotal = int(offsets[-1])
+        return index
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def load_or_build_index(embeddings: np.ndarray, backend: str = "exact", path=INDEX_FILE, nprobe: int = 8):
+    """Index for `backend` (None for "exact": full cosine scan), loading a saved IVF index when one exists."""
+
+    # Index đã lưu thiếu row (append sau khi lưu) thì thêm các row còn thiếu rồi lưu lại
+    if backend == "exact":
+        return None
+    if backend != "ivf":
+        raise ValueError(f"Unknown ANN backend: {backend}")
+
+    path = Path(path)
+    if not path.exists():
+        index = IVFFlatIndex.build(embeddings, nprobe=nprobe)
+        index.save(path)
+        return index
+
+    index = IVFFlatIndex.load(path)
+    index.nprobe = nprobe
+    if len(index) < len(embeddings):
+        index.add(embeddings[len(index):])
+        index.save(path)
+    elif len(index) > len(embeddings):
+        index = IVFFlatIndex.build(embeddings, nprobe=nprobe)
+        index.save(path)
+    return index
+
+
+def recall_latency_report(embeddings: np.ndarray, index, k: int = 100,
+                          n_queries: int = 200, nprobes=(1, 2, 4, 8, 16, 32), seed: int = 0) -> dict:
+    """Compares an IVF index against the exact scan.
+
+    Queries are catalog rows perturbed with noise. For every `nprobe` the
+    report gives recall@k against the exact top-k and mean/p99 latency in ms.
+    """
+
+    rng = np.random.default_rng(seed)
+    rows = embeddings[rng.choice(len(embeddings), min(n_queries, len(embeddings)), replace=False)]
+    queries = _normalize(rows + rng.normal(0, 0.05, rows.shape).astype(np.float32))
+
+    exact = ExactIndex(embeddings)
+    truth, exact_ms = [], []
+    for q in queries:
+        start = time.perf_counter()
+        ids, _ = exact.search(q, k)
+        exact_ms.append((time.perf_counter() - start) * 1000)
+        truth.append(set(ids.tolist()))
+
+    report = {
+        "rows": len(embeddings),
+        "k": k,
+        "exact": {"mean_ms": float(np.mean(exact_ms)), "p99_ms": float(np.percentile(exact_ms, 99))},
+        "ivf": [],
+    }
+    for nprobe in nprobes:
+        if nprobe > index.nlist:
+            break
+        recalls, ann_ms = [], []
+        for q, expected in zip(queries, truth):
+            start = time.perf_counter()
+            ids, _ = index.search(q, k, nprobe=nprobe)
+            ann_ms.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(expected.intersection(ids.tolist())) / max(len(expected), 1))
+        report["ivf"].append({
+            "nprobe": nprobe,
+            "recall": float(np.mean(recalls)),
+            "mean_ms": float(np.mean(ann_ms)),
+            "p99_ms": float(np.percentile(ann_ms, 99)),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    # python -m app.api.services.ann_index build|report
+    parser = argparse.ArgumentParser(description="Build the IVF index or print a recall-vs-latency report.")
+    parser.add_argument("command", choices=["build", "report"])
+    parser.add_argument("--emb-file", default=str(INDEX_FILE.parent / "semantic_vectors.npy"))
+    parser.add_argument("--index-file", default=str(INDEX_FILE))
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--k", type=int, default=100)
+    args = parser.parse_args()
+
+    emb = np.load(args.emb_file)
+    if args.command == "build":
+        ivf = IVFFlatIndex.build(emb, nlist=args.nlist)
+        ivf.save(args.index_file)
+        print(f"Saved IVF index: {len(ivf)} vectors, {ivf.nlist} lists -> {args.index_file}")
+    else:
+        ivf = IVFFlatIndex.load(args.index_file) if Path(args.index_file).exists() else IVFFlatIndex.build(emb, nlist=args.nlist)
+        print(json.dumps(recall_latency_report(emb, ivf, k=args.k), indent=2))
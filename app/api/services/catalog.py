@@ -0,0 +1,348 @@
+"""Live recommendation catalog: embeddings, metadata arrays and indexes in one object."""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from app.api.services.ann_index import INDEX_FILE, load_or_build_index
+from app.api.services.catalog_frame import CATEGORICAL_COLUMNS, DisplayColumns, compact_frame, object_nbytes, \
+    process_memory
+from app.api.services.compaction import read_tombstones
+from app.api.services.dedup_embeddings import DedupEmbeddings
+from app.api.services.filter_index import FilterIndex
+from app.api.services.geo_index import GeoGridIndex
+from app.api.services.quantization import QuantizedEmbeddings
+from app.api.services.recommend_service import (
+    META_FILE,
+    load_data,
+    normalize_rows,
+    recommend,
+    recommend_batch,
+)
+from app.api.services.rerank import grow_buffer
+from app.api.services.sharding import ShardedSearch
+
+
+class Catalog:
+    """Owns everything `recommend()` reads and applies adds / deletes in place.
+
+    shards: exact scans run in `ShardedSearch` processes (rows added once they run live only there)
+    display: compact DataFrame, display-only columns are read from disk (`DisplayColumns`)
+    """
+
+    def __init__(self, embeddings, df: pd.DataFrame, arrays, index=None, geo_index=None, store=None,
+                 display=None):
+        self._embeddings = embeddings
+        self._n_embeddings = len(embeddings)
+        self.display = display
+        self._df = compact_frame(df) if display is not None else df
+        self._pending_rows = []
+        self.arrays = arrays
+        self.index = index
+        self.geo_index = geo_index if geo_index is not None else GeoGridIndex.from_arrays(
+            arrays.latitude, arrays.longitude
+        )
+        self.filter_index = FilterIndex.from_dataframe(df)
+        self.store = store
+        self.shards = None
+        # Tombstone theo row (True = đã xoá), có capacity dư như arrays
+        self._deleted = np.zeros(len(arrays), dtype=bool)
+        self.n_deleted = 0
+        # Hash của id theo row, dựng ở lần tìm row theo id đầu tiên
+        self._id_hashes = None
+        # Tăng sau mỗi thay đổi của catalog; là 1 phần key của ResultCache
+        self.version = 0
+        # Tham số của Catalog.load, để reload sau compaction
+        self.load_args = None
+        self._swaps = 0
+        # Writer giữ lock này; reader không khoá: mỗi cấu trúc chỉ công bố row mới sau khi ghi xong
+        # (tombstone, arrays, embeddings, ANN, geo, filter). Query lấy ma trận embeddings 1 lần, index
+        # vẫn có thể lớn thêm nên semantic_candidates bỏ các row ngoài ma trận đó
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, storage: str = "dense", store=None, ann_backend: str = "exact", nprobe: int = 8,
+             index_file=INDEX_FILE, compact: bool = True, shards: int = 0, **kwargs) -> "Catalog":
+        """Loads the catalog from disk (see `load_data`) and builds its indexes.
+
+        compact: keep a compact DataFrame and serve display columns from disk
+        shards: split exact scans across this many processes (0 / 1 = in process);
+                only for dense storage with the "exact" ANN backend
+        """
+
+        load_args = dict(storage=storage, store=store, ann_backend=ann_backend, nprobe=nprobe,
+                         index_file=index_file, compact=compact, shards=shards, **kwargs)
+        meta_file = kwargs.get("meta_file", META_FILE)
+        if shards > 1 and storage == "dense" and ann_backend == "exact":
+            # Vector nằm ở các shard: coordinator chỉ giữ memory map (page cache dùng chung)
+            kwargs = {**kwargs, "mmap": True}
+        embeddings, df, arrays = load_data(storage=storage, store=store, **kwargs)
+        index = load_or_build_index(embeddings, ann_backend, path=index_file, nprobe=nprobe)
+        display = None
+        if compact:
+            try:
+                display = DisplayColumns.load_or_build(df, meta_file)
+            except OSError as e:
+                print(f"⚠️ Không ghi được display columns, giữ DataFrame đầy đủ: {e}")
+        catalog = cls(embeddings, df, arrays, index=index, store=store, display=display)
+        catalog.load_args = load_args
+        dead = read_tombstones(meta_file)
+        if len(dead):
+            catalog.delete_rows(dead, version=catalog.version)
+        if shards > 1:
+            if index is None and storage == "dense":
+                catalog.shards = ShardedSearch(shards)
+            else:
+                print(f"⚠️ Sharded search chỉ dùng với storage dense + ANN exact, bỏ qua shards={shards}")
+        return catalog
+
+    def __len__(self):
+        return len(self.arrays)
+
+    @property
+    def embeddings(self):
+        """Embedding matrix (or DedupEmbeddings / QuantizedEmbeddings) of the current rows
+        (with running shards: of the rows loaded before they started)."""
+
+        if isinstance(self._embeddings, (DedupEmbeddings, QuantizedEmbeddings)):
+            return self._embeddings
+        return self._embeddings[:self._n_embeddings]
+
+    @property
+    def deleted(self):
+        """Tombstone bitmap (at least one entry per row), or None when no row is deleted."""
+
+        return self._deleted if self.n_deleted else None
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """Metadata DataFrame; rows added since the last read are concatenated lazily."""
+
+        if self._pending_rows:
+            with self._write_lock:
+                if self._pending_rows:
+                    df = pd.concat([self._df] + self._pending_rows, ignore_index=True)
+                    if self.display is not None:
+                        # concat các categorical khác categories trả về object
+                        for name in CATEGORICAL_COLUMNS:
+                            df[name] = df[name].astype("category")
+                    self._df = df
+                    self._pending_rows = []
+        return self._df
+
+    # -----------------------------
+    # Ghi
+    # -----------------------------
+    def add(self, rows: pd.DataFrame, embeddings: np.ndarray, version: int = None):
+        """Applies preprocessed rows and their normalized embeddings in memory.
+
+        version: new catalog version (default: current + 1); set by `CatalogSync`
+        so all workers agree on it
+        """
+
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        with self._write_lock:
+            needed = len(self.arrays) + len(rows)
+            if needed > len(self._deleted):
+                deleted = np.zeros(max(16, needed, 2 * len(self._deleted)), dtype=bool)
+                deleted[:len(self._deleted)] = self._deleted
+                self._deleted = deleted
+            if self._id_hashes is not None:
+                if needed > len(self._id_hashes):
+                    self._id_hashes = grow_buffer(self._id_hashes, len(self.arrays), len(self._deleted))
+                self._id_hashes[len(self.arrays):needed] = hash_ids(rows["id"])
+            self.arrays.append_dataframe(rows)
+
+            if isinstance(self._embeddings, DedupEmbeddings):
+                for text, vector in zip(rows["semantic_text"], embeddings):
+                    self._embeddings.add(text, vector)
+            elif isinstance(self._embeddings, QuantizedEmbeddings):
+                self._embeddings.append(embeddings)
+            else:
+                embeddings = normalize_rows(embeddings)
+                # Shard đang chạy giữ row mới: không copy memory map của coordinator vào RAM
+                if self.shards is None or not self.shards.running:
+                    needed = self._n_embeddings + len(embeddings)
+                    # Memory map chỉ đọc được copy vào RAM ở lần add đầu tiên
+                    if needed > len(self._embeddings) or not self._embeddings.flags.writeable:
+                        capacity = max(16, needed, 2 * self._n_embeddings)
+                        self._embeddings = grow_buffer(self._embeddings, self._n_embeddings, capacity)
+                    self._embeddings[self._n_embeddings:needed] = embeddings
+                    self._n_embeddings = needed
+
+            if self.index is not None:
+                self.index.add(embeddings)
+            self.geo_index.add(rows["latitude"].to_numpy(), rows["longitude"].to_numpy())
+            self.filter_index.add(rows)
+            if self.shards is not None and self.shards.running:
+                self.shards.add(rows, embeddings)
+            if self.display is not None:
+                self.display.append(rows)
+                rows = compact_frame(rows)
+            self._pending_rows.append(rows)
+            self.version = self.version + 1 if version is None else version
+
+    def reserve(self, rows: int):
+        """Makes room for `rows` more listings in every growable structure."""
+
+        # Gọi ở master trước khi fork: row dư chưa chạm tới nên các worker vẫn dùng chung copy-on-write,
+        # memory map và hash id cũng chỉ copy / dựng 1 lần ở đây
+        with self._write_lock:
+            n = len(self.arrays)
+            capacity = n + rows
+            if capacity > len(self._deleted):
+                deleted = np.zeros(capacity, dtype=bool)
+                deleted[:n] = self._deleted[:n]
+                self._deleted = deleted
+            hashes = np.empty(len(self._deleted), dtype=np.uint64)
+            hashes[:n] = self._id_hashes[:n] if self._id_hashes is not None else hash_ids(self.arrays.ids)
+            self._id_hashes = hashes
+            self.arrays.reserve(rows)
+
+            if isinstance(self._embeddings, (DedupEmbeddings, QuantizedEmbeddings)):
+                self._embeddings.reserve(rows)
+            elif self.shards is None and (self._n_embeddings + rows > len(self._embeddings)
+                                          or not self._embeddings.flags.writeable):
+                capacity = max(self._n_embeddings + rows, len(self._embeddings))
+                self._embeddings = grow_buffer(self._embeddings, self._n_embeddings, capacity)
+
+            if self.index is not None:
+                self.index.reserve(rows)
+            self.geo_index.reserve(rows)
+            self.filter_index.reserve(rows)
+
+    def delete_rows(self, rows, version: int = None):
+        """Tombstones row positions: they are skipped from the next query on.
+
+        version: new catalog version (default: current + 1), as in `add`
+        """
+
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        with self._write_lock:
+            rows = rows[(rows >= 0) & (rows < len(self.arrays))]
+            rows = rows[~self._deleted[rows]]
+            self._deleted[rows] = True
+            self.n_deleted += len(rows)
+            if self.shards is not None and self.shards.running and len(rows):
+                self.shards.delete(rows)
+            self.version = self.version + 1 if version is None else version
+
+    def rows_of(self, ids) -> dict:
+        """str(id) -> live row positions of each id."""
+
+        keys = [str(i) for i in ids]
+        with self._write_lock:
+            n = len(self.arrays)
+            if self._id_hashes is None:
+                self._id_hashes = np.empty(len(self._deleted), dtype=np.uint64)
+                self._id_hashes[:n] = hash_ids(self.arrays.ids)
+            hashes = self._id_hashes[:n]
+            result = {}
+            for key, value in zip(keys, hash_ids(keys)):
+                # So hash trên cả catalog (vector hoá), rồi so id thật của vài row trùng hash
+                rows = np.flatnonzero(hashes == value)
+                result[key] = [int(r) for r in rows if not self._deleted[r] and str(self.arrays.ids[r]) == key]
+            return result
+
+    def reload(self, version: int = None):
+        """Loads the catalog files again (after a compaction renumbered the rows) and swaps the new state in.
+
+        Queries already running finish on the old state.
+        """
+
+        if self.load_args is None:
+            raise RuntimeError("Only a catalog created by Catalog.load can be reloaded")
+        if self.store is not None:
+            self.store.refresh()
+        fresh = Catalog.load(**self.load_args)
+        old_shards = self.shards
+        state = {k: v for k, v in vars(fresh).items() if k not in ("version", "load_args", "_swaps", "_write_lock")}
+        with self._write_lock:
+            # Số lẻ trong lúc thay: _view đọc lại
+            self._swaps += 1
+            self.__dict__.update(state)
+            self._swaps += 1
+            self.version = self.version + 1 if version is None else version
+        if old_shards is not None:
+            old_shards.close()
+
+    # -----------------------------
+    # Đọc
+    # -----------------------------
+    def memory_report(self) -> dict:
+        """Resident / memory-mapped bytes of each component, resident bytes per listing and the RSS of
+        this process (shared / private)."""
+
+        components = {
+            "embeddings": self._embeddings,
+            "arrays": self.arrays,
+            "dataframe": [self._df] + self._pending_rows,
+            "display_columns": self.display,
+            "ann_index": self.index,
+            "geo_index": self.geo_index,
+            "filter_index": self.filter_index,
+            "tombstones": [self._deleted, self._id_hashes],
+        }
+        report = {}
+        for name, obj in components.items():
+            resident, mapped = object_nbytes(obj) if obj is not None else (0, 0)
+            report[name] = {"resident_bytes": resident, "mapped_bytes": mapped}
+
+        rows = max(len(self), 1)
+        resident_total = sum(c["resident_bytes"] for c in report.values())
+        return {
+            "rows": len(self),
+            "deleted_rows": self.n_deleted,
+            "components": report,
+            "resident_bytes": resident_total,
+            "bytes_per_listing": resident_total / rows,
+            "embeddings_share": report["embeddings"]["resident_bytes"] / max(resident_total, 1),
+            # RAM thật của process (gồm model, ...): private_bytes là phần riêng của worker này
+            "process": process_memory(),
+        }
+
+    def _sharded(self) -> ShardedSearch:
+        """The running shards of this process (started here on first use), or None."""
+
+        if self.shards is None or self.shards.running:
+            return self.shards
+        with self._write_lock:
+            if not self.shards.running:
+                self.shards.start(self._embeddings[:self._n_embeddings], self.arrays,
+                                  [self._df] + self._pending_rows,
+                                  deleted=np.flatnonzero(self._deleted[:len(self.arrays)]))
+        return self.shards
+
+    def _view(self) -> dict:
+        """Structures `recommend()` reads, all from the same catalog state."""
+
+        while True:
+            swaps = self._swaps
+            if swaps % 2 == 0:
+                view = {"embeddings": self.embeddings, "arrays": self.arrays, "index": self.index,
+                        "geo_index": self.geo_index, "filter_index": self.filter_index, "deleted": self.deleted}
+                if swaps == self._swaps:
+                    return view
+
+    def recommend(self, query: dict, model, **kwargs):
+        """`recommend()` over the live catalog."""
+
+        if self._sharded() is not None:
+            return self.shards.recommend(query, model, **kwargs)
+        view = self._view()
+        return recommend(query, view.pop("embeddings"), None, model, **view, **kwargs)
+
+    def recommend_batch(self, queries, model, **kwargs):
+        """`recommend_batch()` over the live catalog."""
+
+        if self._sharded() is not None:
+            return self.shards.recommend_batch(queries, model, **kwargs)
+        view = self._view()
+        return recommend_batch(queries, view.pop("embeddings"), None, model, **view, **kwargs)
+
+
+def hash_ids(ids) -> np.ndarray:
+    """64-bit hash of str(id) per listing."""
+
+    return pd.util.hash_array(np.array([str(i) for i in ids], dtype=object))
@@ -0,0 +1,199 @@
+"""Compact in-memory representation of the catalog metadata.
+
+`recommend()` only reads ids, the numeric columns and coordinates (through
+`CatalogArrays`), so the DataFrame kept by `Catalog` does not need the
+display-only text columns as Python strings. `compact_frame` keeps ids,
+categorical `categoryName` / `productName` / `province` and float32 numeric
+columns. `DisplayColumns` serves `address`, `price`, `quantity` and
+`semantic_text` from UTF-8 blobs memory-mapped from disk.
+"""
+
+import json
+import mmap
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CATEGORICAL_COLUMNS = ["categoryName", "productName", "province"]
+FLOAT_COLUMNS = ["price_num", "quantity_num", "latitude", "longitude"]
+DISPLAY_COLUMNS = ["address", "price", "quantity", "semantic_text"]
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Drops display columns and converts the rest to categorical / float32 dtypes."""
+
+    out = pd.DataFrame({"id": df["id"].to_numpy(dtype=object)})
+    for name in CATEGORICAL_COLUMNS:
+        if name in df:
+            out[name] = df[name].fillna("").astype("category")
+    for name in FLOAT_COLUMNS:
+        if name in df:
+            out[name] = df[name].to_numpy(dtype=np.float32, na_value=np.nan)
+    return out
+
+
+def display_prefix(meta_file) -> Path:
+    """Default location of the display column files: next to the metadata CSV."""
+
+    return Path(str(meta_file) + ".display")
+
+
+class DisplayColumns:
+    """Display-only text columns stored on disk and looked up by row.
+
+    Each column is one UTF-8 blob (`<prefix>.<column>.bin`) plus an int64
+    offsets array (`<prefix>.<column>.offsets.npy`), both memory-mapped, so
+    `value` reads only the requested row. Rows added while serving are kept
+    in RAM until the files are rebuilt at the next start.
+    """
+
+    def __init__(self, offsets: dict, blobs: dict, n_rows: int):
+        self.offsets = offsets
+        self.blobs = blobs
+        self.n_rows = n_rows
+        self._tail = {name: [] for name in DISPLAY_COLUMNS}
+
+    def __len__(self):
+        return self.n_rows + len(self._tail[DISPLAY_COLUMNS[0]])
+
+    # -----------------------------
+    # Lưu / load
+    # -----------------------------
+    @staticmethod
+    def paths(prefix, name: str):
+        prefix = str(prefix)
+        return Path(f"{prefix}.{name}.bin"), Path(f"{prefix}.{name}.offsets.npy")
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, prefix, meta_file=None) -> "DisplayColumns":
+        """Writes the display columns of `df`; `meta_file` is recorded to detect staleness."""
+
+        for name in DISPLAY_COLUMNS:
+            encoded = df[name].fillna("").astype(str).str.encode("utf-8")
+            offsets = np.zeros(len(df) + 1, dtype=np.int64)
+            np.cumsum(encoded.str.len().to_numpy(dtype=np.int64), out=offsets[1:])
+            blob_path, offsets_path = cls.paths(prefix, name)
+            with open(blob_path, "wb") as f:
+                f.write(b"".join(encoded))
+            np.save(offsets_path, offsets)
+
+        header = {"rows": len(df)}
+        if meta_file is not None:
+            stat = os.stat(meta_file)
+            header.update(source_size=stat.st_size, source_mtime_ns=stat.st_mtime_ns)
+        tmp = Path(f"{prefix}.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(header, f)
+        # Header ghi sau cùng: thiếu header nghĩa là bộ file chưa hoàn chỉnh
+        os.replace(tmp, f"{prefix}.json")
+        return cls.open(prefix)
+
+    @classmethod
+    def open(cls, prefix, meta_file=None, n_rows: int = None):
+        """Memory-maps the column files; returns None if missing or built from another CSV / row count."""
+
+        try:
+            with open(f"{prefix}.json") as f:
+                header = json.load(f)
+            if n_rows is not None and header["rows"] != n_rows:
+                return None
+            if meta_file is not None:
+                stat = os.stat(meta_file)
+                if (header.get("source_size"), header.get("source_mtime_ns")) != (stat.st_size, stat.st_mtime_ns):
+                    return None
+
+            offsets, blobs = {}, {}
+            for name in DISPLAY_COLUMNS:
+                blob_path, offsets_path = cls.paths(prefix, name)
+                offsets[name] = np.load(offsets_path, mmap_mode="r")
+                # np.memmap không mở được file rỗng
+                blobs[name] = (np.memmap(blob_path, dtype=np.uint8, mode="r")
+                               if os.path.getsize(blob_path) else np.empty(0, dtype=np.uint8))
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(offsets, blobs, header["rows"])
+
+    @classmethod
+    def load_or_build(cls, df: pd.DataFrame, meta_file, prefix=None) -> "DisplayColumns":
+        prefix = prefix or display_prefix(meta_file)
+        columns = cls.open(prefix, meta_file, n_rows=len(df))
+        return columns if columns is not None else cls.build(df, prefix, meta_file)
+
+    # -----------------------------
+    # Ghi / đọc
+    # -----------------------------
+    def append(self, df: pd.DataFrame):
+        """Keeps the display columns of added rows in RAM."""
+
+        for name in DISPLAY_COLUMNS:
+            self._tail[name].extend(df[name].fillna("").astype(str).tolist())
+
+    def value(self, name: str, row: int) -> str:
+        if row >= self.n_rows:
+            return self._tail[name][row - self.n_rows]
+        start, end = self.offsets[name][row], self.offsets[name][row + 1]
+        return self.blobs[name][start:end].tobytes().decode("utf-8")
+
+
+# -----------------------------
+# Đo bộ nhớ
+# -----------------------------
+def object_nbytes(obj, _seen=None):
+    """(resident, mapped) bytes of the NumPy arrays and Python containers reachable from `obj`.
+
+    Memory-mapped arrays are counted as mapped (shared page cache), not as
+    resident memory of the worker.
+    """
+
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0, 0
+    seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        # memmap.astype() / np.memmap trả về từ phép tính là np.memmap không có file: chỉ tính là map
+        # khi chuỗi base dẫn tới 1 mapping thật (_mmap của memmap, hoặc mmap.mmap)
+        base = obj
+        while isinstance(base, np.ndarray) and getattr(base, "_mmap", None) is None and base.base is not None:
+            base = base.base
+        if getattr(base, "_mmap", None) is not None or isinstance(base, mmap.mmap):
+            return 0, obj.nbytes
+        resident = obj.nbytes
+        if obj.dtype == object:
+            resident += sum(sys.getsizeof(v) for v in obj.ravel() if v is not None)
+        return resident, 0
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum()), 0
+    if isinstance(obj, (list, tuple, set)):
+        parts = [object_nbytes(v, seen) for v in obj]
+        return sys.getsizeof(obj) + sum(p[0] for p in parts), sum(p[1] for p in parts)
+    if isinstance(obj, dict):
+        parts = [object_nbytes(v, seen) for item in obj.items() for v in item]
+        return sys.getsizeof(obj) + sum(p[0] for p in parts), sum(p[1] for p in parts)
+    if hasattr(obj, "__dict__") and not isinstance(obj, type):
+        return object_nbytes(vars(obj), seen)
+    return sys.getsizeof(obj), 0
+
+
+def process_memory() -> dict:
+    """RSS of this process split into pages shared with other processes and private ones (Linux).
+
+    After a pre-fork server forks its workers, `private_bytes` is what each
+    worker costs on its own; an empty dict where /proc is not available.
+    """
+
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f.read().splitlines()[1:])
+    except OSError:
+        return {}
+    kb = {name: int(value.split()[0]) * 1024 for name, value in fields.items()}
+    return {
+        "rss_bytes": kb.get("Rss", 0),
+        "pss_bytes": kb.get("Pss", 0),
+        "shared_bytes": kb.get("Shared_Clean", 0) + kb.get("Shared_Dirty", 0),
+        "private_bytes": kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0),
+    }
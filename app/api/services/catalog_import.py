@@ -0,0 +1,224 @@
+"""Offline bulk import / rebuild of the recommendation catalog.
+
+Streams a CSV or JSONL file of listings through the same preprocessing as
+`process_and_add_item`, encodes the semantic texts in large batches across a
+process pool and writes a consistent `semantic_vectors.npy` + metadata CSV
+(and the segmented embedding store, when one is configured).
+
+    python -m app.api.services.catalog_import listings.jsonl --append
+    python -m app.api.services.catalog_import app/api/services/emb_files/product_metadata_nopro.csv  # re-embed
+"""
+
+import argparse
+import csv
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.api.services.ann_index import INDEX_FILE
+from app.api.services.catalog_sync import catalog_lock, publish_version
+from app.api.services.compaction import derived_files
+from app.api.services.dedup_embeddings import DEDUP_FILE
+from app.api.services.embedding_store import SegmentedEmbeddingStore
+from app.api.services.ingestion import IngestionWriter
+from app.api.services.recommend_service import EMB_DIR, META_COLUMNS, preprocess_items
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+_worker_model = None
+
+
+def read_listings(path, chunksize: int = 10_000):
+    """Yields raw listing DataFrames of at most `chunksize` rows from a CSV or JSONL file."""
+
+    path = Path(path)
+    if path.suffix in (".jsonl", ".ndjson", ".json"):
+        reader = pd.read_json(path, lines=True, chunksize=chunksize, dtype={"id": str})
+    else:
+        reader = pd.read_csv(path, quotechar='"', chunksize=chunksize, dtype={"id": str})
+    for chunk in reader:
+        yield chunk
+
+
+def _init_worker(model_name: str):
+    global _worker_model
+    from sentence_transformers import SentenceTransformer
+
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode_in_worker(args):
+    texts, batch_size = args
+    return _worker_model.encode(texts, batch_size=batch_size, normalize_embeddings=True).astype(np.float32)
+
+
+class BatchEncoder:
+    """Encodes texts in large batches, in-process or across a process pool.
+
+    Each pool worker loads its own copy of the model once, then receives
+    slices of `chunk_size` texts.
+    """
+
+    def __init__(self, model=None, model_name: str = MODEL_NAME, workers: int = 1,
+                 batch_size: int = 256, chunk_size: int = 4096):
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.model = model
+        self.pool = None
+        if workers > 1:
+            self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_name,))
+        elif model is None:
+            from sentence_transformers import SentenceTransformer
+
+            self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts) -> np.ndarray:
+        texts = list(texts)
+        if self.pool is None:
+            return self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True).astype(np.float32)
+
+        jobs = [(texts[i:i + self.chunk_size], self.batch_size) for i in range(0, len(texts), self.chunk_size)]
+        return np.concatenate(list(self.pool.map(_encode_in_worker, jobs)))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def import_listings(source, encoder: BatchEncoder, emb_file=EMB_DIR / "semantic_vectors.npy",
+                    meta_file=EMB_DIR / "product_metadata_nopro.csv", append: bool = False,
+                    chunksize: int = 10_000, store=None, index_file=INDEX_FILE, dedup_file=DEDUP_FILE) -> dict:
+    """Imports `source` into the catalog files.
+
+    With `append=False` the catalog is rebuilt from `source` only (e.g. to
+    re-embed after a model change); otherwise the new rows are added after
+    the existing ones. Output is written to temporary files and swapped in
+    with `os.replace` only after every chunk succeeded, so a failed import
+    leaves the catalog files untouched. With a `SegmentedEmbeddingStore` the
+    vectors are written into one new segment that replaces the store's
+    segments, then exported to `emb_file` so both hold the same rows. Files
+    derived from the vectors and only checked by their row count (IVF index,
+    dedup and quantized files) are deleted and rebuilt by the next `Catalog.load`.
+
+    The import holds the exclusive catalog lock (writes of a running service
+    wait for it) and refuses to run while the ingestion log has records
+    `recover` has not applied yet. Afterwards the checkpoint is moved to the
+    new files (a rebuild also drops the tombstones of the old rows) and the
+    shared version is bumped, so running workers reload the catalog.
+    """
+
+    with catalog_lock(meta_file, exclusive=True):
+        writer = IngestionWriter(None, meta_file=meta_file, emb_file=emb_file, store=store)
+        if writer.pending() or writer.marker_file.exists():
+            raise RuntimeError(f"{meta_file} has writes not recovered yet: start the service once "
+                               f"(IngestionWriter.recover) before importing")
+        result = _write_files(source, encoder, emb_file, meta_file, append, chunksize, store)
+        # Cùng số row với file mới (re-embed): không được dùng lại vector cũ
+        for path in derived_files(emb_file, index_file, dedup_file):
+            Path(path).unlink(missing_ok=True)
+        checkpoint = writer.adopt_files(rewritten=not append)
+        publish_version(meta_file, checkpoint["seq"])
+    return result
+
+
+def _write_files(source, encoder: BatchEncoder, emb_file, meta_file, append: bool, chunksize: int,
+                 store=None) -> dict:
+    """Writes the new catalog files next to the old ones and swaps them in."""
+
+    emb_file, meta_file = Path(emb_file), Path(meta_file)
+    tmp_meta = meta_file.with_name(meta_file.name + ".import.tmp")
+    tmp_raw = emb_file.with_name(emb_file.name + ".import.raw")
+    tmp_emb = emb_file.with_name(emb_file.name + ".import.tmp.npy")
+
+    start = time.perf_counter()
+    n_rows, dim = 0, None
+
+    with open(tmp_raw, "wb") as raw:
+        if append and (store is not None or emb_file.exists()):
+            if store is not None:
+                n_rows, dim, read = len(store), store.dim, store.read
+            else:
+                existing = np.load(emb_file, mmap_mode="r")
+                (n_rows, dim), read = existing.shape, lambda start, stop: existing[start:stop]
+            for i in range(0, n_rows, 65536):
+                raw.write(np.ascontiguousarray(read(i, i + 65536), dtype=np.float32).tobytes())
+
+        if append and meta_file.exists():
+            existing_rows = sum(
+                len(c) for c in pd.read_csv(meta_file, quotechar='"', chunksize=chunksize, usecols=["id"])
+            )
+            if existing_rows != n_rows:
+                raise ValueError(f"Catalog mismatch: {existing_rows} metadata rows vs {n_rows} vectors")
+            shutil.copyfile(meta_file, tmp_meta)
+        else:
+            pd.DataFrame(columns=META_COLUMNS).to_csv(tmp_meta, index=False, quoting=csv.QUOTE_ALL)
+
+        for chunk in read_listings(source, chunksize=chunksize):
+            df = preprocess_items(chunk)
+            vectors = encoder.encode(df["semantic_text"].tolist())
+            dim = vectors.shape[1]
+            # Ghi vectors trước rồi mới ghi metadata của cùng chunk
+            raw.write(vectors.tobytes())
+            df.to_csv(tmp_meta, mode="a", header=False, index=False, quoting=csv.QUOTE_ALL)
+            n_rows += len(df)
+
+    dim = dim or 384
+    if store is not None:
+        segment, out = store.new_segment(n_rows, dim)
+    else:
+        out = np.lib.format.open_memmap(tmp_emb, mode="w+", dtype=np.float32, shape=(n_rows, dim))
+    raw_view = np.memmap(tmp_raw, dtype=np.float32, mode="r", shape=(n_rows, dim)) if n_rows else None
+    for i in range(0, n_rows, 65536):
+        out[i:i + 65536] = raw_view[i:i + 65536]
+    out.flush()
+    del out, raw_view
+    os.remove(tmp_raw)
+
+    if store is not None:
+        store.adopt(segment)
+        # Các CLI khác (ann_index, quantization, benchmarks) đọc thẳng semantic_vectors.npy
+        store.export(emb_file)
+    else:
+        os.replace(tmp_emb, emb_file)
+    os.replace(tmp_meta, meta_file)
+    return {"rows": n_rows, "dim": dim, "seconds": time.perf_counter() - start}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import or re-embed catalog listings (CSV / JSONL).")
+    parser.add_argument("source", help="CSV hoặc JSONL listing với các field giống /recommend/add-item")
+    parser.add_argument("--append", action="store_true", help="Thêm vào catalog hiện có thay vì dựng lại")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--chunksize", type=int, default=10_000)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--emb-file", default=str(EMB_DIR / "semantic_vectors.npy"))
+    parser.add_argument("--meta-file", default=str(EMB_DIR / "product_metadata_nopro.csv"))
+    parser.add_argument("--store-dir", default=None,
+                        help="Thư mục SegmentedEmbeddingStore (mặc định EMBEDDING_STORE_DIR, \"\" = ghi vào --emb-file)")
+    parser.add_argument("--index-file", default=str(INDEX_FILE))
+    parser.add_argument("--dedup-file", default=str(DEDUP_FILE))
+    args = parser.parse_args()
+
+    if args.store_dir is None:
+        from app.core.config import EMBEDDING_STORE_DIR
+
+        args.store_dir = EMBEDDING_STORE_DIR
+    embedding_store = (
+        SegmentedEmbeddingStore.open(args.store_dir, seed_file=args.emb_file if args.append else None)
+        if args.store_dir else None
+    )
+
+    batch_encoder = BatchEncoder(model_name=args.model, workers=args.workers, batch_size=args.batch_size)
+    try:
+        result = import_listings(args.source, batch_encoder, emb_file=args.emb_file, meta_file=args.meta_file,
+                                 append=args.append, chunksize=args.chunksize, store=embedding_store,
+                                 index_file=args.index_file, dedup_file=args.dedup_file)
+    finally:
+        batch_encoder.close()
+    print(f"Imported {result['rows']} rows (dim={result['dim']}) in {result['seconds']:.1f}s")
@@ -0,0 +1,116 @@
+"""Binary columnar snapshot of the preprocessed catalog metadata.
+
+`load_data` parses the metadata CSV and derives `province`, `price_num`,
+`quantity_num`, ... row by row. The snapshot stores those derived columns as
+`.npz` arrays so a restart only has to read them back, with the dtypes and
+missing values `read_csv` gave them (a numeric `id` stays numeric). A snapshot is used
+only when its format version matches, its column checksums verify and it
+was built from the current CSV (same size and mtime, or same SHA-256).
+"""
+
+import hashlib
+import json
+import os
+import zlib
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Tăng khi đổi cách tiền xử lý (vd. parser giá / số lượng) để snapshot cũ bị dựng lại
+SNAPSHOT_VERSION = 3
+
+NUMERIC_COLUMNS = ["latitude", "longitude", "price_num", "quantity_num"]
+
+
+def snapshot_path(meta_file) -> Path:
+    """Default snapshot location: next to the metadata CSV."""
+
+    return Path(str(meta_file) + ".snapshot.npz")
+
+
+def _file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _columns_crc(columns: dict) -> int:
+    crc = 0
+    for name in sorted(columns):
+        crc = zlib.crc32(np.ascontiguousarray(columns[name]).tobytes(), crc)
+    return crc
+
+
+def save_snapshot(df: pd.DataFrame, meta_file, path=None):
+    """Writes the preprocessed `df` as a snapshot of `meta_file` (atomic rename)."""
+
+    path = Path(path or snapshot_path(meta_file))
+    columns, nulls = {}, []
+    for name in df.columns:
+        if name in NUMERIC_COLUMNS:
+            columns[name] = df[name].to_numpy(dtype=np.float64, na_value=np.nan)
+        elif pd.api.types.is_numeric_dtype(df[name]) or pd.api.types.is_bool_dtype(df[name]):
+            columns[name] = df[name].to_numpy()
+        else:
+            # Cột chuỗi lưu dạng unicode array (NaN -> "" + mask) để không cần pickle
+            missing = df[name].isna().to_numpy()
+            columns[name] = df[name].fillna("").astype(str).to_numpy(dtype=str)
+            if missing.any():
+                columns[name + ".isna"] = missing
+                nulls.append(name)
+
+    stat = os.stat(meta_file)
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "columns": list(df.columns),
+        "dtypes": {name: str(df[name].dtype) for name in df.columns},
+        "nulls": nulls,
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "source_sha256": _file_sha256(meta_file),
+        "crc32": _columns_crc(columns),
+    }
+
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez(tmp, __header__=np.array(json.dumps(header)), **columns)
+    os.replace(tmp, path)
+
+
+def load_snapshot(meta_file, path=None):
+    """Returns the snapshot DataFrame of `meta_file`, or None if missing, stale or corrupt."""
+
+    path = Path(path or snapshot_path(meta_file))
+    if not path.exists() or not os.path.exists(meta_file):
+        return None
+
+    try:
+        with np.load(path) as data:
+            header = json.loads(str(data["__header__"]))
+            if header.get("version") != SNAPSHOT_VERSION:
+                return None
+
+            stat = os.stat(meta_file)
+            same_file = (stat.st_size == header["source_size"]
+                         and stat.st_mtime_ns == header["source_mtime_ns"])
+            if not same_file and (stat.st_size != header["source_size"]
+                                  or _file_sha256(meta_file) != header["source_sha256"]):
+                return None
+
+            columns = {name: data[name] for name in header["columns"]}
+            columns.update({name + ".isna": data[name + ".isna"] for name in header["nulls"]})
+    except (OSError, ValueError, KeyError, zlib.error, zipfile.BadZipFile):
+        return None
+
+    if _columns_crc(columns) != header["crc32"]:
+        return None
+    df = pd.DataFrame({name: columns[name] for name in header["columns"]}, columns=header["columns"])
+    try:
+        for name in header["nulls"]:
+            df[name] = df[name].astype(object).mask(columns[name + ".isna"])
+        return df.astype(header["dtypes"])
+    except (TypeError, ValueError):
+        return None
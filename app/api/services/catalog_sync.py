@@ -0,0 +1,241 @@
+"""Keeps the catalog of every server worker in step with the catalog files."""
+
+import io
+import json
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.api.services.compaction import read_tombstones
+from app.api.services.ingestion import wal_paths
+from app.api.services.recommend_service import META_COLUMNS
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ chạy 1 process, không cần khoá file
+    fcntl = None
+
+TEXT_COLUMNS = ["categoryName", "productName", "price", "quantity", "address", "province", "semantic_text"]
+
+
+def sync_paths(meta_file):
+    """(lock, version) files of a metadata CSV."""
+
+    return Path(str(meta_file) + ".lock"), Path(str(meta_file) + ".version")
+
+
+@contextmanager
+def catalog_lock(meta_file, exclusive: bool = False):
+    """Cross-process lock of the catalog files of `meta_file`.
+
+    Every call opens its own file description, so the lock works across
+    forked workers and between threads of one process alike.
+    """
+
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(sync_paths(meta_file)[0], os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+    finally:
+        os.close(fd)
+
+
+def publish_version(meta_file, value: int):
+    """Sets the version counter the workers of `meta_file` check before each request."""
+
+    path = sync_paths(meta_file)[1]
+    with open(path, "r+b" if path.exists() else "wb") as f:
+        f.write(struct.pack("<q", value))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class CatalogSync:
+    """Version handshake between processes serving the same catalog files.
+
+    Each worker owns a `Catalog` (shared copy-on-write with the parent when the
+    app is preloaded, see `gunicorn.conf.py`) but any worker may commit new
+    listings. The files are the source of truth:
+
+    - a lock file (`fcntl.flock`) is held exclusively while a group is
+      committed or the log is recovered and shared while rows are read;
+    - an 8-byte counter file, memory-mapped `MAP_SHARED` by every process,
+      holds the sequence number of the last commit.
+
+    `maybe_sync` is called before each request: one read of the counter, and
+    only when it moved are the rows committed since this worker last synced
+    read from the end of the CSV (from the byte offset it stopped at) and the
+    embedding files, and applied with `Catalog.add`; new tombstone entries
+    are applied with `Catalog.delete_rows`. After a compaction or an import
+    (the checkpoint `generation` changed) the catalog is reloaded instead, by
+    a background thread while requests keep reading the old state. The
+    catalog version is set to the commit sequence number, so every worker
+    computes the same ETag for the same catalog state.
+    """
+
+    def __init__(self, catalog, meta_file, emb_file, store=None):
+        self.catalog = catalog
+        self.meta_file = Path(meta_file)
+        self.emb_file = Path(emb_file)
+        self.store = store
+        if store is not None:
+            # Compaction chạy ngay trong lần append đang giữ lock, không để thread nền xoá segment
+            # trong lúc worker khác đang đọc
+            store.background_compaction = False
+        self.checkpoint_file = wal_paths(meta_file)[1]
+        self.version_file = sync_paths(meta_file)[1]
+
+        if not self.version_file.exists() or os.path.getsize(self.version_file) < 8:
+            with open(self.version_file, "wb") as f:
+                f.write(bytes(8))
+        with open(self.version_file, "r+b") as f:
+            self._counter = mmap.mmap(f.fileno(), 8, access=mmap.ACCESS_WRITE)
+
+        self._local_lock = threading.RLock()
+        self._reload_thread = None
+        self.syncs = 0
+
+        # Vị trí catalog đang đứng trong file (catalog vừa load từ chính các file này)
+        checkpoint = self._read_checkpoint() or {}
+        self.rows = len(catalog)
+        self.meta_bytes = os.path.getsize(self.meta_file) if self.meta_file.exists() else 0
+        self.tombstones = checkpoint.get("tombstones", 0)
+        self.generation = checkpoint.get("generation", 0)
+        self.seen = self.read_version()
+        catalog.version = checkpoint.get("seq", 0)
+
+    # -----------------------------
+    # Counter / lock
+    # -----------------------------
+    def read_version(self) -> int:
+        return struct.unpack_from("<q", self._counter, 0)[0]
+
+    def _write_version(self, value: int):
+        struct.pack_into("<q", self._counter, 0, value)
+
+    def _read_checkpoint(self):
+        try:
+            with open(self.checkpoint_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @contextmanager
+    def lock(self, exclusive: bool = False):
+        """Holds `catalog_lock`; threads of this process also wait for each other."""
+
+        with self._local_lock, catalog_lock(self.meta_file, exclusive):
+            yield
+
+    # -----------------------------
+    # Đồng bộ
+    # -----------------------------
+    def maybe_sync(self) -> bool:
+        """Applies rows committed by other processes; True if the catalog changed."""
+
+        if self.read_version() == self.seen or self.reloading():
+            return False
+        with self.lock():
+            return self.catch_up(background=True)
+
+    def reloading(self) -> bool:
+        return self._reload_thread is not None and self._reload_thread.is_alive()
+
+    def _reload_in_background(self):
+        try:
+            with self.lock():
+                self.catch_up()
+        except Exception as e:
+            # Request sau (version vẫn khác seen) sẽ thử lại
+            print(f"⚠️ Không load lại được catalog: {e}")
+
+    def _read_vectors(self, stop: int) -> np.ndarray:
+        if self.store is not None:
+            self.store.refresh()
+            return self.store.read(self.rows, stop)
+        vectors = np.load(self.emb_file, mmap_mode="r")
+        return np.array(vectors[self.rows:stop], dtype=np.float32)
+
+    def catch_up(self, background: bool = False) -> bool:
+        """Applies every group committed since the last sync; the caller holds `lock`.
+
+        With `background=True` a needed full reload is started on a thread and
+        False is returned right away.
+        """
+
+        version = self.read_version()
+        checkpoint = self._read_checkpoint()
+        if checkpoint is not None and checkpoint.get("generation", 0) != self.generation:
+            # Worker khác vừa compact (hoặc catalog_import vừa ghi lại file): load lại từ các file
+            if background:
+                if not self.reloading():
+                    self._reload_thread = threading.Thread(target=self._reload_in_background,
+                                                           name="catalog-reload", daemon=True)
+                    self._reload_thread.start()
+                return False
+            self.catalog.reload(version=checkpoint["seq"])
+            self._follow(checkpoint)
+            self.syncs += 1
+            self.seen = version
+            return True
+
+        changed = False
+        if checkpoint is not None and checkpoint["rows"] > self.rows:
+            with open(self.meta_file, "rb") as f:
+                f.seek(self.meta_bytes)
+                data = f.read(checkpoint["meta_bytes"] - self.meta_bytes)
+            # id đọc dạng str như catalog_import và writer: "007" không thành 7
+            df = pd.read_csv(io.BytesIO(data), header=None, names=META_COLUMNS, quotechar='"', dtype={"id": str})
+            df[TEXT_COLUMNS] = df[TEXT_COLUMNS].fillna("").astype(str)
+            vectors = self._read_vectors(checkpoint["rows"])
+            if len(df) != len(vectors):
+                raise ValueError(
+                    f"Catalog mismatch while syncing: {len(df)} metadata rows vs {len(vectors)} vectors"
+                )
+            self.catalog.add(df, vectors, version=checkpoint["seq"])
+            self.rows, self.meta_bytes = checkpoint["rows"], checkpoint["meta_bytes"]
+            changed = True
+        elif self.store is not None:
+            # Worker khác có thể đã compact store: đọc lại manifest trước khi ghi
+            self.store.refresh()
+        if checkpoint is not None and checkpoint.get("tombstones", 0) > self.tombstones:
+            rows = read_tombstones(self.meta_file, self.tombstones, checkpoint["tombstones"])
+            self.catalog.delete_rows(rows, version=checkpoint["seq"])
+            self.tombstones = checkpoint["tombstones"]
+            changed = True
+        self.syncs += changed
+        self.seen = version
+        return changed
+
+    def _follow(self, checkpoint: dict):
+        self.rows, self.meta_bytes = checkpoint["rows"], checkpoint["meta_bytes"]
+        self.tombstones = checkpoint.get("tombstones", 0)
+        self.generation = checkpoint.get("generation", 0)
+
+    def published(self, checkpoint: dict):
+        """Records a group or compaction this process just committed and applied; the caller holds `lock(True)`."""
+
+        self._follow(checkpoint)
+        self._write_version(checkpoint["seq"])
+        self.seen = checkpoint["seq"]
+
+    def stats(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "rows": self.rows,
+            "tombstones": self.tombstones,
+            "generation": self.generation,
+            "version": self.catalog.version,
+            "shared_version": self.read_version(),
+            "syncs": self.syncs,
+            "reloading": self.reloading(),
+        }
@@ -0,0 +1,172 @@
+"""Tombstones of deleted listings and compaction of the catalog files.
+
+A deleted (or replaced) listing keeps its row in the metadata CSV and the
+embedding files: its row position is appended to a tombstone file next to
+the CSV (`<meta>.tombstones`, one little-endian int64 per row) and the
+in-memory `Catalog` stops returning it at once. Compaction rewrites both
+files without the tombstoned rows next to the originals; `swap_compacted`
+then renames them in place and empties the tombstone file, which
+renumbers the rows (see `IngestionWriter.compact`).
+"""
+
+import csv
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.api.services.ann_index import INDEX_FILE
+from app.api.services.dedup_embeddings import DEDUP_FILE
+from app.api.services.quantization import QuantizedEmbeddings
+
+
+def tombstone_path(meta_file) -> Path:
+    return Path(str(meta_file) + ".tombstones")
+
+
+def compaction_marker(meta_file) -> Path:
+    """File holding the plan of a compaction whose swap has started (redone by `recover`)."""
+
+    return Path(str(meta_file) + ".compaction.json")
+
+
+# -----------------------------
+# Tombstones
+# -----------------------------
+def tombstone_count(meta_file) -> int:
+    path = tombstone_path(meta_file)
+    return os.path.getsize(path) // 8 if path.exists() else 0
+
+
+def read_tombstones(meta_file, start: int = 0, stop: int = None) -> np.ndarray:
+    """Row positions of tombstone entries `start..stop-1` (all from `start` by default)."""
+
+    path = tombstone_path(meta_file)
+    if not path.exists():
+        return np.empty(0, dtype=np.int64)
+    with open(path, "rb") as f:
+        f.seek(start * 8)
+        data = f.read(-1 if stop is None else max(stop - start, 0) * 8)
+    # Entry ghi dở (crash) ở cuối file bị bỏ qua
+    return np.frombuffer(data[:len(data) // 8 * 8], dtype="<i8").astype(np.int64)
+
+
+def append_tombstones(rows, meta_file) -> int:
+    """Appends row positions (one write, fsync); returns the number of entries in the file."""
+
+    with open(tombstone_path(meta_file), "ab") as f:
+        f.write(np.asarray(rows, dtype="<i8").tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell() // 8
+
+
+def truncate_tombstones(meta_file, count: int):
+    path = tombstone_path(meta_file)
+    if path.exists() and os.path.getsize(path) > count * 8:
+        os.truncate(path, count * 8)
+
+
+def live_rows_of(ids, meta_file) -> dict:
+    """str(id) -> live row positions, read from the files (when no catalog is loaded)."""
+
+    result = {str(i): [] for i in ids}
+    if not result or not os.path.exists(meta_file):
+        return result
+    column = pd.read_csv(meta_file, usecols=["id"], quotechar='"')["id"].astype(str).to_numpy()
+    dead = np.zeros(len(column), dtype=bool)
+    tombstones = read_tombstones(meta_file)
+    dead[tombstones[tombstones < len(column)]] = True
+    for row in np.flatnonzero(np.isin(column, list(result)) & ~dead):
+        result[column[row]].append(int(row))
+    return result
+
+
+# -----------------------------
+# Compaction
+# -----------------------------
+def derived_files(emb_file, index_file=INDEX_FILE, dedup_file=DEDUP_FILE) -> list:
+    """Files built from the embeddings that are only validated by their row count.
+
+    They are deleted when the rows are renumbered and rebuilt by the next
+    `Catalog.load`; the snapshot and display files check the CSV itself.
+    """
+
+    prefix = os.path.splitext(str(emb_file))[0]
+    files = {Path(index_file), Path(dedup_file)}
+    for dtype in QuantizedEmbeddings.DTYPES:
+        files.update(QuantizedEmbeddings.paths(prefix, dtype))
+    return sorted(files)
+
+
+def _copy_rows(read, rows: np.ndarray, target, chunk_rows: int):
+    """Copies rows `rows` (sorted) of a source read by ranges into `target`, chunk by chunk."""
+
+    for start in range(0, len(rows), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        block = read(int(chunk[0]), int(chunk[-1]) + 1)
+        target[start:start + len(chunk)] = block[chunk - chunk[0]]
+
+
+def write_compacted(meta_file, emb_file, dead: np.ndarray, store=None, chunk_rows: int = 65536) -> dict:
+    """Writes the CSV and the embeddings without the `dead` rows next to the originals.
+
+    The CSV is streamed record by record (text kept as is), the vectors are
+    copied in chunks into a memory-mapped file, so neither file has to fit
+    in RAM. Returns the plan for `swap_compacted`.
+    """
+
+    keep = np.flatnonzero(~np.asarray(dead, dtype=bool))
+    meta_tmp = Path(str(meta_file) + ".compact.tmp")
+    with open(meta_file, newline="", encoding="utf-8") as src, \
+            open(meta_tmp, "w", newline="", encoding="utf-8") as dst:
+        reader = csv.reader(src)
+        writer = csv.writer(dst, quoting=csv.QUOTE_ALL)
+        writer.writerow(next(reader))
+        records = 0
+        for row, record in enumerate(reader):
+            if row >= len(dead):
+                raise ValueError(f"{meta_file} has more rows than the {len(dead)} being compacted")
+            if not dead[row]:
+                writer.writerow(record)
+                records += 1
+        dst.flush()
+        os.fsync(dst.fileno())
+        meta_bytes = dst.tell()
+    if records != len(keep):
+        raise ValueError(f"Catalog mismatch while compacting: {records} metadata rows vs {len(keep)} vectors")
+
+    if store is not None:
+        segment = store.new_segment(len(keep))
+        _copy_rows(store.read, keep, segment[1], chunk_rows)
+        segment[1].flush()
+        plan = {"segment": segment[0]}
+    else:
+        vectors = np.load(emb_file, mmap_mode="r")
+        emb_tmp = Path(str(emb_file) + ".compact.npy")
+        target = np.lib.format.open_memmap(emb_tmp, mode="w+", dtype=np.float32,
+                                           shape=(len(keep), vectors.shape[1]))
+        _copy_rows(lambda start, stop: vectors[start:stop], keep, target, chunk_rows)
+        target.flush()
+        del target, vectors
+        plan = {"embeddings": str(emb_tmp)}
+    return {"meta": str(meta_tmp), "rows": int(len(keep)), "meta_bytes": meta_bytes, **plan}
+
+
+def swap_compacted(plan: dict, meta_file, emb_file, store=None):
+    """Moves the compacted files of `plan` in place and empties the tombstones.
+
+    Every step can be repeated, so a swap interrupted by a crash is finished
+    by running it again.
+    """
+
+    if os.path.exists(plan["meta"]):
+        os.replace(plan["meta"], meta_file)
+    if "segment" in plan:
+        store.adopt(plan["segment"])
+    elif os.path.exists(plan["embeddings"]):
+        os.replace(plan["embeddings"], emb_file)
+    truncate_tombstones(meta_file, 0)
+    for path in plan.get("derived", []):
+        Path(path).unlink(missing_ok=True)
@@ -0,0 +1,166 @@
+"""Deduplicated embedding storage: one vector per unique semantic text."""
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.api.services.rerank import grow_buffer
+
+DEDUP_FILE = Path(__file__).parent / "emb_files" / "semantic_vectors_dedup.npz"
+
+
+class DedupEmbeddings:
+    """Unique vectors plus a row -> vector index.
+
+    Scoring runs the cosine over the unique vectors only and broadcasts the
+    scores back to rows, so memory and matmul cost scale with the number of
+    distinct texts rather than the number of listings. Indexing with row
+    positions (`emb[rows]`) returns dense rows, so code written for a plain
+    embedding matrix keeps working.
+    """
+
+    def __init__(self, vectors: np.ndarray, row_to_vec: np.ndarray, keys: dict = None):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.row_to_vec = np.ascontiguousarray(row_to_vec, dtype=np.int64)
+        self.keys = keys or {}
+        self.n_vectors = len(self.vectors)
+        self.n_rows = len(self.row_to_vec)
+        self._inv_norms = _inverse_norms(self.vectors)
+
+    @classmethod
+    def from_dense(cls, embeddings: np.ndarray, semantic_texts) -> "DedupEmbeddings":
+        """Collapses identical rows of a dense matrix.
+
+        Rows are grouped on their exact vector bytes, so the result is lossless
+        even when the matrix was built from richer texts than `semantic_texts`.
+        A text is registered as a key only when all its rows share one vector.
+        """
+
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        row_to_vec, _ = pd.factorize(_row_hashes(embeddings))
+        first_row = np.full(row_to_vec.max() + 1 if len(row_to_vec) else 0, -1, dtype=np.int64)
+        # Lấy row đầu tiên của mỗi vector (duyệt ngược để giá trị cuối cùng là row nhỏ nhất)
+        first_row[row_to_vec[::-1]] = np.arange(len(row_to_vec))[::-1]
+
+        if not (embeddings == embeddings[first_row][row_to_vec]).all():
+            # Trùng hash (rất hiếm): nhóm chính xác bằng np.unique
+            _, first_row, row_to_vec = np.unique(embeddings, axis=0, return_index=True, return_inverse=True)
+            row_to_vec = row_to_vec.ravel()
+
+        texts = pd.Series(list(semantic_texts), dtype=object)
+        per_text = pd.DataFrame({"text": texts, "vec": row_to_vec}).groupby("text")["vec"].agg(["min", "nunique"])
+        keys = per_text.loc[per_text["nunique"] == 1, "min"].astype(int).to_dict()
+
+        return cls(embeddings[first_row], row_to_vec, keys)
+
+    @property
+    def shape(self):
+        return (self.n_rows, self.vectors.shape[1])
+
+    def __len__(self):
+        return self.n_rows
+
+    def __getitem__(self, rows):
+        return self.vectors[self.row_to_vec[:self.n_rows][rows]]
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self[:]
+        return dense if dtype is None else dense.astype(dtype)
+
+    def add(self, semantic_text: str, vector: np.ndarray = None) -> bool:
+        """Appends one row.
+
+        Reuses the stored vector when `semantic_text` is already known, so
+        the caller can skip encoding. Returns False if a vector is needed
+        (unknown text and `vector` is None); nothing is added in that case.
+        """
+
+        vec_id = self.keys.get(semantic_text)
+        if vec_id is None:
+            if vector is None:
+                return False
+            vec_id = self._append_vector(np.asarray(vector, dtype=np.float32).reshape(-1))
+            self.keys[semantic_text] = vec_id
+
+        if self.n_rows == len(self.row_to_vec):
+            self.row_to_vec = grow_buffer(self.row_to_vec, self.n_rows, max(16, 2 * self.n_rows))
+        self.row_to_vec[self.n_rows] = vec_id
+        self.n_rows += 1
+        return True
+
+    def _append_vector(self, vector: np.ndarray) -> int:
+        if self.n_vectors == len(self.vectors):
+            self._reserve_vectors(max(16, self.n_vectors))
+        self.vectors[self.n_vectors] = vector
+        self._inv_norms[self.n_vectors] = _inverse_norms(vector[None, :])[0]
+        self.n_vectors += 1
+        return self.n_vectors - 1
+
+    def _reserve_vectors(self, count: int):
+        capacity = self.n_vectors + count
+        if capacity > len(self.vectors):
+            self.vectors = grow_buffer(self.vectors, self.n_vectors, capacity)
+            self._inv_norms = grow_buffer(self._inv_norms, self.n_vectors, capacity)
+
+    def reserve(self, rows: int):
+        """Makes room for `rows` more rows, each with a new unique vector at worst."""
+
+        if self.n_rows + rows > len(self.row_to_vec):
+            self.row_to_vec = grow_buffer(self.row_to_vec, self.n_rows, self.n_rows + rows)
+        self._reserve_vectors(rows)
+
+    def cos_scores(self, query_vecs: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        """(Q, len(rows)) cosine of queries against rows (default all), computed on unique vectors."""
+
+        queries = np.atleast_2d(np.asarray(query_vecs, dtype=np.float32))
+        queries = queries * _inverse_norms(queries)[:, None]
+
+        row_to_vec = self.row_to_vec[:self.n_rows]
+        if rows is None:
+            vec_ids, inverse = np.arange(self.n_vectors), row_to_vec
+        else:
+            vec_ids, inverse = np.unique(row_to_vec[rows], return_inverse=True)
+
+        unique_scores = (queries @ self.vectors[vec_ids].T) * self._inv_norms[vec_ids]
+        return unique_scores[:, inverse]
+
+    def save(self, path=DEDUP_FILE):
+        """Writes vectors, row index and text keys to one `.npz` file (atomic rename)."""
+
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez(
+            tmp,
+            vectors=self.vectors[:self.n_vectors],
+            row_to_vec=self.row_to_vec[:self.n_rows],
+            key_texts=np.array(list(self.keys.keys()), dtype=str),
+            key_ids=np.array(list(self.keys.values()), dtype=np.int64),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=DEDUP_FILE) -> "DedupEmbeddings":
+        """Reads a file written by `save`."""
+
+        with np.load(path) as data:
+            keys = dict(zip(data["key_texts"].tolist(), data["key_ids"].tolist()))
+            return cls(data["vectors"], data["row_to_vec"], keys)
+
+
+def _row_hashes(vectors: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    """64-bit hash of each row's exact bytes, computed in chunks."""
+
+    words = vectors.view(np.uint32)
+    multipliers = np.random.default_rng(0).integers(1, 2**63, words.shape[1], dtype=np.uint64) | np.uint64(1)
+    hashes = np.empty(len(words), dtype=np.uint64)
+    for start in range(0, len(words), chunk):
+        hashes[start:start + chunk] = (words[start:start + chunk].astype(np.uint64) * multipliers).sum(axis=1)
+    return hashes
+
+
+def _inverse_norms(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+    return (1.0 / norms).astype(np.float32)
@@ -0,0 +1,285 @@
+"""Append-only, segmented embedding store with background compaction."""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+MANIFEST = "manifest.json"
+
+
+class SegmentedEmbeddingStore:
+    """Embeddings split across `.npy` segment files listed in a manifest.
+
+    New vectors are written into a preallocated, memory-mapped active
+    segment, so an append costs O(1) regardless of catalog size. When the
+    active segment is full it is sealed and a new one is started. Sealed
+    segments are periodically merged into one file by `compact`, which can
+    run in a background thread while appends continue.
+
+    The manifest is rewritten with an atomic rename after every change, so a
+    crash leaves either the old or the new state on disk.
+    """
+
+    def __init__(self, directory, dim: int, segment_rows: int = 4096, max_segments: int = 8):
+        self.directory = Path(directory)
+        self.dim = dim
+        self.segment_rows = segment_rows
+        self.max_segments = max_segments
+        # False khi nhiều process cùng ghi: compaction chạy ngay trong append (đang giữ lock của writer)
+        self.background_compaction = True
+        self.segments = []  # [{"file": str, "rows": int, "capacity": int}]
+        self.next_segment_no = 0
+        self._active = None
+        self._lock = threading.Lock()
+        self._compaction = None
+
+    # -----------------------------
+    # Mở / khởi tạo
+    # -----------------------------
+    def refresh(self):
+        """Re-reads the manifest (rows appended by another process)."""
+
+        with open(self.directory / MANIFEST) as f:
+            manifest = json.load(f)
+        with self._lock:
+            self.segments = manifest["segments"]
+            self.next_segment_no = manifest["next_segment_no"]
+            self._active = None
+
+    @classmethod
+    def open(cls, directory, seed_file=None, dim: int = 384, **kwargs) -> "SegmentedEmbeddingStore":
+        """Opens the store in `directory`, creating it from `seed_file` (a dense `.npy`) if empty."""
+
+        directory = Path(directory)
+        manifest_path = directory / MANIFEST
+        if manifest_path.exists():
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            store = cls(directory, manifest["dim"], **kwargs)
+            store.segments = manifest["segments"]
+            store.next_segment_no = manifest["next_segment_no"]
+            return store
+
+        directory.mkdir(parents=True, exist_ok=True)
+        seed = np.load(seed_file, mmap_mode="r") if seed_file and os.path.exists(seed_file) else None
+        store = cls(directory, seed.shape[1] if seed is not None else dim, **kwargs)
+        if seed is not None and len(seed):
+            name = store._segment_name()
+            np.save(directory / name, np.asarray(seed, dtype=np.float32))
+            store.segments.append({"file": name, "rows": len(seed), "capacity": len(seed)})
+        store._write_manifest()
+        return store
+
+    def __len__(self):
+        return sum(seg["rows"] for seg in self.segments)
+
+    def _segment_name(self) -> str:
+        name = f"segment_{self.next_segment_no:06d}.npy"
+        self.next_segment_no += 1
+        return name
+
+    def _write_manifest(self):
+        tmp = self.directory / (MANIFEST + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"dim": self.dim, "next_segment_no": self.next_segment_no, "segments": self.segments}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.directory / MANIFEST)
+
+    # -----------------------------
+    # Ghi
+    # -----------------------------
+    def _active_segment(self):
+        """Returns (entry, memmap) of a segment with free capacity, creating one if needed."""
+
+        last = self.segments[-1] if self.segments else None
+        if last is None or last["rows"] >= last["capacity"]:
+            name = self._segment_name()
+            mm = np.lib.format.open_memmap(
+                self.directory / name, mode="w+", dtype=np.float32, shape=(self.segment_rows, self.dim)
+            )
+            last = {"file": name, "rows": 0, "capacity": self.segment_rows}
+            self.segments.append(last)
+            self._active = (name, mm)
+        elif self._active is None or self._active[0] != last["file"]:
+            self._active = (last["file"], np.load(self.directory / last["file"], mmap_mode="r+"))
+        return last, self._active[1]
+
+    def append(self, vectors: np.ndarray) -> int:
+        """Appends vectors and returns the new total row count."""
+
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            written = 0
+            while written < len(vectors):
+                entry, mm = self._active_segment()
+                n = min(entry["capacity"] - entry["rows"], len(vectors) - written)
+                mm[entry["rows"]:entry["rows"] + n] = vectors[written:written + n]
+                mm.flush()
+                entry["rows"] += n
+                written += n
+            self._write_manifest()
+            total = len(self)
+            sealed = sum(1 for seg in self.segments if seg["rows"] >= seg["capacity"])
+
+        if sealed > self.max_segments:
+            if self.background_compaction:
+                self.compact_in_background()
+            else:
+                self.compact()
+        return total
+
+    def truncate(self, rows: int):
+        """Drops every row after the first `rows` (used to roll back a partially applied write)."""
+
+        with self._lock:
+            kept, remaining = [], rows
+            for seg in self.segments:
+                if remaining <= 0:
+                    break
+                if seg["rows"] > remaining:
+                    seg = dict(seg, rows=remaining)
+                kept.append(seg)
+                remaining -= seg["rows"]
+            dropped = {seg["file"] for seg in self.segments} - {seg["file"] for seg in kept}
+            self.segments = kept
+            self._active = None
+            self._write_manifest()
+
+        for file in dropped:
+            (self.directory / file).unlink(missing_ok=True)
+
+    # -----------------------------
+    # Đọc
+    # -----------------------------
+    def load(self, mmap: bool = False) -> np.ndarray:
+        """Returns all rows as one (N, dim) float32 matrix."""
+
+        for attempt in range(2):
+            with self._lock:
+                segments = [dict(seg) for seg in self.segments]
+            try:
+                parts = [np.load(self.directory / seg["file"], mmap_mode="r")[:seg["rows"]] for seg in segments]
+                break
+            except FileNotFoundError:
+                # Compaction vừa xoá segment cũ: đọc lại manifest mới
+                if attempt:
+                    raise
+        if not parts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        if mmap and len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts).astype(np.float32, copy=False)
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """Returns rows `start..stop-1`, reading only the segments that hold them."""
+
+        with self._lock:
+            segments = [dict(seg) for seg in self.segments]
+        parts, offset = [], 0
+        for seg in segments:
+            lo, hi = max(start, offset), min(stop, offset + seg["rows"])
+            if lo < hi:
+                mm = np.load(self.directory / seg["file"], mmap_mode="r")
+                parts.append(np.array(mm[lo - offset:hi - offset], dtype=np.float32))
+            offset += seg["rows"]
+        if not parts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.concatenate(parts)
+
+    def export(self, path, chunk_rows: int = 65536):
+        """Writes all rows to a dense `.npy` file, chunk by chunk (atomic rename)."""
+
+        tmp = Path(str(path) + ".tmp.npy")
+        rows = len(self)
+        if not rows:
+            np.save(tmp, np.empty((0, self.dim), dtype=np.float32))
+        else:
+            out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(rows, self.dim))
+            for start in range(0, rows, chunk_rows):
+                out[start:start + chunk_rows] = self.read(start, min(start + chunk_rows, rows))
+            out.flush()
+            del out
+        os.replace(tmp, path)
+
+    # -----------------------------
+    # Ghi lại toàn bộ (xoá row)
+    # -----------------------------
+    def new_segment(self, rows: int, dim: int = None):
+        """Creates a segment file of `rows` rows outside the manifest; returns (name, writable memmap).
+
+        dim: defaults to the store's; a different one (re-embedding with another model) takes effect on `adopt`
+        """
+
+        self.wait_for_compaction()
+        with self._lock:
+            name = self._segment_name()
+        mm = np.lib.format.open_memmap(self.directory / name, mode="w+", dtype=np.float32,
+                                       shape=(rows, dim or self.dim))
+        return name, mm
+
+    def adopt(self, name: str):
+        """Makes segment `name` the only segment (atomic manifest swap) and deletes every other segment file.
+
+        Running it again after it completed changes nothing.
+        """
+
+        self.wait_for_compaction()
+        rows, dim = np.load(self.directory / name, mmap_mode="r").shape
+        with self._lock:
+            self.dim = dim
+            self.segments = [{"file": name, "rows": rows, "capacity": rows}]
+            self.next_segment_no = max(self.next_segment_no, int(name[len("segment_"):-len(".npy")]) + 1)
+            self._active = None
+            self._write_manifest()
+        for path in self.directory.glob("segment_*.npy"):
+            if path.name != name:
+                path.unlink(missing_ok=True)
+
+    # -----------------------------
+    # Compaction
+    # -----------------------------
+    def compact(self):
+        """Merges all sealed segments into one and swaps it into the manifest.
+
+        Appends may continue while the merge runs; only the final manifest
+        swap holds the lock.
+        """
+
+        with self._lock:
+            sealed = [dict(seg) for seg in self.segments if seg["rows"] >= seg["capacity"]]
+            if len(sealed) < 2:
+                return
+            name = self._segment_name()
+
+        merged = np.concatenate(
+            [np.load(self.directory / seg["file"], mmap_mode="r")[:seg["rows"]] for seg in sealed]
+        )
+        np.save(self.directory / name, merged)
+
+        with self._lock:
+            merged_files = {seg["file"] for seg in sealed}
+            rest = [seg for seg in self.segments if seg["file"] not in merged_files]
+            self.segments = [{"file": name, "rows": len(merged), "capacity": len(merged)}] + rest
+            self._write_manifest()
+
+        for file in merged_files:
+            (self.directory / file).unlink(missing_ok=True)
+
+    def compact_in_background(self) -> threading.Thread:
+        """Starts `compact` in a daemon thread unless one is already running."""
+
+        if self._compaction is not None and self._compaction.is_alive():
+            return self._compaction
+        self._compaction = threading.Thread(target=self.compact, name="embedding-store-compaction", daemon=True)
+        self._compaction.start()
+        return self._compaction
+
+    def wait_for_compaction(self):
+        """Waits for a running background `compact` (its manifest swap must not race a rewrite)."""
+
+        if self._compaction is not None and self._compaction.is_alive():
+            self._compaction.join()
@@ -0,0 +1,141 @@
+"""Dynamic micro-batching of query encodes."""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatchEncoder:
+    """Coalesces concurrent `encode` calls into one `model.encode` batch.
+
+    Each caller's texts are queued with a `Future`. A single worker thread
+    takes the first pending request, keeps collecting for up to
+    `max_wait_ms` or until `max_batch_size` texts are queued, encodes them in
+    one call and resolves every future with its own rows. Under concurrent
+    load this replaces many single-sentence forward passes competing for the
+    GIL and BLAS threads with a few batched ones.
+
+    `encode` has the `SentenceTransformer.encode` signature used by the
+    service (vectors are always normalized), so the batcher can be passed
+    wherever a model is expected. The routes are plain `def` functions run in
+    FastAPI's thread pool: each request thread blocks on its future.
+
+    The worker thread is started on first use in each process, so a batcher
+    created before a pre-fork server forks its workers (gunicorn
+    `preload_app`) still gets one thread per worker.
+    """
+
+    def __init__(self, model, max_batch_size: int = 64, max_wait_ms: float = 3.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._batches = 0
+        self._texts = 0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_thread(self):
+        # Thread không sống sót qua fork: process con tạo queue + thread riêng ở lần dùng đầu tiên
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, args=(self._queue,), name="encode-batcher",
+                                                daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def __getattr__(self, name):
+        # get_sentence_embedding_dimension(), ... của model gốc
+        return getattr(self.model, name)
+
+    # -----------------------------
+    # API cho caller
+    # -----------------------------
+    def submit(self, texts) -> Future:
+        """Queues texts; the future resolves to their (len(texts), dim) normalized vectors."""
+
+        future = Future()
+        texts = list(texts)
+        if not texts:
+            future.set_result(np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32))
+        else:
+            self._ensure_thread()
+            self._queue.put((texts, future))
+        return future
+
+    def encode(self, sentences, normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        """Blocking, batched equivalent of `model.encode(sentences, normalize_embeddings=True)`."""
+
+        single = isinstance(sentences, str)
+        vectors = self.submit([sentences] if single else sentences).result()
+        return vectors[0] if single else vectors
+
+    def stats(self) -> dict:
+        return {
+            "batches": self._batches,
+            "texts": self._texts,
+            "mean_batch_size": self._texts / self._batches if self._batches else 0.0,
+            "pending": self._queue.qsize() if self._pid == os.getpid() else 0,
+        }
+
+    def close(self):
+        if self._pid == os.getpid():
+            self._queue.put(None)
+            self._thread.join()
+            self._pid = None
+
+    # -----------------------------
+    # Worker
+    # -----------------------------
+    def _collect(self, requests, first):
+        """Returns (batch, stop): requests gathered within the window after `first`."""
+
+        batch, n_texts = [first], len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while n_texts < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+            n_texts += len(item[0])
+        return batch, False
+
+    def _run(self, requests):
+        stop = False
+        while not stop:
+            first = requests.get()
+            if first is None:
+                break
+            batch, stop = self._collect(requests, first)
+            texts = [text for texts, _ in batch for text in texts]
+
+            try:
+                vectors = np.asarray(
+                    self.model.encode(texts, batch_size=len(texts), normalize_embeddings=True),
+                    dtype=np.float32,
+                )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self._batches += 1
+            self._texts += len(texts)
+            start = 0
+            for request_texts, future in batch:
+                future.set_result(vectors[start:start + len(request_texts)])
+                start += len(request_texts)
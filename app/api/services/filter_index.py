@@ -0,0 +1,211 @@
+"""Inverted and sorted range indexes over the listing fields used as recommend filters."""
+
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from app.api.services.rerank import grow_buffer
+
+# Tên filter -> cột metadata
+FILTER_FIELDS = {"category": "categoryName", "province": "province", "product": "productName"}
+# Cột số -> (tên filter cận dưới, tên filter cận trên)
+RANGE_FIELDS = {"price_num": ("price_min", "price_max"), "quantity_num": ("qty_min", "qty_max")}
+
+
+def normalize_value(value) -> str:
+    """Filter key of a field value: NFC, lowercased, surrounding whitespace removed."""
+
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    return unicodedata.normalize("NFC", str(value)).strip().lower()
+
+
+def _keys(values: pd.Series) -> pd.Series:
+    return values.fillna("").astype(str).str.normalize("NFC").str.strip().str.lower()
+
+
+class _PostingList:
+    """Growable sorted array of row ids for one field value."""
+
+    def __init__(self, ids: np.ndarray = None):
+        self._ids = np.empty(16, dtype=np.int64) if ids is None else np.ascontiguousarray(ids, dtype=np.int64)
+        self.size = 0 if ids is None else len(ids)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self.size]
+
+    def append(self, ids: np.ndarray):
+        needed = self.size + len(ids)
+        if needed > len(self._ids):
+            self._ids = grow_buffer(self._ids, self.size, max(needed, 2 * len(self._ids)))
+        self._ids[self.size:needed] = ids
+        # Tăng size sau cùng để reader không thấy id chưa ghi xong
+        self.size = needed
+
+    def reserve(self, rows: int):
+        if self.size + rows > len(self._ids):
+            self._ids = grow_buffer(self._ids, self.size, self.size + rows)
+
+
+class RangeIndex:
+    """Row ids of one numeric column sorted by value, for range filters.
+
+    The sorted part is searched with `np.searchsorted`; rows appended since the
+    last merge form a small unsorted tail that is scanned linearly and merged
+    back once it exceeds `merge_fraction` of the sorted rows. Rows with a NaN
+    value never match a range.
+    """
+
+    def __init__(self, merge_fraction: float = 1 / 16, min_merge: int = 1024):
+        self.merge_fraction = merge_fraction
+        self.min_merge = min_merge
+        self._values = np.empty(0, dtype=np.float64)
+        self.size = 0
+        # (giá trị đã sắp xếp, row id tương ứng, số row đầu tiên đã được sắp xếp)
+        self._sorted = (np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64), 0)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, values):
+        """Appends values of the next row positions."""
+
+        values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+        needed = self.size + len(values)
+        if needed > len(self._values):
+            self._values = grow_buffer(self._values, self.size, max(needed, 2 * len(self._values), 1024))
+        self._values[self.size:needed] = values
+        self.size = needed
+
+        n_sorted = self._sorted[2]
+        if self.size - n_sorted > max(self.min_merge, n_sorted * self.merge_fraction):
+            self._merge()
+
+    def reserve(self, rows: int):
+        """Makes room for `rows` more values."""
+
+        if self.size + rows > len(self._values):
+            self._values = grow_buffer(self._values, self.size, self.size + rows)
+
+    def _merge(self):
+        size = self.size
+        values = self._values[:size]
+        ids = np.flatnonzero(~np.isnan(values))
+        ids = ids[np.argsort(values[ids], kind="stable")]
+        # Thay cả tuple 1 lần để reader luôn thấy trạng thái nhất quán
+        self._sorted = (values[ids], ids, size)
+
+    def range(self, low=None, high=None) -> np.ndarray:
+        """Sorted row ids with `low <= value <= high` (None = unbounded)."""
+
+        size = self.size
+        sorted_values, sorted_ids, n_sorted = self._sorted
+        start = 0 if low is None else np.searchsorted(sorted_values, low, side="left")
+        end = len(sorted_values) if high is None else np.searchsorted(sorted_values, high, side="right")
+        ids = np.sort(sorted_ids[start:end])
+
+        tail = self._values[n_sorted:size]
+        mask = ~np.isnan(tail)
+        if low is not None:
+            mask &= tail >= low
+        if high is not None:
+            mask &= tail <= high
+        if not mask.any():
+            return ids
+        return np.concatenate([ids, n_sorted + np.flatnonzero(mask)])
+
+
+class FilterIndex:
+    """Value -> sorted row ids, for `categoryName`, `province` and `productName`,
+    plus a `RangeIndex` for `price_num` (đ/kg) and `quantity_num` (kg).
+
+    Rows are only ever appended with increasing ids, so every posting list
+    stays sorted and a filtered lookup is an intersection of the lists of the
+    requested values: its cost depends on the number of matching rows, not on
+    the catalog size. A province filter matches either the full
+    `extract_province` value ("Hà Nội, Việt Nam") or its first part ("Hà Nội").
+    """
+
+    def __init__(self):
+        self.postings = {name: {} for name in FILTER_FIELDS}
+        self.ranges = {column: RangeIndex() for column in RANGE_FIELDS}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "FilterIndex":
+        """Builds the index for catalog rows `0..len(df)-1`."""
+
+        index = cls()
+        index.add(df)
+        return index
+
+    def _field_keys(self, name: str, df: pd.DataFrame):
+        keys = _keys(df[FILTER_FIELDS[name]])
+        yield keys
+        if name == "province":
+            short = keys.str.split(",").str[0].str.strip()
+            yield short.where(short != keys, "")
+
+    def add(self, df: pd.DataFrame):
+        """Appends rows; their ids are the next row positions."""
+
+        ids = np.arange(self.size, self.size + len(df), dtype=np.int64)
+        for name in FILTER_FIELDS:
+            postings = self.postings[name]
+            for keys in self._field_keys(name, df):
+                codes, uniques = pd.factorize(keys)
+                order = np.argsort(codes, kind="stable")
+                counts = np.bincount(codes, minlength=len(uniques))
+                ends = np.cumsum(counts)
+                for key, start, end in zip(uniques, ends - counts, ends):
+                    if not key:
+                        continue
+                    if key in postings:
+                        postings[key].append(ids[order[start:end]])
+                    else:
+                        postings[key] = _PostingList(ids[order[start:end]])
+        for column, index in self.ranges.items():
+            index.add(df[column].to_numpy(dtype=np.float64, na_value=np.nan))
+        self.size += len(df)
+
+    def reserve(self, rows: int):
+        """Makes room for `rows` more rows: in the range indexes, and in each posting list in proportion
+        to its share of the rows (new rows are assumed to follow the current distribution of values)."""
+
+        for index in self.ranges.values():
+            index.reserve(rows)
+        for postings in self.postings.values():
+            for posting in postings.values():
+                posting.reserve(-(-posting.size * rows // max(self.size, 1)))
+
+    def lookup(self, category=None, province=None, product=None, price_min=None, price_max=None,
+               qty_min=None, qty_max=None):
+        """Sorted row ids matching every given filter, or None when no filter is set."""
+
+        requested = {"category": category, "province": province, "product": product}
+        lists = []
+        for name, value in requested.items():
+            if value is None or normalize_value(value) == "":
+                continue
+            posting = self.postings[name].get(normalize_value(value))
+            if posting is None:
+                return np.empty(0, dtype=np.int64)
+            lists.append(posting.ids)
+
+        bounds = {"price_min": price_min, "price_max": price_max, "qty_min": qty_min, "qty_max": qty_max}
+        for column, (low, high) in RANGE_FIELDS.items():
+            if bounds[low] is not None or bounds[high] is not None:
+                lists.append(self.ranges[column].range(bounds[low], bounds[high]))
+        if not lists:
+            return None
+
+        # Giao từ list ngắn nhất để chi phí theo số row khớp
+        result = None
+        for ids in sorted(lists, key=len):
+            result = ids.copy() if result is None else np.intersect1d(result, ids, assume_unique=True)
+        return result
@@ -0,0 +1,95 @@
+"""Grid-based spatial index over listing coordinates."""
+
+from collections import defaultdict
+
+import numpy as np
+
+from app.api.services.rerank import grow_buffer, haversine_km
+
+KM_PER_DEG_LAT = 111.32
+
+
+class GeoGridIndex:
+    """Buckets rows into fixed-size latitude/longitude cells.
+
+    A radius query visits only the cells overlapping the bounding box of the
+    circle and then filters the bucketed rows with an exact haversine, so its
+    cost depends on the neighbourhood size rather than the catalog size.
+    Rows without coordinates are never returned.
+    """
+
+    def __init__(self, cell_deg: float = 0.1):
+        self.cell_deg = cell_deg
+        self.cells = defaultdict(list)
+        self.latitude = np.empty(0, dtype=np.float64)
+        self.longitude = np.empty(0, dtype=np.float64)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @classmethod
+    def from_arrays(cls, latitude: np.ndarray, longitude: np.ndarray, cell_deg: float = 0.1) -> "GeoGridIndex":
+        """Builds the index for catalog rows `0..len(latitude)-1`."""
+
+        index = cls(cell_deg)
+        index.add(latitude, longitude)
+        return index
+
+    def _cell(self, lat, lon):
+        return np.floor(lat / self.cell_deg).astype(np.int64), np.floor(lon / self.cell_deg).astype(np.int64)
+
+    def add(self, latitude, longitude):
+        """Appends rows; their ids are the next row positions."""
+
+        latitude = np.atleast_1d(np.asarray(latitude, dtype=np.float64))
+        longitude = np.atleast_1d(np.asarray(longitude, dtype=np.float64))
+        ids = np.arange(self.size, self.size + len(latitude))
+
+        # Mảng toạ độ tăng dung lượng gấp đôi để add là O(1) khấu hao
+        needed = self.size + len(latitude)
+        if needed > len(self.latitude):
+            self.reserve(max(needed, 2 * len(self.latitude), 1024) - self.size)
+        self.latitude[self.size:needed] = latitude
+        self.longitude[self.size:needed] = longitude
+        self.size = needed
+
+        valid = ~(np.isnan(latitude) | np.isnan(longitude))
+        rows, cols = self._cell(latitude[valid], longitude[valid])
+        for row_id, r, c in zip(ids[valid].tolist(), rows.tolist(), cols.tolist()):
+            self.cells[(r, c)].append(row_id)
+
+    def reserve(self, rows: int):
+        """Makes room for `rows` more rows in the coordinate arrays."""
+
+        capacity = self.size + rows
+        if capacity > len(self.latitude):
+            self.latitude = grow_buffer(self.latitude, self.size, capacity)
+            self.longitude = grow_buffer(self.longitude, self.size, capacity)
+
+    def query_radius(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Returns sorted row ids within `radius_km` of `(lat, lon)`."""
+
+        if np.isnan(lat) or np.isnan(lon) or radius_km is None or radius_km < 0:
+            return np.empty(0, dtype=np.int64)
+
+        dlat = radius_km / KM_PER_DEG_LAT
+        cos_lat = max(np.cos(np.radians(min(abs(lat) + dlat, 90.0))), 1e-6)
+        dlon = min(radius_km / (KM_PER_DEG_LAT * cos_lat), 180.0)
+
+        r0, c0 = self._cell(np.float64(lat - dlat), np.float64(lon - dlon))
+        r1, c1 = self._cell(np.float64(lat + dlat), np.float64(lon + dlon))
+
+        if (r1 - r0 + 1) * (c1 - c0 + 1) > len(self.cells):
+            # Bán kính rất lớn: duyệt các ô đang có dữ liệu thay vì cả bounding box
+            buckets = [ids for (r, c), ids in self.cells.items() if r0 <= r <= r1 and c0 <= c <= c1]
+        else:
+            buckets = [self.cells[key] for key in
+                       ((r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)) if key in self.cells]
+        if not buckets:
+            return np.empty(0, dtype=np.int64)
+
+        ids = np.fromiter((i for bucket in buckets for i in bucket), dtype=np.int64)
+        dist = haversine_km(lat, lon, self.latitude[ids], self.longitude[ids])
+        return np.sort(ids[dist <= radius_km])
+
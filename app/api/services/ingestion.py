@@ -0,0 +1,564 @@
+"""Single-writer ingestion of new listings with a write-ahead log and group commit."""
+
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.api.services.compaction import (
+    append_tombstones,
+    compaction_marker,
+    derived_files,
+    live_rows_of,
+    read_tombstones,
+    swap_compacted,
+    tombstone_count,
+    truncate_tombstones,
+    write_compacted,
+)
+from app.api.services.recommend_service import (
+    EMB_FILE,
+    META_COLUMNS,
+    META_FILE,
+    append_embeddings,
+    append_metadata,
+    preprocess_items,
+    resize_npy_rows,
+)
+
+
+def wal_paths(meta_file):
+    """(WAL, checkpoint) files of a metadata CSV."""
+
+    return Path(str(meta_file) + ".wal"), Path(str(meta_file) + ".checkpoint.json")
+
+
+class ListingNotFound(LookupError):
+    """An id to delete / update matches no live listing."""
+
+
+def _plan_deletes(entries, existing: dict, first_row: int) -> list:
+    """Row positions tombstoned by each (frame, ids to delete) entry of a group, in order
+    (a ListingNotFound for an entry with an id that matches no live row)."""
+
+    # Row do entry trước trong nhóm thêm cũng xoá được, row mới của chính entry thì không
+    # (update xoá row cũ, giữ row mới)
+    added, removed, next_row, plans = {}, set(), first_row, []
+    for frame, ids in entries:
+        rows, missing = [], []
+        for key in ids:
+            found = [r for r in existing.get(key, []) + added.get(key, []) if r not in removed and r not in rows]
+            if not found:
+                missing.append(key)
+            rows += found
+        if missing:
+            plans.append(ListingNotFound(f"Listing not found: {', '.join(missing)}"))
+            continue
+        removed.update(rows)
+        if frame is not None:
+            for offset, key in enumerate(frame["id"].astype(str)):
+                added.setdefault(key, []).append(next_row + offset)
+            next_row += len(frame)
+        plans.append(rows)
+    return plans
+
+
+class IngestionWriter:
+    """The only writer of the catalog files while the service runs.
+
+    Adds, updates and deletes are queued and committed in groups: write-ahead
+    log, one batched encode, CSV + embeddings + tombstones, checkpoint, then
+    the in-memory `Catalog`. `recover` replays what a crash left in the log.
+    """
+
+    def __init__(self, model, meta_file=META_FILE, emb_file=EMB_FILE, store=None, catalog=None,
+                 max_group_size: int = 256, max_wait_ms: float = 5.0, batch_size: int = 256, sync=None,
+                 compact_ratio: float = 0.1):
+        self.model = model
+        self.meta_file = Path(meta_file)
+        self.emb_file = Path(emb_file)
+        self.store = store
+        self.catalog = catalog
+        self.sync = sync
+        self.max_group_size = max_group_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batch_size = batch_size
+        # Tỉ lệ row đã xoá / tổng số row để tự compact (0 = không tự compact)
+        self.compact_ratio = compact_ratio
+        self.wal_file, self.checkpoint_file = wal_paths(meta_file)
+        self.marker_file = compaction_marker(meta_file)
+
+        checkpoint = self._read_checkpoint()
+        self.seq = checkpoint["seq"] if checkpoint else 0
+        self.groups = 0
+        self.committed = 0
+        self.deleted = 0
+        self.compactions = 0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        # Nhóm commit và compaction không chạy cùng lúc
+        self._lock = threading.Lock()
+        self._compaction = None
+        # Catalog trong RAM chưa load lại sau compaction (khi không có CatalogSync)
+        self._reload_pending = False
+
+    # -----------------------------
+    # Log / checkpoint
+    # -----------------------------
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_json(path, value: dict):
+        tmp = Path(str(path) + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(value, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _read_checkpoint(self):
+        return self._read_json(self.checkpoint_file)
+
+    def _write_checkpoint(self, rows: int, meta_bytes: int, tombstones: int = 0, generation: int = 0):
+        """generation: number of rewrites of the files (compaction, import); row positions may change with each."""
+
+        self._write_json(self.checkpoint_file, {"seq": self.seq, "rows": rows, "meta_bytes": meta_bytes,
+                                                "tombstones": tombstones, "generation": generation})
+
+    def _read_wal(self) -> list:
+        """Complete records of the log; a torn last line (crash mid-write) is ignored."""
+
+        records = []
+        if not self.wal_file.exists():
+            return records
+        with open(self.wal_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+        return records
+
+    def _append_wal(self, records):
+        with open(self.wal_file, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _clear_wal(self):
+        with open(self.wal_file, "w") as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _embedding_rows(self) -> int:
+        if self.store is not None:
+            return len(self.store)
+        return len(np.load(self.emb_file, mmap_mode="r")) if self.emb_file.exists() else 0
+
+    def _truncate_embeddings(self, rows: int):
+        if self.store is not None:
+            self.store.truncate(rows)
+            return
+        if resize_npy_rows(self.emb_file, rows):
+            return
+        vectors = np.load(self.emb_file, mmap_mode="r")
+        tmp = str(self.emb_file) + ".tmp.npy"
+        np.save(tmp, np.asarray(vectors[:rows]))
+        del vectors
+        os.replace(tmp, self.emb_file)
+
+    def _rollback(self, checkpoint):
+        """Cuts the CSV and the embeddings back to the state recorded in `checkpoint`."""
+
+        if checkpoint is None:
+            return
+        if self.meta_file.exists() and os.path.getsize(self.meta_file) > checkpoint["meta_bytes"]:
+            os.truncate(self.meta_file, checkpoint["meta_bytes"])
+        if self._embedding_rows() > checkpoint["rows"]:
+            self._truncate_embeddings(checkpoint["rows"])
+        truncate_tombstones(self.meta_file, checkpoint.get("tombstones", 0))
+
+    # -----------------------------
+    # Khôi phục
+    # -----------------------------
+    def pending(self) -> list:
+        """Log records the checkpoint does not cover yet (replayed by `recover`)."""
+
+        checkpoint = self._read_checkpoint()
+        return [r for r in self._read_wal() if checkpoint is None or r["seq"] > checkpoint["seq"]]
+
+    def adopt_files(self, rewritten: bool) -> dict:
+        """Checkpoints catalog files just written by `catalog_import`; the caller holds the exclusive lock.
+
+        rewritten: the rows were rebuilt, so the tombstones of the old rows are dropped
+        """
+
+        # Luôn tăng generation: các worker đang chạy sẽ load lại file
+        previous = self._read_checkpoint() or {}
+        if rewritten:
+            truncate_tombstones(self.meta_file, 0)
+        self.seq = max(self.seq, previous.get("seq", 0)) + 1
+        size = os.path.getsize(self.meta_file) if self.meta_file.exists() else 0
+        self._write_checkpoint(self._embedding_rows(), size, tombstone_count(self.meta_file),
+                               previous.get("generation", 0) + 1)
+        self._clear_wal()
+        return self._read_checkpoint()
+
+    def recover(self) -> int:
+        """Finishes an interrupted compaction, rolls back a half-written group and replays the log.
+
+        Runs before the catalog is loaded; returns the number of listings replayed.
+        """
+
+        plan = self._read_json(self.marker_file)
+        if plan is not None:
+            self._finish_compaction(plan)
+
+        checkpoint = self._read_checkpoint()
+        pending = self.pending()
+        if not pending:
+            self._clear_wal()
+            return 0
+
+        self._rollback(checkpoint)
+        frames = [preprocess_items(pd.DataFrame(r["items"])) if r["items"] else None for r in pending]
+        deletes = [r.get("delete", []) for r in pending]
+        existing = live_rows_of({key for ids in deletes for key in ids}, self.meta_file)
+        plans = _plan_deletes(zip(frames, deletes), existing, self._embedding_rows())
+        # Record đã được kiểm tra khi commit; 1 record không còn hợp lệ thì bỏ qua cả record
+        frames = [f for f, rows in zip(frames, plans) if f is not None and not isinstance(rows, Exception)]
+        dead = [row for rows in plans if not isinstance(rows, Exception) for row in rows]
+        self.seq = pending[-1]["seq"]
+        self._write_group(frames, dead)
+        return sum(len(df) for df in frames) + len(dead)
+
+    # -----------------------------
+    # Ghi theo nhóm
+    # -----------------------------
+    def _write_group(self, frames, dead_rows=()):
+        """Encodes and appends preprocessed frames to both files, tombstones `dead_rows`, then checkpoints."""
+
+        frames = [f for f in frames if len(f)]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=META_COLUMNS)
+        embeddings = np.empty((0, 0), dtype=np.float32)
+        if len(df):
+            embeddings = np.asarray(
+                self.model.encode(df["semantic_text"].tolist(), batch_size=self.batch_size,
+                                  normalize_embeddings=True),
+                dtype=np.float32,
+            ).reshape(len(df), -1)
+            append_metadata(df, self.meta_file)
+            append_embeddings(embeddings, self.store, self.emb_file)
+        tombstones = (append_tombstones(dead_rows, self.meta_file) if len(dead_rows)
+                      else tombstone_count(self.meta_file))
+
+        previous = self._read_checkpoint() or {}
+        meta_bytes = os.path.getsize(self.meta_file) if self.meta_file.exists() else 0
+        self._write_checkpoint(self._embedding_rows(), meta_bytes, tombstones, previous.get("generation", 0))
+        self._clear_wal()
+        return df, embeddings
+
+    @contextmanager
+    def _locked(self):
+        """Held by a group commit / compaction: this writer's lock, then the exclusive catalog lock."""
+
+        with self._lock, self.sync.lock(exclusive=True) if self.sync is not None else nullcontext():
+            yield
+
+    def _catch_up(self):
+        """Brings the in-memory catalog and `seq` up to the files; the caller holds `_locked`."""
+
+        if self.sync is not None:
+            # Áp dụng các nhóm worker khác vừa ghi trước, để row mới nối tiếp đúng vị trí
+            self.sync.catch_up()
+            checkpoint = self._read_checkpoint()
+            self.seq = max(self.seq, checkpoint["seq"] if checkpoint else 0)
+        elif self._reload_pending:
+            self.catalog.reload()
+            self._reload_pending = False
+
+    def _commit(self, requests):
+        """Commits one group of (items, ids to delete, future) requests."""
+
+        try:
+            with self._locked():
+                self._catch_up()
+                self._commit_locked(requests)
+        except Exception as e:
+            for _, _, future in requests:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _live_rows(self, ids) -> dict:
+        if not ids:
+            return {}
+        if self.catalog is not None:
+            return self.catalog.rows_of(ids)
+        return live_rows_of(ids, self.meta_file)
+
+    def _commit_locked(self, requests):
+        if self._read_checkpoint() is None:
+            # Chưa có checkpoint: ghi trạng thái file hiện tại, để recover cắt nhóm ghi dở về đúng chỗ
+            meta_bytes = os.path.getsize(self.meta_file) if self.meta_file.exists() else 0
+            self._write_checkpoint(self._embedding_rows(), meta_bytes, tombstone_count(self.meta_file))
+        prepared = []
+        for items, ids, future in requests:
+            try:
+                frame = preprocess_items(pd.DataFrame(items)) if items else None
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            prepared.append((items, ids, future, frame))
+        existing = self._live_rows({key for _, ids, _, _ in prepared for key in ids})
+        plans = _plan_deletes([(frame, ids) for _, ids, _, frame in prepared], existing, self._embedding_rows())
+
+        frames, dead, accepted, records = [], [], [], []
+        for (items, ids, future, frame), rows in zip(prepared, plans):
+            if isinstance(rows, Exception):
+                future.set_exception(rows)
+                continue
+            if frame is None:
+                frame = pd.DataFrame(columns=META_COLUMNS)
+            if frame.empty and not rows:
+                future.set_result((frame, np.empty((0, 0), dtype=np.float32), 0))
+                continue
+            self.seq += 1
+            record = {"seq": self.seq, "items": items}
+            if ids:
+                record["delete"] = ids
+            records.append(record)
+            frames.append(frame)
+            dead += rows
+            accepted.append((future, len(rows)))
+        if not records:
+            return
+
+        try:
+            self._append_wal(records)
+            df, embeddings = self._write_group(frames, dead)
+        except Exception as e:
+            # Nhóm lỗi không được ghi nửa vời: cắt file về checkpoint và bỏ các record của nhóm
+            try:
+                self._rollback(self._read_checkpoint())
+                self._clear_wal()
+            except OSError:
+                pass
+            for future, _ in accepted:
+                future.set_exception(e)
+            return
+
+        checkpoint = self._read_checkpoint()
+        if self.catalog is not None:
+            version = self.seq if self.sync is not None else None
+            if len(df):
+                self.catalog.add(df, embeddings, version=version)
+            if dead:
+                self.catalog.delete_rows(dead, version=version)
+        if self.sync is not None:
+            self.sync.published(checkpoint)
+        self.groups += 1
+        self.committed += len(df)
+        self.deleted += len(dead)
+
+        start = 0
+        for frame, (future, n_deleted) in zip(frames, accepted):
+            future.set_result((frame, embeddings[start:start + len(frame)], n_deleted))
+            start += len(frame)
+
+        if self.compact_ratio and checkpoint["tombstones"] >= max(1, self.compact_ratio * checkpoint["rows"]):
+            self.compact_in_background()
+
+    # -----------------------------
+    # Compaction
+    # -----------------------------
+    def compact(self) -> bool:
+        """Rewrites the CSV and the embeddings without tombstoned rows; False if there was nothing to remove."""
+
+        # Cùng lock với commit: lệnh ghi chờ, query vẫn đọc catalog trong RAM cho tới khi reload
+        with self._locked():
+            self._catch_up()
+            checkpoint = self._read_checkpoint()
+            if not checkpoint or not checkpoint.get("tombstones"):
+                return False
+
+            dead = np.zeros(checkpoint["rows"], dtype=bool)
+            dead[read_tombstones(self.meta_file, 0, checkpoint["tombstones"])] = True
+            plan = write_compacted(self.meta_file, self.emb_file, dead, self.store)
+            load_args = self.catalog.load_args if self.catalog is not None and self.catalog.load_args else {}
+            plan["derived"] = [str(p) for p in derived_files(
+                self.emb_file,
+                **{key: load_args[key] for key in ("index_file", "dedup_file") if key in load_args},
+            )]
+            plan["checkpoint"] = {"seq": max(self.seq, checkpoint["seq"]) + 1, "rows": plan["rows"],
+                                  "meta_bytes": plan["meta_bytes"], "tombstones": 0,
+                                  "generation": checkpoint.get("generation", 0) + 1}
+            # Từ đây file cũ có thể đã bị thay: recover làm tiếp phần còn lại theo marker
+            self._write_json(self.marker_file, plan)
+            self._finish_compaction(plan)
+            self.compactions += 1
+
+            if self.catalog is not None:
+                # Không có CatalogSync: nếu load lại lỗi thì thử lại trước nhóm commit sau
+                self._reload_pending = self.sync is None
+                self.catalog.reload(version=self.seq if self.sync is not None else None)
+                self._reload_pending = False
+            if self.sync is not None:
+                self.sync.published(plan["checkpoint"])
+        return True
+
+    def _finish_compaction(self, plan: dict):
+        """Swaps the compacted files in and checkpoints; every step can be redone."""
+
+        swap_compacted(plan, self.meta_file, self.emb_file, self.store)
+        self.seq = plan["checkpoint"]["seq"]
+        self._write_checkpoint(**{k: v for k, v in plan["checkpoint"].items() if k != "seq"})
+        self.marker_file.unlink(missing_ok=True)
+
+    def compact_in_background(self) -> threading.Thread:
+        """Starts `compact` in a daemon thread unless one is already running."""
+
+        if self._compaction is not None and self._compaction.is_alive():
+            return self._compaction
+        self._compaction = threading.Thread(target=self.compact, name="catalog-compaction", daemon=True)
+        self._compaction.start()
+        return self._compaction
+
+    # -----------------------------
+    # Luồng ghi
+    # -----------------------------
+    def start(self, catalog=None, sync=None) -> "IngestionWriter":
+        """Prepares the writer; `catalog` receives every committed group."""
+
+        # Thread ghi được tạo ở submit đầu tiên của mỗi process (writer tạo trước khi fork vẫn chạy)
+        if catalog is not None:
+            self.catalog = catalog
+        if sync is not None:
+            self.sync = sync
+        if self._read_checkpoint() is None:
+            # Mốc ban đầu để recover biết cắt file về đâu nếu nhóm đầu tiên ghi dở
+            size = os.path.getsize(self.meta_file) if self.meta_file.exists() else 0
+            self._write_checkpoint(self._embedding_rows(), size, tombstone_count(self.meta_file))
+        return self
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, args=(self._queue,), name="catalog-ingestion",
+                                                daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def close(self):
+        if self._pid == os.getpid():
+            self._queue.put(None)
+            self._thread.join()
+            self._pid = None
+
+    def _run(self, requests):
+        stop = False
+        while not stop:
+            first = requests.get()
+            if first is None:
+                break
+            group, n_items = [first], len(first[0]) + len(first[1])
+            deadline = time.monotonic() + self.max_wait
+            while n_items < self.max_group_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                group.append(item)
+                n_items += len(item[0]) + len(item[1])
+            self._commit(group)
+
+    def submit(self, items, delete=()) -> Future:
+        """Queues raw listings and ids to delete; the future resolves to (rows, embeddings, n deleted)."""
+
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((list(items), [str(i) for i in delete], future))
+        return future
+
+    # -----------------------------
+    # API giống process_and_add_item(s)
+    # -----------------------------
+    def add_item(self, data: dict) -> dict:
+        try:
+            df, embeddings, _ = self.submit([data]).result()
+            return {
+                "status": "success",
+                "semantic_text": df.loc[0, "semantic_text"],
+                "embedding_dim": int(embeddings.shape[1]),
+            }
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    def add_items(self, items) -> dict:
+        try:
+            df, embeddings, _ = self.submit(items).result()
+            if df.empty:
+                return {"status": "success", "added": 0}
+            return {"status": "success", "added": len(df), "embedding_dim": int(embeddings.shape[1])}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    def update_item(self, item_id, data: dict) -> dict:
+        """Replaces listing `item_id` with `data` (its old rows are tombstoned, the new one is added)."""
+
+        try:
+            df, embeddings, deleted = self.submit([{**data, "id": item_id}], delete=[item_id]).result()
+            return {
+                "status": "success",
+                "semantic_text": df.loc[0, "semantic_text"],
+                "embedding_dim": int(embeddings.shape[1]),
+                "replaced": deleted,
+            }
+        except ListingNotFound as e:
+            return {"status": "not_found", "message": str(e)}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    def delete_item(self, item_id) -> dict:
+        try:
+            _, _, deleted = self.submit([], delete=[item_id]).result()
+            return {"status": "success", "deleted": deleted}
+        except ListingNotFound as e:
+            return {"status": "not_found", "message": str(e)}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    def stats(self) -> dict:
+        return {
+            "groups": self.groups,
+            "committed": self.committed,
+            "deleted": self.deleted,
+            "compactions": self.compactions,
+            "mean_group_size": self.committed / self.groups if self.groups else 0.0,
+            "pending": self._queue.qsize() if self._pid == os.getpid() else 0,
+            "seq": self.seq,
+        }
@@ -0,0 +1,201 @@
+"""Quantized (float16 / int8) embedding storage with memory-mapped loading."""
+
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.api.services.rerank import grow_buffer
+from app.api.services.topk import top_k_indices
+
+EMB_DIR = Path(__file__).parent / "emb_files"
+
+# Số row dequantize mỗi lần khi quét: khối float32 nằm gọn trong cache CPU khi nhân với query
+SCAN_BLOCK = 8192
+
+
+class QuantizedEmbeddings:
+    """Embedding matrix stored as float16, or int8 with one scale per vector.
+
+    int8 codes are `round(x / scale)` with `scale = max|x| / 127`. Scoring
+    dequantizes block by block and multiplies by the per-row scale and the
+    inverse norm of the original vector, so the result approximates the
+    float32 cosine without ever materializing the float32 matrix.
+
+    Files are plain `.npy` (`<prefix>.<dtype>.npy`, `<prefix>.scale.npy`,
+    `<prefix>.invnorm.npy`) so they can be opened with `mmap_mode="r"` and
+    shared through the page cache by every worker on the host.
+    """
+
+    DTYPES = ("float16", "int8")
+
+    def __init__(self, codes: np.ndarray, scale: np.ndarray, inv_norm: np.ndarray):
+        self.codes = codes
+        self.scale = scale
+        self.inv_norm = inv_norm
+        self.dtype = "int8" if codes.dtype == np.int8 else "float16"
+        self.n_rows = len(codes)
+
+    @classmethod
+    def quantize(cls, vectors: np.ndarray, dtype: str = "int8") -> "QuantizedEmbeddings":
+        """Quantizes a float32 matrix."""
+
+        if dtype not in cls.DTYPES:
+            raise ValueError(f"Unknown quantization dtype: {dtype}")
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1)
+        norms[norms == 0] = 1.0
+        inv_norm = (1.0 / norms).astype(np.float32)
+
+        if dtype == "float16":
+            return cls(vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32), inv_norm)
+
+        scale = np.abs(vectors).max(axis=1) / 127.0
+        scale[scale == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scale[:, None]), -127, 127).astype(np.int8)
+        return cls(codes, scale.astype(np.float32), inv_norm)
+
+    # -----------------------------
+    # Lưu / load
+    # -----------------------------
+    @staticmethod
+    def paths(prefix, dtype: str):
+        prefix = str(prefix)
+        return Path(f"{prefix}.{dtype}.npy"), Path(f"{prefix}.scale.npy"), Path(f"{prefix}.invnorm.npy")
+
+    def save(self, prefix):
+        codes_path, scale_path, inv_path = self.paths(prefix, self.dtype)
+        # codes ghi sau cùng: load_or_build chỉ kiểm tra số row của file codes
+        for path, values in ((scale_path, self.scale), (inv_path, self.inv_norm), (codes_path, self.codes)):
+            tmp = path.with_name(path.name + ".tmp.npy")
+            np.save(tmp, values[:self.n_rows])
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, prefix, dtype: str = "int8", mmap: bool = True) -> "QuantizedEmbeddings":
+        mode = "r" if mmap else None
+        codes_path, scale_path, inv_path = cls.paths(prefix, dtype)
+        return cls(np.load(codes_path, mmap_mode=mode), np.load(scale_path, mmap_mode=mode),
+                   np.load(inv_path, mmap_mode=mode))
+
+    @classmethod
+    def load_or_build(cls, prefix, dense_loader, n_rows: int, dtype: str = "int8",
+                      mmap: bool = True) -> "QuantizedEmbeddings":
+        """Loads quantized files, re-quantizing from `dense_loader()` when missing or stale."""
+
+        codes_path = cls.paths(prefix, dtype)[0]
+        if codes_path.exists():
+            quantized = cls.load(prefix, dtype, mmap)
+            if len(quantized) == n_rows:
+                return quantized
+
+        cls.quantize(dense_loader(), dtype).save(prefix)
+        return cls.load(prefix, dtype, mmap)
+
+    # -----------------------------
+    # Truy cập kiểu ma trận
+    # -----------------------------
+    @property
+    def shape(self):
+        return (self.n_rows, self.codes.shape[1])
+
+    def __len__(self):
+        return self.n_rows
+
+    def __getitem__(self, rows):
+        """Dequantized float32 rows (scaled back, not normalized)."""
+
+        rows = np.arange(self.n_rows)[rows]
+        return self.codes[rows].astype(np.float32) * self.scale[rows, None]
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self[:]
+        return dense if dtype is None else dense.astype(dtype)
+
+    def append(self, vectors: np.ndarray):
+        """Quantizes and appends rows (copies a read-only memory map into RAM on first growth)."""
+
+        new = QuantizedEmbeddings.quantize(vectors, self.dtype)
+        needed = self.n_rows + len(new)
+        if needed > len(self.codes) or not self.codes.flags.writeable:
+            self.reserve(max(needed, 2 * self.n_rows, 16) - self.n_rows)
+        self.codes[self.n_rows:needed] = new.codes
+        self.scale[self.n_rows:needed] = new.scale
+        self.inv_norm[self.n_rows:needed] = new.inv_norm
+        self.n_rows = needed
+
+    def reserve(self, rows: int):
+        """Makes room for `rows` more rows (a read-only memory map is copied into RAM)."""
+
+        capacity = self.n_rows + rows
+        if capacity > len(self.codes) or not self.codes.flags.writeable:
+            capacity = max(capacity, len(self.codes))
+            self.codes = grow_buffer(self.codes, self.n_rows, capacity)
+            self.scale = grow_buffer(self.scale, self.n_rows, capacity)
+            self.inv_norm = grow_buffer(self.inv_norm, self.n_rows, capacity)
+
+    # -----------------------------
+    # Kernel tính điểm
+    # -----------------------------
+    def cos_scores(self, query_vecs: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        """(Q, len(rows)) approximate cosine of queries against rows, computed on the quantized codes."""
+
+        queries = np.atleast_2d(np.asarray(query_vecs, dtype=np.float32))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        queries_t = np.ascontiguousarray(queries.T)
+
+        if rows is not None:
+            codes = self.codes[rows].astype(np.float32)
+            return (codes @ queries_t).T * (self.scale[rows] * self.inv_norm[rows])
+
+        out = np.empty((len(queries), self.n_rows), dtype=np.float32)
+        for start in range(0, self.n_rows, SCAN_BLOCK):
+            end = min(start + SCAN_BLOCK, self.n_rows)
+            block = self.codes[start:end].astype(np.float32)
+            out[:, start:end] = (block @ queries_t).T * (self.scale[start:end] * self.inv_norm[start:end])
+        return out
+
+
+def recall_report(dense: np.ndarray, k: int = 100, n_queries: int = 200, seed: int = 0) -> dict:
+    """Recall@k and scan latency of float16 / int8 scoring against float32.
+
+    Queries are catalog rows perturbed with noise.
+    """
+
+    dense = np.asarray(dense, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    rows = dense[rng.choice(len(dense), min(n_queries, len(dense)), replace=False)]
+    queries = rows + rng.normal(0, 0.05, rows.shape).astype(np.float32)
+
+    normalized = dense / np.maximum(np.linalg.norm(dense, axis=1, keepdims=True), 1e-12)
+    q_norm = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+    def run(score_fn):
+        results, times = [], []
+        for q in q_norm:
+            start = time.perf_counter()
+            scores = score_fn(q)
+            results.append(top_k_indices(scores, k))
+            times.append((time.perf_counter() - start) * 1000)
+        return results, float(np.mean(times))
+
+    truth, float32_ms = run(lambda q: normalized @ q)
+    report = {"rows": len(dense), "k": k,
+              "float32": {"bytes": int(dense.nbytes), "mean_ms": float32_ms, "recall": 1.0}}
+    for dtype in QuantizedEmbeddings.DTYPES:
+        quantized = QuantizedEmbeddings.quantize(dense, dtype)
+        found, ms = run(lambda q: quantized.cos_scores(q)[0])
+        recall = np.mean([len(np.intersect1d(a, b)) / max(len(a), 1) for a, b in zip(truth, found)])
+        report[dtype] = {
+            "bytes": int(quantized.codes.nbytes + quantized.scale.nbytes + quantized.inv_norm.nbytes),
+            "mean_ms": ms,
+            "recall": float(recall),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    import json
+
+    print(json.dumps(recall_report(np.load(EMB_DIR / "semantic_vectors.npy")), indent=2))
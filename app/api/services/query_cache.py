@@ -0,0 +1,142 @@
+"""LRU cache of query embeddings with an optional on-disk tier."""
+
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Cache key for a semantic text: NFC, lowercased, whitespace collapsed.
+
+    all-MiniLM-L6-v2 lowercases its input, so texts sharing a key encode to
+    the same vector.
+    """
+
+    text = unicodedata.normalize("NFC", text or "")
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU of query vectors keyed on the normalized semantic text.
+
+    When `disk_path` is set, every encoded vector is also written to a SQLite
+    file; memory misses are looked up there before encoding, so the warm set
+    survives restarts.
+    """
+
+    def __init__(self, maxsize: int = 4096, disk_path: str = None):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.disk_path = disk_path
+        self._db = None
+        self._db_pid = None
+        if disk_path:
+            self._connect()
+
+    def _connect(self):
+        # Connection SQLite không dùng chung được qua fork: mỗi process (worker) mở connection riêng
+        self._db = sqlite3.connect(self.disk_path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS query_vectors (key TEXT PRIMARY KEY, vector BLOB)")
+        self._db.commit()
+        self._db_pid = os.getpid()
+
+    @property
+    def db(self):
+        if self._db is not None and self._db_pid != os.getpid():
+            self._connect()
+        return self._db
+
+    def __len__(self):
+        return len(self._items)
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._items[key] = vector
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def get(self, key: str):
+        """Returns the cached vector for `key` or None."""
+
+        with self._lock:
+            vector = self._items.get(key)
+            if vector is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return vector
+
+            if self.db is not None:
+                row = self.db.execute("SELECT vector FROM query_vectors WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put_many(self, keys, vectors):
+        """Stores vectors in memory and, if enabled, on disk."""
+
+        vectors = [np.asarray(v, dtype=np.float32) for v in vectors]
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector)
+            if self.db is not None:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO query_vectors (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in zip(keys, vectors)],
+                )
+                self.db.commit()
+
+    def encode(self, model, texts) -> np.ndarray:
+        """Returns normalized embeddings of `texts`, encoding only cache misses.
+
+        All misses are encoded together in a single `model.encode` call.
+        """
+
+        keys = [normalize_text(t) for t in texts]
+        vectors = [self.get(key) for key in keys]
+
+        missing = list(dict.fromkeys(k for k, v in zip(keys, vectors) if v is None))
+        if missing:
+            encoded = model.encode(missing, normalize_embeddings=True)
+            self.put_many(missing, encoded)
+            fresh = dict(zip(missing, encoded))
+            vectors = [fresh[k] if v is None else v for k, v in zip(keys, vectors)]
+
+        return np.stack(vectors).astype(np.float32, copy=False)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size."""
+
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._items),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "disk_tier": self._db is not None,
+            }
+
+
+def encode_queries(model, texts, cache: QueryEmbeddingCache = None) -> np.ndarray:
+    """Encodes query texts, going through `cache` when one is given."""
+
+    if cache is None:
+        return model.encode(list(texts), normalize_embeddings=True)
+    return cache.encode(model, texts)
@@ -1,26 +1,31 @@
 # app/api/services/recommend_service.py
 import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
-from math import radians, sin, cos, sqrt, atan2
-import re
 import os
 from pathlib import Path
-from typing import Dict
+from typing import TYPE_CHECKING, Dict
 import csv
+
+from app.api.services.rerank import CatalogArrays, rerank_scores
+from app.api.services.topk import top_k_indices
+from app.api.services.geo_index import GeoGridIndex
+from app.api.services.filter_index import FilterIndex
+from app.api.services.query_cache import encode_queries
+from app.api.services.dedup_embeddings import DedupEmbeddings, DEDUP_FILE
+from app.api.services.quantization import QuantizedEmbeddings
+from app.api.services.catalog_snapshot import load_snapshot, save_snapshot
+from app.api.services.units import parse_price, parse_price_column, parse_quantity, parse_quantity_column
+
+if TYPE_CHECKING:
+    # Chỉ dùng cho type hint: import torch mất vài giây, không để chặn lúc import module
+    from sentence_transformers import SentenceTransformer
+
 # -----------------------------
 # Tiền xử lý
 # -----------------------------
 def safe_str(x):
     return "" if pd.isna(x) else str(x).strip()
 
-def extract_number(x):
-    if x is None or pd.isna(x): 
-        return np.nan
-    s = str(x).replace(".", "").replace(",", ".")
-    nums = re.findall(r"[\d\.]+", s)
-    return float(nums[0]) if nums else np.nan
-
 def extract_province(address):
     if not address or pd.isna(address):
         return ""
@@ -38,123 +43,303 @@ META_FILE = EMB_DIR / "product_metadata_nopro.csv"
 
 def load_data(    
               emb_file=EMB_DIR / "semantic_vectors.npy",
-    meta_file=EMB_DIR / "product_metadata_nopro.csv"
+    meta_file=EMB_DIR / "product_metadata_nopro.csv",
+    storage="dense",
+    dedup_file=DEDUP_FILE,
+    store=None,
+    mmap=False,
+    snapshot=True
 ):
-    embeddings = np.load(emb_file)
-    df = pd.read_csv(meta_file, quotechar='"')
-    
-    # Preprocess semantic fields
-    df["province"]     = df["address"].apply(lambda x: extract_province(x) if pd.notna(x) else "")
-    df["categoryName"] = df["categoryName"].apply(safe_str)
-    df["productName"]  = df["productName"].apply(safe_str)
-    
-    # Preprocess numerical fields
-    df["price_num"]    = df["price"].apply(lambda x: extract_number(x) if pd.notna(x) else np.nan)
-    df["quantity_num"] = df["quantity"].apply(lambda x: extract_number(x) if pd.notna(x) else np.nan)
-    
-    # Lat/Lon
-    df["latitude"]  = df["latitude"].astype(float).fillna(np.nan)
-    df["longitude"] = df["longitude"].astype(float).fillna(np.nan)
-    
-    return embeddings, df
+    """
+    storage: "dense" (1 vector / listing), "dedup" (1 vector / semantic_text, xem DedupEmbeddings)
+             hoặc "float16" / "int8" (lượng tử hoá, xem QuantizedEmbeddings)
+    store: SegmentedEmbeddingStore; nếu có thì đọc embeddings từ store thay vì emb_file
+    mmap: mở file embeddings bằng memory map chỉ đọc (dùng chung page cache giữa các worker)
+    snapshot: đọc metadata đã tiền xử lý từ snapshot (catalog_snapshot.py) nếu còn mới,
+              nếu không thì parse CSV và ghi lại snapshot
+    """
+    df = load_snapshot(meta_file) if snapshot else None
+    if df is None:
+        df = pd.read_csv(meta_file, quotechar='"')
+
+        # Preprocess semantic fields
+        df["province"]     = df["address"].apply(lambda x: extract_province(x) if pd.notna(x) else "")
+        df["categoryName"] = df["categoryName"].apply(safe_str)
+        df["productName"]  = df["productName"].apply(safe_str)
+
+        # Preprocess numerical fields
+        df["price_num"]    = parse_price_column(df["price"])
+        df["quantity_num"] = parse_quantity_column(df["quantity"])
+
+        # Lat/Lon
+        df["latitude"]  = df["latitude"].astype(float).fillna(np.nan)
+        df["longitude"] = df["longitude"].astype(float).fillna(np.nan)
+
+        if snapshot:
+            try:
+                save_snapshot(df, meta_file)
+            except OSError as e:
+                # Snapshot chỉ để khởi động nhanh, không ghi được thì bỏ qua
+                print(f"⚠️ Không ghi được snapshot catalog: {e}")
+
+    embeddings = load_embeddings(emb_file, df, storage, dedup_file, store, mmap)
+    if len(embeddings) != len(df):
+        raise ValueError(
+            f"Catalog mismatch: {len(df)} metadata rows vs {len(embeddings)} vectors "
+            f"({meta_file}); chạy IngestionWriter.recover() hoặc import lại catalog"
+        )
+
+    # Cột numpy liên tục cho bước re-rank
+    arrays = CatalogArrays.from_dataframe(df)
+
+    return embeddings, df, arrays
+def load_embeddings(emb_file, df, storage="dense", dedup_file=DEDUP_FILE, store=None, mmap=False):
+    """Load embeddings theo chế độ lưu trữ; file dedup / lượng tử cũ (lệch số row) sẽ được dựng lại"""
+    def load_dense():
+        if store is not None:
+            return store.load(mmap=mmap)
+        return np.load(emb_file, mmap_mode="r" if mmap else None)
+
+    if storage == "dense":
+        return normalize_rows(load_dense())
+    if storage in QuantizedEmbeddings.DTYPES:
+        prefix = os.path.splitext(str(emb_file))[0]
+        return QuantizedEmbeddings.load_or_build(prefix, load_dense, len(df), dtype=storage, mmap=mmap)
+    if storage != "dedup":
+        raise ValueError(f"Unknown embedding storage: {storage}")
+
+    if os.path.exists(dedup_file):
+        embeddings = DedupEmbeddings.load(dedup_file)
+        if len(embeddings) == len(df):
+            return embeddings
+
+    embeddings = DedupEmbeddings.from_dense(load_dense(), df["semantic_text"].fillna(""))
+    embeddings.save(dedup_file)
+    return embeddings
+
+def normalize_rows(matrix, block_rows=65536):
+    """
+    Ma trận float32 liên tục với các row đã chuẩn hoá (buffer dùng để tính điểm).
+    Nếu file đã lưu vector chuẩn hoá (process_and_add_item / catalog_import encode với
+    normalize_embeddings=True) thì trả về nguyên matrix, không copy, giữ memory map.
+    """
+    matrix = np.asarray(matrix)
+    if matrix.dtype == np.float32 and matrix.flags.c_contiguous:
+        is_unit = all(
+            np.allclose(np.einsum("ij,ij->i", block, block), 1.0, atol=1e-4)
+            for block in (matrix[i:i + block_rows] for i in range(0, len(matrix), block_rows))
+        )
+        if is_unit:
+            return matrix
+
+    out = np.array(matrix, dtype=np.float32, order="C")
+    for i in range(0, len(out), block_rows):
+        block = out[i:i + block_rows]
+        block /= np.maximum(np.sqrt(np.einsum("ij,ij->i", block, block)), 1e-12)[:, None]
+    return out
+
+# Số row / khối khi tính điểm trên ma trận dense (các shard của sharding.py cắt theo bội số này)
+SCORE_BLOCK_ROWS = 4096
+
+def cos_scores(query_vecs, embeddings, rows=None):
+    """
+    Cosine (Q x rows). Ma trận dense phải có row đã chuẩn hoá (xem normalize_rows), nên chỉ cần
+    nhân ma trận, không copy / chuyển đổi catalog mỗi request.
+    DedupEmbeddings / QuantizedEmbeddings dùng kernel riêng.
+    """
+    if isinstance(embeddings, (DedupEmbeddings, QuantizedEmbeddings)):
+        return embeddings.cos_scores(query_vecs, rows)
+    queries = np.atleast_2d(np.asarray(query_vecs, dtype=np.float32))
+    queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    return dense_scores(queries, embeddings, rows)
+
+def dense_scores(queries, matrix, rows=None, block_rows=None):
+    """
+    queries (Q x D) . matrix[rows].T, tính theo từng khối block_rows row căn theo vị trí row.
+    BLAS cho kết quả lệch nhau ở bit cuối tuỳ kích thước ma trận, nên điểm của 1 row chỉ được
+    phụ thuộc vào khối chứa nó: cả khối nhân bằng BLAS, hoặc (khi rows chỉ lấy ít row của khối)
+    einsum theo từng row. Nhờ vậy 1 shard giữ các khối nguyên vẹn cho đúng điểm như khi quét
+    toàn bộ catalog.
+    """
+    block_rows = block_rows or SCORE_BLOCK_ROWS
+    if rows is None:
+        out = np.empty((len(queries), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), block_rows):
+            np.matmul(queries, matrix[start:start + block_rows].T, out=out[:, start:start + block_rows])
+        return out
+
+    rows = np.asarray(rows)
+    out = np.empty((len(queries), len(rows)), dtype=np.float32)
+    blocks = rows // block_rows
+    order = np.argsort(blocks, kind="stable")
+    block_ids, first = np.unique(blocks[order], return_index=True)
+    for block_id, positions in zip(block_ids, np.split(order, first[1:])):
+        start = block_id * block_rows
+        block = matrix[start:start + block_rows]
+        local = rows[positions] - start
+        if 4 * len(local) >= len(block):
+            out[:, positions] = (queries @ block.T)[:, local]
+        else:
+            out[:, positions] = np.einsum("qj,ij->qi", queries, block[local])
+    return out
+
 # -----------------------------
 # Cập nhật metadata và embeddings nếu cần
 # -----------------------------
 
-import os
-import csv
-import pandas as pd
-import numpy as np
-from sentence_transformers import SentenceTransformer
+# Cột chuẩn của metadata CSV
+META_COLUMNS = [
+    "id", "categoryName", "productName", "price", "quantity",
+    "latitude", "longitude", "address", "province",
+    "price_num", "quantity_num", "semantic_text"
+]
 
-# File paths (đặt đúng với project)
-EMB_FILE = "emb_files/semantic_vectors.npy"
-META_FILE = "emb_files/product_metadata_nopro.csv"
+def preprocess_items(df):
+    """Tiền xử lý DataFrame listing thô (từ client / file import) về đúng META_COLUMNS"""
+    # Drop các cột không cần thiết
+    df = df.drop(columns=["title", "content"], errors="ignore").reset_index(drop=True)
 
-# Hàm tiền xử lý
-def safe_str(x):
-    return "" if pd.isna(x) else str(x).strip()
+    # Tiền xử lý semantic fields
+    df["province"]     = df["address"].apply(extract_province)
+    df["categoryName"] = df["categoryName"].apply(safe_str)
+    df["productName"]  = df["productName"].apply(safe_str)
 
-def extract_number(x):
-    if pd.isna(x) or x is None: 
-        return np.nan
-    x = str(x).replace(".", "").replace(",", ".")
-    nums = re.findall(r"[\d\.]+", x)
-    return float(nums[0]) if nums else np.nan
+    # Tiền xử lý numerical fields
+    df["price_num"]    = parse_price_column(df["price"])
+    df["quantity_num"] = parse_quantity_column(df["quantity"])
 
-def extract_province(address):
-    if not address or pd.isna(address):
-        return ""
-    parts = [p.strip() for p in address.split(",")]
-    return ", ".join(parts[-2:]) if len(parts) >= 2 else address.strip()
+    # Lat/Lon
+    df["latitude"]  = df["latitude"].astype(float)
+    df["longitude"] = df["longitude"].astype(float)
+
+    # Tạo semantic_text
+    df["semantic_text"] = (
+        df["categoryName"] + " | " +
+        df["productName"]
+    ).apply(safe_str)
+
+    # Sắp xếp lại thứ tự cột chuẩn
+    return df[META_COLUMNS]
+
+def append_metadata(df, meta_file=None):
+    """Append các row đã tiền xử lý vào metadata CSV (1 lần ghi, fsync); trả về kích thước file sau khi ghi"""
+    meta_file = meta_file or EMB_DIR / "product_metadata_nopro.csv"
+    header = not os.path.exists(meta_file)
+    with open(meta_file, "a", newline="", encoding="utf-8") as f:
+        df.to_csv(f, header=header, index=False, quoting=csv.QUOTE_ALL)
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+def _npy_rows_header(f):
+    """(shape, dtype, số byte trước header, offset của data) của file .npy 2 chiều đang mở;
+    None nếu header không sửa tại chỗ được"""
+    version = np.lib.format.read_magic(f)
+    if version not in ((1, 0), (2, 0)):
+        return None
+    read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+    shape, fortran_order, dtype = read_header(f)
+    if fortran_order or len(shape) != 2:
+        return None
+    return shape, dtype, 10 if version == (1, 0) else 12, f.tell()
+
+def _npy_rows_header_bytes(shape, dtype, prefix, offset, rows):
+    """Header với số row mới, cùng độ dài header cũ; None nếu không vừa"""
+    header = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (rows, shape[1])})
+    if len(header) + 1 > offset - prefix:
+        return None
+    return (header.ljust(offset - prefix - 1) + "\n").encode("latin1")
+
+def resize_npy_rows(emb_file, rows=None, vectors=None):
+    """
+    Đổi số row của file .npy 2 chiều tại chỗ: giữ `rows` row đầu (mặc định: tất cả), ghi `vectors`
+    (nếu có) sau chúng và cắt phần thừa, ghi số row mới vào header (numpy chừa chỗ cho số row
+    lớn hơn): sau phần data khi file lớn lên, trước khi cắt khi file nhỏ đi. Crash giữa chừng để
+    lại header khớp với file; các byte thừa bị ghi đè / cắt ở lần sau.
+    Trả về False (file không đổi) nếu phải ghi lại cả file.
+    """
+    with open(emb_file, "r+b") as f:
+        layout = _npy_rows_header(f)
+        if layout is None:
+            return False
+        shape, dtype, prefix, offset = layout
+        rows = shape[0] if rows is None else rows
+        if vectors is not None and vectors.shape[1] != shape[1]:
+            raise ValueError(f"Embedding dim {vectors.shape[1]} != {shape[1]} of {emb_file}")
+        new_rows = rows + (len(vectors) if vectors is not None else 0)
+        header = _npy_rows_header_bytes(shape, dtype, prefix, offset, new_rows)
+        if header is None:
+            return False
+        # Header không bao giờ khai nhiều row hơn số byte có trong file: khi thu nhỏ thì ghi header trước
+        shrink = new_rows < shape[0]
+        if shrink:
+            _write_npy_header(f, prefix, header)
+        f.seek(offset + rows * shape[1] * dtype.itemsize)
+        if vectors is not None:
+            f.write(np.ascontiguousarray(vectors, dtype=dtype).tobytes())
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+        if not shrink:
+            _write_npy_header(f, prefix, header)
+        return True
+
+def _write_npy_header(f, prefix, header):
+    f.seek(prefix)
+    f.write(header)
+    f.flush()
+    os.fsync(f.fileno())
+
+def append_embeddings(vectors, store=None, emb_file=None):
+    """
+    Append embeddings vào store (O(1)) hoặc semantic_vectors.npy: ghi thêm vào cuối file
+    rồi sửa số row trong header (resize_npy_rows); chỉ ghi lại cả file ra file tạm rồi
+    os.replace khi header không sửa tại chỗ được
+    """
+    vectors = np.atleast_2d(vectors)
+    emb_file = emb_file or EMB_DIR / "semantic_vectors.npy"
+    if store is not None:
+        store.append(vectors)
+        return
+    if os.path.exists(emb_file) and resize_npy_rows(emb_file, vectors=vectors):
+        return
+    tmp = str(emb_file) + ".tmp.npy"
+    if not os.path.exists(emb_file):
+        np.save(tmp, vectors)
+    else:
+        old = np.load(emb_file, mmap_mode="r")
+        np.save(tmp, np.vstack([old, vectors]))
+        del old
+    os.replace(tmp, emb_file)
 
 # Hàm xử lý và thêm item
-def process_and_add_item(data: dict, model: SentenceTransformer):
+def process_and_add_item(data: dict, model: "SentenceTransformer", store=None, catalog=None, meta_file=None,
+                         emb_file=None):
     """
     data: dict chứa item mới từ client
     model: SentenceTransformer đã được load
+    store: SegmentedEmbeddingStore (nếu có) để append vào segment thay vì semantic_vectors.npy
+    catalog: Catalog đang phục vụ (nếu có); row mới được áp dụng vào RAM ngay,
+             gồm cả các index của catalog
+    meta_file / emb_file: file catalog cần ghi (mặc định là file trong EMB_DIR)
     """
-    import re
-    import csv
-
     try:
-        # 1. Chuyển dữ liệu thành DataFrame
-        df = pd.DataFrame([data])
-
-        # 2. Drop các cột không cần thiết
-        df = df.drop(columns=["title", "content"], errors="ignore")
-
-        # 3. Tiền xử lý semantic fields
-        df["province"]     = df["address"].apply(extract_province)
-        df["categoryName"] = df["categoryName"].apply(safe_str)
-        df["productName"]  = df["productName"].apply(safe_str)
-
-        # 4. Tiền xử lý numerical fields
-        df["price_num"]    = df["price"].apply(extract_number)
-        df["quantity_num"] = df["quantity"].apply(extract_number)
-
-        # 5. Lat/Lon
-        df["latitude"]  = df["latitude"].astype(float)
-        df["longitude"] = df["longitude"].astype(float)
-
-        # 6. Tạo semantic_text
-        df["semantic_text"] = (
-            df["categoryName"] + " | " +
-            df["productName"]
-        ).apply(safe_str)
-
-        # 7. Sắp xếp lại thứ tự cột chuẩn
-        df = df[
-            [
-                "id", "categoryName", "productName", "price", "quantity",
-                "latitude", "longitude", "address", "province",
-                "price_num", "quantity_num", "semantic_text"
-            ]
-        ]
-
+        # 1-7. Chuyển dữ liệu thành DataFrame và tiền xử lý
+        df = preprocess_items(pd.DataFrame([data]))
         semantic_text = df.loc[0, "semantic_text"]
-        META_FILE = EMB_DIR / "product_metadata_nopro.csv"
 
         # 8. Append metadata vào CSV trước
-        df.to_csv(
-            META_FILE,
-            mode="a",
-            header=not os.path.exists(META_FILE),
-            index=False,
-            quoting=csv.QUOTE_ALL
-        )
+        append_metadata(df, meta_file)
 
         # 9. Nếu metadata ghi thành công thì tạo embedding
         embedding = model.encode(semantic_text, normalize_embeddings=True)
-        EMB_FILE = EMB_DIR / "semantic_vectors.npy"
 
-        # 10. Append embedding vào semantic_vectors.npy
-        if not os.path.exists(EMB_FILE):
-            np.save(EMB_FILE, embedding.reshape(1, -1))
-        else:
-            old = np.load(EMB_FILE)
-            new_vectors = np.vstack([old, embedding.reshape(1, -1)])
-            np.save(EMB_FILE, new_vectors)
+        # 10. Append embedding vào store / semantic_vectors.npy
+        append_embeddings(embedding.reshape(1, -1), store, emb_file)
+
+        # 11. Cập nhật catalog / các index trong RAM
+        if catalog is not None:
+            catalog.add(df, embedding.reshape(1, -1))
 
         return {
             "status": "success",
@@ -168,55 +353,183 @@ def process_and_add_item(data: dict, model: SentenceTransformer):
             "message": str(e)
         }
 
+def process_and_add_items(items, model: "SentenceTransformer", store=None, catalog=None, batch_size=256,
+                          meta_file=None, emb_file=None):
+    """
+    Thêm nhiều item cùng lúc: tiền xử lý theo cột, encode theo batch lớn,
+    1 lần append CSV và 1 lần append embeddings cho cả lô.
+    """
+    try:
+        df = preprocess_items(pd.DataFrame(list(items)))
+        if df.empty:
+            return {"status": "success", "added": 0}
+
+        append_metadata(df, meta_file)
+        embeddings = model.encode(df["semantic_text"].tolist(), batch_size=batch_size,
+                                  normalize_embeddings=True)
+        append_embeddings(embeddings, store, emb_file)
+
+        if catalog is not None:
+            catalog.add(df, embeddings)
+
+        return {
+            "status": "success",
+            "added": len(df),
+            "embedding_dim": int(embeddings.shape[1])
+        }
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
 
-# -----------------------------
-# Similarity cơ bản
-# -----------------------------
-def price_similarity(p1, p2):
-    if np.isnan(p1) or np.isnan(p2): return 0.0
-    return max(0.0, 1 - abs(p1-p2)/max(p1,p2))
-
-def quantity_similarity(q1, q2):
-    if np.isnan(q1) or np.isnan(q2): return 0.0
-    return max(0.0, 1 - abs(q1-q2)/max(q1,q2))
-
-def location_similarity(lat1, lon1, lat2, lon2, max_km=50):
-    if np.isnan(lat1) or np.isnan(lat2) or np.isnan(lon1) or np.isnan(lon2):
-        return 0.0
-    R = 6371
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat/2)**2 + cos(radians(lat1))*cos(radians(lat2))*sin(dlon/2)**2
-    c = 2*atan2(sqrt(a), sqrt(1-a))
-    dist = R * c
-    return max(0.0, 1 - dist/max_km)
 
 # -----------------------------
 # Hàm recommend từ query dict
 # -----------------------------
-def recommend(query, embeddings, df, model, top_k=20, alpha=0.6, beta=0.1, gamma=0.2, delta=0.1):
+def parse_query(query):
+    """Chuẩn hoá query dict thành semantic_text và các giá trị số"""
     province = extract_province(query.get("address",""))
     category = query.get("categoryName","") or ""
     product = query.get("productName","") or ""
-    price = extract_number(query.get("price", np.nan))
-    quantity = extract_number(query.get("quantity", np.nan))
-    latitude = float(query.get("latitude", np.nan))
-    longitude = float(query.get("longitude", np.nan))
+    return {
+        "semantic_text": f"{province} | {category} | {product}",
+        "price": parse_price(query.get("price", np.nan)),
+        "quantity": parse_quantity(query.get("quantity", np.nan)),
+        "latitude": float(query.get("latitude", np.nan)),
+        "longitude": float(query.get("longitude", np.nan)),
+    }
+
+def filter_rows(filters, filter_index=None, df=None):
+    """Row id khớp filters (FilterIndex.lookup), None nếu không có filter"""
+    if not filters or all(v is None or v == "" for v in filters.values()):
+        return None
+    if filter_index is None:
+        filter_index = FilterIndex.from_dataframe(df)
+    return filter_index.lookup(**filters)
+
+def semantic_candidates(query_vec, parsed, embeddings, arrays, candidate_k=100, index=None,
+                        radius_km=None, geo_index=None, semantic_scores=None, rows=None, deleted=None):
+    """
+    Trả về (candidate_idx, candidate_scores) theo semantic score.
+    semantic_scores: cosine với toàn bộ catalog nếu đã tính sẵn (batch)
+    rows: row id (đã sắp xếp) còn lại sau các filter; chỉ tính semantic score trên các row này
+    deleted: tombstone theo row (Catalog.deleted, True = đã xoá); row đã xoá không bao giờ là ứng viên
+    """
+    if radius_km is not None:
+        # Lọc theo không gian trước, chỉ tính semantic score trên vùng lân cận
+        if geo_index is None:
+            geo_index = GeoGridIndex.from_arrays(arrays.latitude, arrays.longitude)
+        nearby = geo_index.query_radius(parsed["latitude"], parsed["longitude"], radius_km)
+        rows = nearby if rows is None else np.intersect1d(rows, nearby, assume_unique=True)
+
+    if rows is not None:
+        # Geo / filter index được cập nhật tại chỗ: có thể trả về row thêm sau khi lấy `embeddings`
+        rows = rows[rows < min(len(arrays), len(embeddings))]
+        if deleted is not None:
+            rows = rows[~deleted[rows]]
+        if len(rows) == 0:
+            return rows, np.empty(0, dtype=np.float64)
+        if semantic_scores is None:
+            local_scores = cos_scores(query_vec, embeddings, rows)[0]
+        else:
+            local_scores = semantic_scores[rows]
+        local_idx = top_k_indices(local_scores, candidate_k)
+        return rows[local_idx], local_scores[local_idx]
+
+    if index is not None and semantic_scores is None:
+        # Lấy dư đúng số row đã xoá (vẫn còn trong index) để còn đủ candidate_k ứng viên
+        n_deleted = 0 if deleted is None else int(np.count_nonzero(deleted[:len(arrays)]))
+        candidate_idx, candidate_scores = index.search(query_vec, candidate_k + n_deleted)
+        # Bỏ các row đã có trong index nhưng chưa có trong arrays
+        keep = candidate_idx < len(arrays)
+        if deleted is not None:
+            keep[keep] = ~deleted[candidate_idx[keep]]
+        return candidate_idx[keep][:candidate_k], candidate_scores[keep][:candidate_k]
+
+    if semantic_scores is None:
+        semantic_scores = cos_scores(query_vec, embeddings)[0]
+    if deleted is not None:
+        # Không sửa tại chỗ: semantic_scores có thể là 1 dòng trong điểm của cả batch
+        semantic_scores = np.where(deleted[:len(semantic_scores)], -np.inf, semantic_scores)
+    candidate_idx = top_k_indices(semantic_scores, candidate_k)
+    if deleted is not None:
+        candidate_idx = candidate_idx[~deleted[candidate_idx]]
+    return candidate_idx, semantic_scores[candidate_idx]
+
+def rerank_top(parsed, candidate_idx, candidate_scores, arrays, top_k=20,
+               alpha=0.6, beta=0.1, gamma=0.2, delta=0.1, radius_km=None):
+    """Re-rank ứng viên và trả về list (id, score) đã sắp xếp"""
+    final_scores = rerank_scores(
+        candidate_idx, np.asarray(candidate_scores, dtype=np.float64), arrays,
+        parsed["price"], parsed["quantity"], parsed["latitude"], parsed["longitude"],
+        alpha=alpha, beta=beta, gamma=gamma, delta=delta,
+        max_km=radius_km or 50,
+    )
+
+    order = top_k_indices(final_scores, top_k)
+    return [(arrays.ids[candidate_idx[i]], float(final_scores[i])) for i in order]
+
+def recommend(query, embeddings, df, model, top_k=20, alpha=0.6, beta=0.1, gamma=0.2, delta=0.1,
+              candidate_k=100, arrays=None, index=None, radius_km=None, geo_index=None,
+              query_cache=None, filters=None, filter_index=None, deleted=None):
+    """
+    embeddings: ma trận dense đã chuẩn hoá theo row (load_data / normalize_rows),
+                DedupEmbeddings hoặc QuantizedEmbeddings
+    candidate_k: số ứng viên lấy theo semantic score trước khi re-rank
+    arrays: CatalogArrays dựng sẵn trong load_data (nếu None sẽ dựng từ df)
+    index: ANN index (ann_index.py); nếu None thì quét toàn bộ embeddings
+    radius_km: chỉ xét các listing trong bán kính này quanh (latitude, longitude)
+    geo_index: GeoGridIndex dùng cho radius_km (nếu None sẽ dựng từ arrays)
+    query_cache: QueryEmbeddingCache để bỏ qua encode khi query đã gặp
+    filters: dict {"category", "province", "product"} -> giá trị và/hoặc
+             {"price_min", "price_max" (đ/kg), "qty_min", "qty_max" (kg)} -> cận; chỉ xét các listing khớp
+    filter_index: FilterIndex dùng cho filters (nếu None sẽ dựng từ df)
+    deleted: tombstone theo row (Catalog.deleted); listing đã xoá không được trả về
+    """
+    if arrays is None:
+        arrays = CatalogArrays.from_dataframe(df)
+
+    parsed = parse_query(query)
+    query_vec = encode_queries(model, [parsed["semantic_text"]], query_cache)[0]
+
+    candidate_idx, candidate_scores = semantic_candidates(
+        query_vec, parsed, embeddings, arrays, candidate_k=candidate_k, index=index,
+        radius_km=radius_km, geo_index=geo_index, rows=filter_rows(filters, filter_index, df), deleted=deleted,
+    )
+    return rerank_top(parsed, candidate_idx, candidate_scores, arrays, top_k=top_k,
+                      alpha=alpha, beta=beta, gamma=gamma, delta=delta, radius_km=radius_km)
+
+def recommend_batch(queries, embeddings, df, model, top_k=20, alpha=0.6, beta=0.1, gamma=0.2, delta=0.1,
+                    candidate_k=100, arrays=None, index=None, radius_km=None, geo_index=None,
+                    query_cache=None, filters=None, filter_index=None, deleted=None):
+    """
+    Recommend cho nhiều query cùng lúc: 1 lần encode cho toàn bộ semantic_text
+    và 1 phép nhân ma trận (Q x D) . (D x N) khi quét toàn bộ catalog.
+    filters áp dụng cho mọi query trong batch; deleted như recommend().
+    Trả về list kết quả theo đúng thứ tự queries.
+    """
+    if arrays is None:
+        arrays = CatalogArrays.from_dataframe(df)
+    if not queries:
+        return []
 
-    semantic_text = f"{province} | {category} | {product}"
-    query_vec = model.encode([semantic_text], normalize_embeddings=True)[0]
+    parsed = [parse_query(q) for q in queries]
+    query_vecs = encode_queries(model, [p["semantic_text"] for p in parsed], query_cache)
 
-    semantic_scores = util.cos_sim(query_vec, embeddings)[0].cpu().numpy()
-    top100_idx = semantic_scores.argsort()[-100:][::-1]
+    rows = filter_rows(filters, filter_index, df)
+    all_scores = [None] * len(parsed)
+    if index is None and radius_km is None and rows is None:
+        all_scores = cos_scores(query_vecs, embeddings)
 
     results = []
-    for idx in top100_idx:
-        sem_score = float(semantic_scores[idx])
-        pri_score = price_similarity(price, df.loc[idx,"price_num"])
-        loc_score = location_similarity(latitude, longitude, df.loc[idx,"latitude"], df.loc[idx,"longitude"])
-        qty_score = quantity_similarity(quantity, df.loc[idx,"quantity_num"])
-        final_score = alpha*sem_score + beta*pri_score + gamma*loc_score + delta*qty_score
-        results.append((df.loc[idx,"id"], final_score))
-
-    results = sorted(results, key=lambda x: x[1], reverse=True)[:top_k]
+    for p, query_vec, semantic_scores in zip(parsed, query_vecs, all_scores):
+        candidate_idx, candidate_scores = semantic_candidates(
+            query_vec, p, embeddings, arrays, candidate_k=candidate_k, index=index,
+            radius_km=radius_km, geo_index=geo_index, semantic_scores=semantic_scores, rows=rows,
+            deleted=deleted,
+        )
+        results.append(rerank_top(p, candidate_idx, candidate_scores, arrays, top_k=top_k,
+                                  alpha=alpha, beta=beta, gamma=gamma, delta=delta, radius_km=radius_km))
     return results
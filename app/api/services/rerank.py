@@ -0,0 +1,150 @@
+"""Vectorized re-ranking stage for the recommendation service."""
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class CatalogArrays:
+    """NumPy columns of the catalog read when re-ranking (instead of `df.loc` per row).
+
+    Buffers keep spare capacity; the attributes are views of the filled part.
+    """
+
+    COLUMNS = ("price_num", "quantity_num", "latitude", "longitude")
+
+    def __init__(self, ids, price_num, quantity_num, latitude, longitude):
+        self._ids = np.asarray(ids, dtype=object)
+        self._columns = {
+            "price_num": np.ascontiguousarray(price_num, dtype=np.float64),
+            "quantity_num": np.ascontiguousarray(quantity_num, dtype=np.float64),
+            "latitude": np.ascontiguousarray(latitude, dtype=np.float64),
+            "longitude": np.ascontiguousarray(longitude, dtype=np.float64),
+        }
+        self.size = len(self._ids)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "CatalogArrays":
+        """Builds the arrays from a DataFrame returned by `load_data`."""
+
+        return cls(
+            ids=df["id"].to_numpy(dtype=object),
+            price_num=df["price_num"].to_numpy(dtype=np.float64, na_value=np.nan),
+            quantity_num=df["quantity_num"].to_numpy(dtype=np.float64, na_value=np.nan),
+            latitude=df["latitude"].to_numpy(dtype=np.float64, na_value=np.nan),
+            longitude=df["longitude"].to_numpy(dtype=np.float64, na_value=np.nan),
+        )
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self.size]
+
+    @property
+    def price_num(self) -> np.ndarray:
+        return self._columns["price_num"][:self.size]
+
+    @property
+    def quantity_num(self) -> np.ndarray:
+        return self._columns["quantity_num"][:self.size]
+
+    @property
+    def latitude(self) -> np.ndarray:
+        return self._columns["latitude"][:self.size]
+
+    @property
+    def longitude(self) -> np.ndarray:
+        return self._columns["longitude"][:self.size]
+
+    def append_dataframe(self, df: pd.DataFrame):
+        """Appends preprocessed rows (same columns as `from_dataframe`)."""
+
+        new = CatalogArrays.from_dataframe(df)
+        needed = self.size + len(new)
+        if needed > len(self._ids):
+            capacity = max(needed, 2 * len(self._ids), 16)
+            self._ids = grow_buffer(self._ids, self.size, capacity)
+            self._columns = {name: grow_buffer(col, self.size, capacity) for name, col in self._columns.items()}
+
+        self._ids[self.size:needed] = new.ids
+        for name in self.COLUMNS:
+            self._columns[name][self.size:needed] = new._columns[name]
+        # Tăng size sau cùng để reader không thấy row chưa ghi xong
+        self.size = needed
+
+    def reserve(self, rows: int):
+        """Makes room for `rows` more rows, so they are appended without reallocating."""
+
+        capacity = self.size + rows
+        if capacity > len(self._ids):
+            self._ids = grow_buffer(self._ids, self.size, capacity)
+            self._columns = {name: grow_buffer(col, self.size, capacity) for name, col in self._columns.items()}
+
+
+def grow_buffer(buffer: np.ndarray, size: int, capacity: int) -> np.ndarray:
+    """Copies the first `size` rows of `buffer` into a new buffer of `capacity` rows."""
+
+    # Row sau `size` chưa ghi: chỉ chiếm address space, chưa tốn RAM
+    grown = np.empty((capacity,) + buffer.shape[1:], dtype=buffer.dtype)
+    grown[:size] = buffer[:size]
+    return grown
+
+
+def ratio_similarity(value: float, values: np.ndarray) -> np.ndarray:
+    """`max(0, 1 - |a - b| / max(a, b))` per row; 0 where either side is NaN or both are zero."""
+
+    if np.isnan(value):
+        return np.zeros(len(values), dtype=np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sim = 1.0 - np.abs(values - value) / np.maximum(values, value)
+    # fmax bỏ qua NaN (0/0, NaN trong catalog) -> 0
+    return np.fmax(sim, 0.0)
+
+
+def location_similarity_batch(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray, max_km: float = 50) -> np.ndarray:
+    """`max(0, 1 - distance / max_km)` per row; 0 where a coordinate is NaN."""
+
+    if np.isnan(lat) or np.isnan(lon):
+        return np.zeros(len(lats), dtype=np.float64)
+
+    dist = haversine_km(lat, lon, lats, lons)
+    return np.fmax(1 - dist / max_km, 0.0)
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distance in km from one point to many."""
+
+    lat1 = np.radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlon = np.radians(lons - lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def rerank_scores(
+    candidate_idx: np.ndarray,
+    semantic_scores: np.ndarray,
+    arrays: CatalogArrays,
+    price: float,
+    quantity: float,
+    latitude: float,
+    longitude: float,
+    alpha: float = 0.6,
+    beta: float = 0.1,
+    gamma: float = 0.2,
+    delta: float = 0.1,
+    max_km: float = 50,
+) -> np.ndarray:
+    """Weighted final score of every candidate row, aligned with `candidate_idx`."""
+
+    pri_score = ratio_similarity(price, arrays.price_num[candidate_idx])
+    qty_score = ratio_similarity(quantity, arrays.quantity_num[candidate_idx])
+    loc_score = location_similarity_batch(
+        latitude, longitude, arrays.latitude[candidate_idx], arrays.longitude[candidate_idx], max_km=max_km
+    )
+    return alpha * semantic_scores + beta * pri_score + gamma * loc_score + delta * qty_score
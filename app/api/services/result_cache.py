@@ -0,0 +1,99 @@
+"""Versioned cache of recommendation responses with ETag support."""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from app.api.services.query_cache import normalize_text
+
+
+def result_key(query: dict, catalog_version: int, **params) -> str:
+    """Cache key / ETag value of a recommend request.
+
+    Text fields of the query are normalized like query-embedding keys, so
+    payloads that only differ in case or whitespace share an entry. The
+    catalog version makes every entry computed before an add, update or
+    delete unreachable.
+    """
+
+    normalized = {
+        name: normalize_text(value) if isinstance(value, str) else value
+        for name, value in sorted(query.items())
+    }
+    payload = json.dumps(
+        {"query": normalized, "params": params, "version": catalog_version},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def etag_for(key: str) -> str:
+    return f'"{key[:32]}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """True if an `If-None-Match` header value matches `etag` (weak comparison)."""
+
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+class ResultCache:
+    """Bounded LRU of response bodies keyed on `result_key`.
+
+    Entries are never invalidated explicitly: a catalog change bumps the
+    version that is part of every key, and old entries age out of the LRU.
+    """
+
+    def __init__(self, maxsize: int = 2048):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key: str):
+        """Returns the cached body for `key` or None."""
+
+        with self._lock:
+            body = self._items.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: str, body):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[key] = body
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self) -> dict:
+        """Hit/miss/304 counters and current size."""
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,251 @@
+"""Scatter-gather semantic search over catalog rows split across processes."""
+
+import multiprocessing as mp
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from app.api.services.filter_index import FILTER_FIELDS
+from app.api.services.query_cache import encode_queries
+from app.api.services.recommend_service import (
+    SCORE_BLOCK_ROWS,
+    cos_scores,
+    filter_rows,
+    parse_query,
+    rerank_top,
+    semantic_candidates,
+)
+from app.api.services.rerank import CatalogArrays
+from app.api.services.topk import top_k_indices
+
+def shard_frame(arrays: CatalogArrays, frames) -> pd.DataFrame:
+    """Rows for the shards: numeric columns from `arrays` (float64, as used when
+    re-ranking) and the filter fields of `frames` (full or compact DataFrames)."""
+
+    frame = pd.DataFrame({"id": arrays.ids})
+    for name in CatalogArrays.COLUMNS:
+        frame[name] = getattr(arrays, name)
+    for name in FILTER_FIELDS.values():
+        # Categorical (compact_frame) -> str để FilterIndex chuẩn hoá như trên catalog gốc
+        frame[name] = pd.concat([f[name].astype(object) for f in frames], ignore_index=True).to_numpy()
+    return frame
+
+
+def _shard_main(conn, embeddings, frame):
+    """Loop of one shard process: a `Catalog` over its rows answering search / add / delete messages."""
+
+    from app.api.services.catalog import Catalog
+
+    # View trên matrix của coordinator thừa hưởng qua fork (không copy)
+    catalog = Catalog(np.asarray(embeddings, dtype=np.float32), frame, CatalogArrays.from_dataframe(frame))
+    del embeddings
+    conn.send(("ok", len(catalog)))
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        op, args = message
+        try:
+            if op == "search":
+                payload = _local_candidates(catalog, *args)
+            elif op == "add":
+                catalog.add(*args)
+                payload = len(catalog)
+            elif op == "delete":
+                catalog.delete_rows(*args)
+                payload = catalog.n_deleted
+            else:
+                raise ValueError(f"Unknown shard operation: {op}")
+        except Exception as e:
+            conn.send(("error", e))
+        else:
+            conn.send(("ok", payload))
+    conn.close()
+
+
+def _local_candidates(catalog, query_vecs, parsed, candidate_k, radius_km, filters, batch):
+    """Top `candidate_k` rows of the shard per query, with what the coordinator needs to re-rank them.
+
+    Follows `recommend` / `recommend_batch` step by step (same scoring call,
+    same tie order), so merging the shards gives the single-process result.
+    """
+
+    embeddings, arrays = catalog.embeddings, catalog.arrays
+    rows = filter_rows(filters, catalog.filter_index)
+    all_scores = [None] * len(parsed)
+    if batch and radius_km is None and rows is None:
+        all_scores = cos_scores(query_vecs, embeddings)
+
+    results = []
+    for p, query_vec, semantic_scores in zip(parsed, query_vecs, all_scores):
+        idx, scores = semantic_candidates(
+            query_vec, p, embeddings, arrays, candidate_k=candidate_k, radius_km=radius_km,
+            geo_index=catalog.geo_index, semantic_scores=semantic_scores, rows=rows, deleted=catalog.deleted,
+        )
+        results.append({
+            "scores": scores,
+            "id": arrays.ids[idx],
+            **{name: getattr(arrays, name)[idx] for name in CatalogArrays.COLUMNS},
+        })
+    return results
+
+
+class ShardedSearch:
+    """Exact semantic scan split across `n_shards` processes.
+
+    Catalog rows are cut into contiguous ranges of whole `dense_scores`
+    blocks; each shard process owns the `CatalogArrays`, `FilterIndex` and
+    `GeoGridIndex` of its range and scans its slice of the coordinator's
+    embedding matrix, inherited at fork without a copy (with `Catalog.load`
+    a read-only memory map, so every worker and shard shares the page cache).
+    A query is sent to every shard at once, each returns its local top
+    `candidate_k` by semantic score together with the candidates' metadata,
+    and the coordinator keeps the global top `candidate_k` and re-ranks them.
+
+    A row gets bit-identical scores in its shard and in a full scan, shards
+    rank ties by ascending row and are concatenated in row order, so the
+    merge picks exactly the candidates of a single-process scan, in the
+    same order, and the re-rank returns the same list as `recommend` /
+    `recommend_batch` without an ANN index. Added rows go to the last shard,
+    deleted rows are tombstoned in the shard that owns them.
+
+    Shard processes are started by the first `start` of each process, so a
+    `Catalog` preloaded before a pre-fork server forks gets its own shards in
+    every worker. Messages to the shards are serialized by a lock; a single
+    query already keeps every shard busy.
+    """
+
+    def __init__(self, n_shards: int = 2, start_method: str = None):
+        self.n_shards = n_shards
+        self._ctx = mp.get_context(start_method)
+        self._conns = []
+        self._processes = []
+        self._starts = np.zeros(0, dtype=np.int64)
+        self._pid = None
+        self._lock = threading.Lock()
+        self.queries = 0
+
+    @property
+    def running(self) -> bool:
+        return self._pid == os.getpid()
+
+    def start(self, embeddings, arrays: CatalogArrays, frames, deleted=None):
+        """Starts the shard processes over `embeddings` (dense, normalized) and the catalog rows.
+
+        deleted: row positions already tombstoned
+        """
+
+        frame = shard_frame(arrays, frames)
+        # Ranh giới shard trùng ranh giới khối của dense_scores để điểm giống hệt khi quét 1 process
+        n_blocks = -(-len(frame) // SCORE_BLOCK_ROWS)
+        bounds = np.minimum(np.linspace(0, n_blocks, self.n_shards + 1).astype(int) * SCORE_BLOCK_ROWS, len(frame))
+        conns, processes = [], []
+        for i, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+            parent, child = self._ctx.Pipe()
+            process = self._ctx.Process(
+                target=_shard_main, name=f"search-shard-{i}", daemon=True,
+                args=(child, embeddings[start:stop], frame.iloc[start:stop].reset_index(drop=True)),
+            )
+            process.start()
+            child.close()
+            conns.append(parent)
+            processes.append(process)
+        self._conns, self._processes = conns, processes
+        self._starts = bounds[:-1]
+        self._gather(conns)
+        self._pid = os.getpid()
+        if deleted is not None and len(deleted):
+            self.delete(deleted)
+
+    def close(self):
+        if not self.running:
+            return
+        with self._lock:
+            for conn in self._conns:
+                conn.send(None)
+            for process in self._processes:
+                process.join()
+            self._pid = None
+
+    def _gather(self, conns) -> list:
+        replies = []
+        for conn in conns:
+            try:
+                replies.append(conn.recv())
+            except EOFError:
+                raise RuntimeError("Search shard process exited")
+        for status, payload in replies:
+            if status == "error":
+                raise payload
+        return [payload for _, payload in replies]
+
+    def _scatter(self, message, conns=None) -> list:
+        conns = self._conns if conns is None else conns
+        with self._lock:
+            for conn in conns:
+                conn.send(message)
+            return self._gather(conns)
+
+    def add(self, rows: pd.DataFrame, embeddings: np.ndarray):
+        """Appends rows and their normalized embeddings to the last shard."""
+
+        frame = shard_frame(CatalogArrays.from_dataframe(rows), [rows])
+        self._scatter(("add", (frame, embeddings)), self._conns[-1:])
+
+    def delete(self, rows):
+        """Tombstones catalog row positions in the shards that hold them."""
+
+        rows = np.asarray(rows, dtype=np.int64)
+        # Shard rỗng có cùng điểm bắt đầu với shard sau: side="right" chọn shard có row
+        owners = np.searchsorted(self._starts, rows, side="right") - 1
+        for shard in np.unique(owners):
+            local = rows[owners == shard] - self._starts[shard]
+            self._scatter(("delete", (local,)), self._conns[shard:shard + 1])
+
+    # -----------------------------
+    # Tìm kiếm
+    # -----------------------------
+    def candidates(self, parsed, query_vecs, candidate_k=100, radius_km=None, filters=None, batch=False):
+        """Global top `candidate_k` per query as (CatalogArrays of the candidates, semantic scores)."""
+
+        per_shard = self._scatter(("search", (query_vecs, parsed, candidate_k, radius_km, filters, batch)))
+        self.queries += len(parsed)
+        merged = []
+        for q in range(len(parsed)):
+            parts = [shard[q] for shard in per_shard]
+            scores = np.concatenate([part["scores"] for part in parts])
+            order = top_k_indices(scores, candidate_k)
+            columns = {name: np.concatenate([part[name] for part in parts])[order]
+                       for name in ("id", *CatalogArrays.COLUMNS)}
+            merged.append((CatalogArrays(ids=columns.pop("id"), **columns), scores[order]))
+        return merged
+
+    def recommend(self, query, model, top_k=20, alpha=0.6, beta=0.1, gamma=0.2, delta=0.1, candidate_k=100,
+                  radius_km=None, query_cache=None, filters=None):
+        """Same result as `recommend()` with an exact scan."""
+
+        parsed = parse_query(query)
+        query_vecs = encode_queries(model, [parsed["semantic_text"]], query_cache)
+        (arrays, scores), = self.candidates([parsed], query_vecs, candidate_k, radius_km, filters)
+        return rerank_top(parsed, np.arange(len(arrays)), scores, arrays, top_k=top_k,
+                          alpha=alpha, beta=beta, gamma=gamma, delta=delta, radius_km=radius_km)
+
+    def recommend_batch(self, queries, model, top_k=20, alpha=0.6, beta=0.1, gamma=0.2, delta=0.1,
+                        candidate_k=100, radius_km=None, query_cache=None, filters=None):
+        """Same result as `recommend_batch()` with an exact scan."""
+
+        if not queries:
+            return []
+        parsed = [parse_query(q) for q in queries]
+        query_vecs = encode_queries(model, [p["semantic_text"] for p in parsed], query_cache)
+        merged = self.candidates(parsed, query_vecs, candidate_k, radius_km, filters, batch=True)
+        return [
+            rerank_top(p, np.arange(len(arrays)), scores, arrays, top_k=top_k,
+                       alpha=alpha, beta=beta, gamma=gamma, delta=delta, radius_km=radius_km)
+            for p, (arrays, scores) in zip(parsed, merged)
+        ]
+
+    def stats(self) -> dict:
+        return {"shards": self.n_shards, "running": self.running, "queries": self.queries}
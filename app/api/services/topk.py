@@ -0,0 +1,53 @@
+"""Partial top-k selection over score arrays."""
+
+import numpy as np
+
+# Catalog lớn hơn ngưỡng này thì chọn theo từng block để tránh bản sao toàn bộ mảng
+BLOCK_SIZE = 1_000_000
+
+
+def _sort_desc(scores: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    """Orders `idx` by descending score, ties broken by ascending position."""
+
+    return idx[np.lexsort((idx, -scores[idx]))]
+
+
+def _partition_top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Unordered positions of the `k` largest scores, O(N) via partition."""
+
+    # Row bằng điểm thứ k lấy theo vị trí tăng dần: kết quả không phụ thuộc thứ tự bên trong partition
+    n = len(scores)
+    if k >= n:
+        return np.arange(n)
+
+    threshold = np.partition(scores, n - k)[n - k]
+    above = np.flatnonzero(scores > threshold)
+    ties = np.flatnonzero(scores == threshold)[:k - len(above)]
+    return np.concatenate([above, ties])
+
+
+def _blocked_top_k(scores: np.ndarray, k: int, block_size: int) -> np.ndarray:
+    """Selects per block and merges, keeping at most `k` survivors per block."""
+
+    survivors = []
+    for start in range(0, len(scores), block_size):
+        block = scores[start:start + block_size]
+        survivors.append(_partition_top_k(block, k) + start)
+
+    candidates = np.sort(np.concatenate(survivors))
+    return candidates[_partition_top_k(scores[candidates], k)]
+
+
+def top_k_indices(scores: np.ndarray, k: int, block_size: int = BLOCK_SIZE) -> np.ndarray:
+    """Positions of the `k` highest scores, best first (ties by ascending position)."""
+
+    # Chọn O(N) bằng np.partition, chỉ sort k phần tử thắng
+    scores = np.asarray(scores)
+    if k <= 0 or len(scores) == 0:
+        return np.empty(0, dtype=np.intp)
+
+    if len(scores) > block_size:
+        idx = _blocked_top_k(scores, k, block_size)
+    else:
+        idx = _partition_top_k(scores, k)
+    return _sort_desc(scores, idx)
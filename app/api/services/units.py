@@ -0,0 +1,163 @@
+"""Unit-aware parsing of Vietnamese price and quantity strings.
+
+Prices are normalized to đồng per kg and quantities to kg:
+
+    "17.059 đ/kg" -> 17059      "30k/kg"        -> 30000
+    "1,2 triệu/tấn" -> 1200     "25 nghìn đ/yến" -> 2500
+    "1.5 tấn" -> 1500           "3 tạ"          -> 300
+
+Numbers follow Vietnamese formatting ("." groups thousands, "," is the
+decimal mark), except that a single "." not followed by exactly three digits
+is read as a decimal point ("1.5 tấn"). A value without a unit is taken to be
+per kg / in kg.
+
+`parse_price_column` / `parse_quantity_column` run the whole column through
+one pandas `.str` pipeline; `parse_price` / `parse_quantity` are the cached
+scalar equivalents used for queries.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Hệ số nhân của các từ chỉ số lượng tiền / số lượng
+SCALES = {
+    "k": 1e3, "nghìn": 1e3, "nghin": 1e3, "ngàn": 1e3, "ngan": 1e3,
+    "tr": 1e6, "triệu": 1e6, "trieu": 1e6,
+    "tỷ": 1e9, "tỉ": 1e9, "ty": 1e9,
+}
+
+# Số kg của mỗi đơn vị khối lượng
+UNIT_KG = {
+    "kg": 1.0, "kí": 1.0, "ký": 1.0, "ki": 1.0, "ky": 1.0,
+    "tấn": 1000.0, "tan": 1000.0,
+    "tạ": 100.0, "ta": 100.0,
+    "yến": 10.0, "yen": 10.0,
+    "g": 1e-3, "gr": 1e-3, "gam": 1e-3, "gram": 1e-3,
+}
+
+
+def _alternation(words) -> str:
+    # Từ dài trước để "gram" không bị khớp thành "g"
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+VALUE_PATTERN = (
+    r"(?P<num>\d+(?:[.,]\d+)*)"
+    r"\s*(?P<scale>(?:" + _alternation(SCALES) + r")(?!\w))?"
+    r"\s*(?:(?:vnđ|vnd|đồng|dong|đ|d)(?!\w))?"
+    r"\s*(?P<per>/|mỗi|moi|per)?"
+    r"\s*(?P<unit>(?:" + _alternation(UNIT_KG) + r")(?!\w))?"
+)
+VALUE_RE = re.compile(VALUE_PATTERN)
+
+_DOT_THOUSANDS = r"^\d{1,3}(?:\.\d{3})+$"
+_COMMA_THOUSANDS = r"^\d{1,3}(?:,\d{3}){2,}$"
+
+
+# -----------------------------
+# Theo cột (pandas .str)
+# -----------------------------
+def _normalize_column(values: pd.Series) -> pd.Series:
+    return values.astype("string").str.normalize("NFC").str.lower()
+
+
+def _numbers_column(num: pd.Series) -> pd.Series:
+    """Converts the matched digit groups to floats following the separator rules."""
+
+    has_dot = num.str.contains(".", regex=False).fillna(False)
+    has_comma = num.str.contains(",", regex=False).fillna(False)
+    dot_last = (num.str.rfind(".") > num.str.rfind(",")).fillna(False)
+
+    thousands_dot = has_dot & ~has_comma & num.str.match(_DOT_THOUSANDS).fillna(False)
+    thousands_comma = has_comma & ~has_dot & num.str.match(_COMMA_THOUSANDS).fillna(False)
+
+    no_dots = num.str.replace(".", "", regex=False)
+    no_commas = num.str.replace(",", "", regex=False)
+    cleaned = no_dots.str.replace(",", ".", regex=False)          # mặc định: "." nghìn, "," thập phân
+    cleaned = cleaned.mask(has_dot & ~has_comma & ~thousands_dot, num)
+    cleaned = cleaned.mask(has_dot & has_comma & dot_last, no_commas)
+    cleaned = cleaned.mask(thousands_comma, no_commas)
+    return pd.to_numeric(cleaned, errors="coerce").astype(np.float64)
+
+
+def _parse_column(values: pd.Series, unit_is_denominator: bool) -> np.ndarray:
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    parts = _normalize_column(values).str.extract(VALUE_PATTERN)
+    number = _numbers_column(parts["num"])
+    scale = parts["scale"].map(SCALES).astype(np.float64).fillna(1.0)
+    unit_kg = parts["unit"].map(UNIT_KG).astype(np.float64).fillna(1.0)
+
+    number = number * scale
+    number = number / unit_kg if unit_is_denominator else number * unit_kg
+    return number.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def parse_price_column(values: pd.Series) -> np.ndarray:
+    """Prices of a whole column in đồng / kg (NaN when no number is found)."""
+
+    return _parse_column(values, unit_is_denominator=True)
+
+
+def parse_quantity_column(values: pd.Series) -> np.ndarray:
+    """Quantities of a whole column in kg (NaN when no number is found)."""
+
+    return _parse_column(values, unit_is_denominator=False)
+
+
+# -----------------------------
+# Từng giá trị (query)
+# -----------------------------
+def _number(num: str) -> float:
+    has_dot, has_comma = "." in num, "," in num
+    if has_dot and has_comma:
+        if num.rfind(".") > num.rfind(","):
+            cleaned = num.replace(",", "")
+        else:
+            cleaned = num.replace(".", "").replace(",", ".")
+    elif has_dot:
+        cleaned = num.replace(".", "") if re.match(_DOT_THOUSANDS, num) else num
+    elif has_comma:
+        cleaned = num.replace(",", "") if re.match(_COMMA_THOUSANDS, num) else num.replace(",", ".")
+    else:
+        cleaned = num
+    try:
+        return float(cleaned)
+    except ValueError:
+        return np.nan
+
+
+@lru_cache(maxsize=4096)
+def _parse_text(text: str, unit_is_denominator: bool) -> float:
+    match = VALUE_RE.search(unicodedata.normalize("NFC", text).lower())
+    if match is None:
+        return np.nan
+    value = _number(match["num"]) * SCALES.get(match["scale"], 1.0)
+    unit_kg = UNIT_KG.get(match["unit"], 1.0)
+    return value / unit_kg if unit_is_denominator else value * unit_kg
+
+
+def _parse_value(value, unit_is_denominator: bool) -> float:
+    if value is None or isinstance(value, (int, float, np.number)):
+        return np.nan if value is None else float(value)
+    if pd.isna(value):
+        return np.nan
+    return _parse_text(str(value), unit_is_denominator)
+
+
+def parse_price(value) -> float:
+    """Scalar form of `parse_price_column`."""
+
+    return _parse_value(value, unit_is_denominator=True)
+
+
+def parse_quantity(value) -> float:
+    """Scalar form of `parse_quantity_column`."""
+
+    return _parse_value(value, unit_is_denominator=False)
@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 import logging, sys
+from pathlib import Path
 
 from loguru import logger
 from starlette.config import Config
@@ -31,6 +32,46 @@ OUTPUT_FOLDER: str = "app/resources/outputs"
 LLM_API_KEY: str = config("LLM_API_KEY", cast=str, default="")
 MODEL_NAME: str = config("MODEL_NAME", cast=str, default="gpt-3.5-turbo")
 
+# Recommendation: "exact" (quét toàn bộ) hoặc "ivf" (IVF-flat index)
+ANN_BACKEND: str = config("ANN_BACKEND", cast=str, default="exact")
+ANN_NPROBE: int = config("ANN_NPROBE", cast=int, default=8)
+# Lưu embeddings: "dense", "dedup" (1 vector cho mỗi semantic_text), "float16" hoặc "int8"
+EMBEDDING_STORAGE: str = config("EMBEDDING_STORAGE", cast=str, default="dense")
+# Mở embeddings bằng memory map chỉ đọc
+EMBEDDING_MMAP: bool = config("EMBEDDING_MMAP", cast=bool, default=False)
+# Dùng snapshot metadata đã tiền xử lý (.npz cạnh file CSV) khi khởi động
+CATALOG_SNAPSHOT: bool = config("CATALOG_SNAPSHOT", cast=bool, default=True)
+# DataFrame catalog gọn (categorical / float32), cột hiển thị đọc từ đĩa qua memory map
+CATALOG_COMPACT: bool = config("CATALOG_COMPACT", cast=bool, default=True)
+# Thư mục SegmentedEmbeddingStore, tạo từ semantic_vectors.npy ở lần chạy đầu
+# (để trống = append thẳng vào semantic_vectors.npy)
+EMBEDDING_STORE_DIR: str = config(
+    "EMBEDDING_STORE_DIR", cast=str,
+    default=str(Path(__file__).resolve().parents[1] / "api" / "services" / "emb_files" / "segments"),
+)
+# Cache vector của query: số entry trong RAM, file SQLite (để trống = tắt tầng disk)
+QUERY_CACHE_SIZE: int = config("QUERY_CACHE_SIZE", cast=int, default=4096)
+QUERY_CACHE_PATH: str = config("QUERY_CACHE_PATH", cast=str, default="")
+# Cache kết quả /recommend/ (số response, 0 = tắt)
+RESULT_CACHE_SIZE: int = config("RESULT_CACHE_SIZE", cast=int, default=2048)
+# Ghi listing mới: gom các request trong cửa sổ (ms) thành 1 nhóm commit, tối đa số listing / nhóm
+INGEST_GROUP_WINDOW_MS: float = config("INGEST_GROUP_WINDOW_MS", cast=float, default=5.0)
+INGEST_MAX_GROUP: int = config("INGEST_MAX_GROUP", cast=int, default=256)
+# Tự compact file catalog khi số listing đã xoá / cập nhật đạt tỉ lệ này trên tổng số row (0 = tắt)
+COMPACTION_DEAD_RATIO: float = config("COMPACTION_DEAD_RATIO", cast=float, default=0.1)
+# Gom encode của các request đồng thời: cửa sổ chờ (ms, 0 = tắt) và số text tối đa / batch
+ENCODE_BATCH_WINDOW_MS: float = config("ENCODE_BATCH_WINDOW_MS", cast=float, default=3.0)
+ENCODE_MAX_BATCH: int = config("ENCODE_MAX_BATCH", cast=int, default=64)
+# Chia phép quét exact cho N process tìm kiếm (0 = quét trong process; cần EMBEDDING_STORAGE=dense, ANN_BACKEND=exact)
+SEARCH_SHARDS: int = config("SEARCH_SHARDS", cast=int, default=0)
+# Số listing dành chỗ trước trong catalog của master gunicorn trước khi fork: worker add vào chỗ trống này
+# thay vì copy cả buffer (chỉ tốn address space tới khi được ghi)
+CATALOG_RESERVE_ROWS: int = config("CATALOG_RESERVE_ROWS", cast=int, default=100_000)
+# Load model + catalog và warm-up ở nền khi khởi động (/health/ready báo ready khi xong); False = chặn tới khi xong
+STARTUP_IN_BACKGROUND: bool = config("STARTUP_IN_BACKGROUND", cast=bool, default=True)
+# Số vòng encode + recommend giả trước khi báo ready (0 = bỏ warm-up)
+WARMUP_ROUNDS: int = config("WARMUP_ROUNDS", cast=int, default=3)
+
 ALLOW_FILE_CONTENT_TYPES = [
     "application/pdf",
     "text/plain",
@@ -0,0 +1,89 @@
+"""Startup state of the service: liveness and readiness."""
+
+import os
+import threading
+import time
+
+from app.logger.logger import custom_logger
+
+
+class Startup:
+    """Runs the startup steps once per process in a background thread and tracks readiness.
+
+    Steps are `(name, fn)` pairs run in order (e.g. loading the model and
+    the catalog, then warm-up). While they run the process answers requests
+    (it is live) but is not ready; it becomes ready after the last step. A
+    step that raises stops the startup: the process is then neither ready
+    nor live, so the orchestrator restarts it instead of waiting forever.
+
+    The thread is started on first `start` in each process, so a `Startup`
+    created before a pre-fork server forks its workers still runs in each
+    worker.
+    """
+
+    def __init__(self):
+        self.phase = "starting"
+        self.error = None
+        self.timings = {}
+        self._ready = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._started_at = time.time()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    @property
+    def live(self) -> bool:
+        return self.error is None
+
+    def run(self, steps):
+        """Runs the steps in this thread (readiness only changes once all of them succeeded)."""
+
+        for name, step in steps:
+            self.phase = name
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                self.phase = "failed"
+                self.error = f"{name}: {e!r}"
+                custom_logger.exception(f"Startup step '{name}' failed")
+                return
+            self.timings[name] = round(time.perf_counter() - start, 3)
+            custom_logger.info(f"Startup step '{name}' done in {self.timings[name]:.2f}s")
+        self.phase = "ready"
+        self._ready.set()
+
+    def start(self, steps) -> threading.Thread:
+        """Runs `run(steps)` in a daemon thread unless this process already started it."""
+
+        # Thread không sống sót qua fork: mỗi worker chạy startup của riêng nó
+        if self._pid == os.getpid():
+            return self._thread
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self.phase, self.error, self.timings = "starting", None, {}
+                self._ready = threading.Event()
+                self._started_at = time.time()
+                self._thread = threading.Thread(target=self.run, args=(list(steps),), name="startup", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+        return self._thread
+
+    def wait(self, timeout: float = None) -> bool:
+        """Blocks until ready (or `timeout` seconds); returns readiness."""
+
+        return self._ready.wait(timeout)
+
+    def status(self) -> dict:
+        return {
+            "phase": self.phase,
+            "ready": self.ready,
+            "error": self.error,
+            "timings_s": dict(self.timings),
+            "uptime_s": round(time.time() - self._started_at, 3),
+            "pid": os.getpid(),
+        }
@@ -1,24 +1,140 @@
 # app/core/recommender.py
 
-from app.api.services.recommend_service import load_data, process_and_add_item
-from sentence_transformers import SentenceTransformer
+import threading
 
+from app.api.services.recommend_service import EMB_DIR, EMB_FILE, META_FILE
+from app.api.services.catalog import Catalog
+from app.api.services.embedding_store import SegmentedEmbeddingStore
+from app.api.services.query_cache import QueryEmbeddingCache
+from app.api.services.result_cache import ResultCache
+from app.api.services.encode_batcher import MicroBatchEncoder
+from app.api.services.ingestion import IngestionWriter
+from app.api.services.catalog_sync import CatalogSync, catalog_lock
+from app.core.config import ANN_BACKEND, ANN_NPROBE, QUERY_CACHE_SIZE, QUERY_CACHE_PATH, EMBEDDING_STORAGE, \
+    EMBEDDING_STORE_DIR, EMBEDDING_MMAP, CATALOG_SNAPSHOT, CATALOG_COMPACT, \
+    ENCODE_BATCH_WINDOW_MS, ENCODE_MAX_BATCH, RESULT_CACHE_SIZE, \
+    INGEST_GROUP_WINDOW_MS, INGEST_MAX_GROUP, SEARCH_SHARDS, COMPACTION_DEAD_RATIO, STARTUP_IN_BACKGROUND, \
+    WARMUP_ROUNDS
+from app.core.lifecycle import Startup
 
-# Load model và embeddings **1 lần khi startup**
-print("Loading model and embeddings...")
 
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2", device="cpu")
-embeddings, df = load_data()
+# Model, catalog, ... được load bởi load() (ở nền khi app khởi động, xem start()); các route chỉ
+# được gọi sau khi startup.ready (app/api/routes/recommend.py)
+model = None
+store = None
+writer = None
+catalog = None
+sync = None
+query_cache = None
+result_cache = None
+encoder = None
+
+startup = Startup()
+_load_lock = threading.Lock()
+
+WARMUP_QUERY = {
+    "categoryName": "Rau củ",
+    "productName": "cà chua",
+    "price": "15.000 đ/kg",
+    "quantity": "1.000 kg",
+    "latitude": 21.0285,
+    "longitude": 105.8542,
+    "address": "Quận Hoàn Kiếm, Hà Nội, Việt Nam",
+}
+
+
+def load():
+    # Load model + catalog và recover ingestion log, 1 lần: ở gunicorn master trước khi fork
+    # (gunicorn.conf.py, catalog dùng chung giữa các worker), nếu không thì trong startup nền
+    global model, store, writer, catalog, sync, query_cache, result_cache, encoder
+    with _load_lock:
+        if catalog is not None:
+            return
+        print("Loading model and embeddings...")
+        # Import ở đây: torch mất vài giây để import, không chặn việc khởi động app
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2", device="cpu")
+        store = (
+            SegmentedEmbeddingStore.open(EMBEDDING_STORE_DIR, seed_file=EMB_DIR / "semantic_vectors.npy")
+            if EMBEDDING_STORE_DIR else None
+        )
+        # Nhiều worker (gunicorn.conf.py) có thể cùng khởi động: recover + load giữ khoá độc quyền của catalog
+        with catalog_lock(META_FILE, exclusive=True):
+            # Writer của CSV + embeddings; khôi phục nhóm ghi dở (WAL) trước khi load catalog
+            writer = IngestionWriter(model, store=store, max_group_size=INGEST_MAX_GROUP,
+                                     max_wait_ms=INGEST_GROUP_WINDOW_MS, compact_ratio=COMPACTION_DEAD_RATIO)
+            replayed = writer.recover()
+            if replayed:
+                print(f"Replayed {replayed} listings from the ingestion log")
+            # Catalog sống trong RAM: các route đọc qua object này, add-item cập nhật tại chỗ
+            live = Catalog.load(storage=EMBEDDING_STORAGE, store=store, ann_backend=ANN_BACKEND, nprobe=ANN_NPROBE,
+                                mmap=EMBEDDING_MMAP, snapshot=CATALOG_SNAPSHOT, compact=CATALOG_COMPACT,
+                                shards=SEARCH_SHARDS)
+            # Version dùng chung giữa các worker: listing do worker khác ghi được áp dụng trước mỗi request
+            sync = CatalogSync(live, META_FILE, EMB_FILE, store=store)
+            writer.start(live, sync)
+        query_cache = QueryEmbeddingCache(maxsize=QUERY_CACHE_SIZE, disk_path=QUERY_CACHE_PATH or None)
+        result_cache = ResultCache(maxsize=RESULT_CACHE_SIZE)
+        # Encoder cho query: gom các request đồng thời thành 1 batch encode
+        encoder = (
+            MicroBatchEncoder(model, max_batch_size=ENCODE_MAX_BATCH, max_wait_ms=ENCODE_BATCH_WINDOW_MS)
+            if ENCODE_BATCH_WINDOW_MS > 0 else model
+        )
+        # Gán cuối cùng: catalog khác None nghĩa là mọi object ở trên đã sẵn sàng
+        catalog = live
+
+        print(f"Model loaded: {model.__class__.__name__}")
+        print(f"Embeddings shape: {catalog.embeddings.shape} ({EMBEDDING_STORAGE}), Metadata rows: {len(catalog)}, ANN backend: {ANN_BACKEND}")
+        print(f"Catalog memory: {catalog.memory_report()['bytes_per_listing']:.0f} bytes / listing")
+
+
+def warm_up(rounds: int = WARMUP_ROUNDS):
+    # Chạy thử đường query trước khi báo ready: encode đầu tiên cấp phát buffer / thread pool của torch,
+    # search đầu tiên khởi động encode batcher và các shard. Không qua cache nên không phục vụ lại kết quả này
+    sync_catalog()
+    for _ in range(rounds):
+        encoder.encode(WARMUP_QUERY["productName"], normalize_embeddings=True)
+        encoder.encode([WARMUP_QUERY["categoryName"]] * ENCODE_MAX_BATCH, normalize_embeddings=True)
+        if len(catalog):
+            catalog.recommend(WARMUP_QUERY, encoder)
+            catalog.recommend(WARMUP_QUERY, encoder, radius_km=50,
+                              filters={"category": WARMUP_QUERY["categoryName"], "price_max": 50_000})
+            catalog.recommend_batch([WARMUP_QUERY] * 8, encoder)
+
+
+def start():
+    # Load (nếu master chưa load) + warm-up ở nền; /health/ready và các route /recommend/ chờ xong
+    steps = [("loading", load)]
+    if WARMUP_ROUNDS > 0:
+        steps.append(("warming_up", warm_up))
+    if not STARTUP_IN_BACKGROUND:
+        startup.run(steps)
+        return startup
+    startup.start(steps)
+    return startup
+
+
+def sync_catalog():
+    # 1 lần đọc counter dùng chung khi không có gì mới
+    return sync.maybe_sync()
 
-print(f"Model loaded: {model.__class__.__name__}")
-print(f"Embeddings shape: {embeddings.shape}, Metadata rows: {len(df)}")
 
 def add_new_item(data: dict):
-    global embeddings, df  # cho phép update ngay trong RAM
+    # Qua writer duy nhất: ghi WAL, commit theo nhóm, áp dụng ngay trong RAM
+    return writer.add_item(data)
+
+
+def add_new_items(items: list):
+    # Import nhiều listing: cả lô là 1 request trong nhóm commit
+    return writer.add_items(items)
+
 
-    result = process_and_add_item(data, model)
+def update_item(item_id: str, data: dict):
+    # Row cũ bị đánh tombstone, bản mới được thêm trong cùng nhóm commit
+    return writer.update_item(item_id, data)
 
-    # Reload embeddings & metadata sau khi append
-    embeddings, df = load_data()
 
-    return result
\ No newline at end of file
+def delete_item(item_id: str):
+    # Tombstone: listing biến khỏi kết quả ngay, file được compact sau (COMPACTION_DEAD_RATIO)
+    return writer.delete_item(item_id)
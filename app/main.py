@@ -3,6 +3,7 @@
 import random
 import string
 import time
+from contextlib import asynccontextmanager
 
 import uvicorn
 from fastapi.openapi.utils import get_openapi
@@ -34,6 +35,8 @@ from app.core.config import (
 )
 from app.logger.logger import custom_logger
 from app.api.routes.recommend import router as recommend_router
+from app.api.routes.health import router as health_router
+from app.core import recommender
 
 
 API_KEY_NAME = "x-api-key"
@@ -88,9 +91,16 @@ class LoggingMiddleware(BaseHTTPMiddleware):
         return response
 
 
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    """Load + warm-up of the recommender in the background; /health/ready reports when it is done."""
+    recommender.start()
+    yield
+
+
 def get_application() -> FastAPI:
     """Get app."""
-    application = FastAPI(title=PROJECT_NAME, debug=DEBUG, version=VERSION)
+    application = FastAPI(title=PROJECT_NAME, debug=DEBUG, version=VERSION, lifespan=lifespan)
     application.add_middleware(
         CORSMiddleware,
         allow_origins=ALLOWED_HOSTS or ["*"],
@@ -115,6 +125,7 @@ def get_application() -> FastAPI:
 app = get_application()
 app.openapi = lambda: custom_openapi(app)
 app.include_router(recommend_router, prefix="/recommend", tags=["Recommendation"])
+app.include_router(health_router, prefix="/health", tags=["Health"])
 
 if __name__ == "__main__":
     uvicorn.run(app, host=APP_HOST, port=int(APP_PORT))
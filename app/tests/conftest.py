@@ -0,0 +1,13 @@
+import pytest
+
+from app.tests.fake_catalog import FakeEncoder, write_catalog
+
+
+@pytest.fixture
+def encoder():
+    return FakeEncoder()
+
+
+@pytest.fixture
+def catalog_files(tmp_path, encoder) -> dict:
+    return write_catalog(tmp_path, encoder)
@@ -0,0 +1,91 @@
+"""Catalog nhỏ dựng trong test: listing giả, encoder giả và file catalog."""
+
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from app.api.services.recommend_service import preprocess_items
+
+PRODUCTS = {
+    "Cây ăn quả": ["vải thiều", "cam sành", "dưa hấu", "thanh long ruột đỏ", "bưởi da xanh"],
+    "Rau củ": ["cà chua", "bắp cải", "dưa leo", "rau muống", "cà rốt"],
+    "Cây công nghiệp": ["hạt điều nhân", "hạt tiêu đen", "cà phê nhân Robusta", "chè xanh"],
+}
+
+# (địa chỉ, lat, lon)
+PLACES = [
+    ("Quận Hoàn Kiếm, Hà Nội, Việt Nam", 21.0285, 105.8542),
+    ("Quận Lê Chân, Hải Phòng, Việt Nam", 20.8449, 106.6881),
+    ("Quận Hải Châu, Đà Nẵng, Việt Nam", 16.0544, 108.2022),
+    ("Quận Ninh Kiều, Cần Thơ, Việt Nam", 10.0452, 105.7469),
+]
+
+CATALOG_ROWS = 200
+
+
+class FakeEncoder:
+    """Thay cho SentenceTransformer trong test: 1 vector đơn vị cố định cho mỗi text."""
+
+    def __init__(self, dim: int = 32):
+        self.dim = dim
+        self.calls = 0
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, sentences, normalize_embeddings=True, **kwargs):
+        self.calls += 1
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            vector = np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(self.dim)
+            vectors[i] = vector / np.linalg.norm(vector)
+        return vectors[0] if single else vectors
+
+
+def make_items(n: int, seed: int = 0, prefix: str = "item") -> list:
+    """Listing thô theo format của /recommend/add-item."""
+
+    rng = np.random.default_rng(seed)
+    pairs = [(category, product) for category, products in PRODUCTS.items() for product in products]
+    items = []
+    for i in range(n):
+        category, product = pairs[rng.integers(len(pairs))]
+        address, lat, lon = PLACES[rng.integers(len(PLACES))]
+        items.append({
+            "id": f"{prefix}-{i}",
+            "title": f"Bán {product}",
+            "content": "Hàng mới thu hoạch",
+            "categoryName": category,
+            "productName": product,
+            "price": f"{int(rng.integers(5, 120))}.000 đ/kg",
+            "quantity": f"{int(rng.integers(1, 50)) * 100} kg",
+            "latitude": round(lat + rng.normal(0, 0.1), 4),
+            "longitude": round(lon + rng.normal(0, 0.1), 4),
+            "address": address,
+        })
+    return items
+
+
+def make_queries(n: int, seed: int = 1) -> list:
+    """Query theo format của /recommend/."""
+
+    keys = ("categoryName", "productName", "price", "quantity", "latitude", "longitude", "address")
+    return [{key: item[key] for key in keys} for item in make_items(n, seed, prefix="query")]
+
+
+def write_catalog(directory, encoder, rows: int = CATALOG_ROWS, seed: int = 0) -> dict:
+    """Ghi metadata CSV + semantic_vectors.npy của 1 catalog nhỏ; trả về tham số file cho Catalog.load."""
+
+    df = preprocess_items(pd.DataFrame(make_items(rows, seed)))
+    files = {
+        "meta_file": directory / "product_metadata_nopro.csv",
+        "emb_file": directory / "semantic_vectors.npy",
+        "index_file": directory / "ivf_index.npz",
+        "dedup_file": directory / "semantic_vectors_dedup.npz",
+    }
+    df.to_csv(files["meta_file"], index=False)
+    np.save(files["emb_file"], encoder.encode(df["semantic_text"].tolist()))
+    return files
@@ -0,0 +1,50 @@
+from app.api.services.catalog import Catalog
+from app.api.services.catalog_sync import CatalogSync
+from app.api.services.ingestion import IngestionWriter
+from app.tests.fake_catalog import CATALOG_ROWS, make_items, make_queries
+
+
+def start_worker(files, encoder):
+    """1 catalog + sync + writer, như 1 worker gunicorn."""
+
+    catalog = Catalog.load(**files)
+    sync = CatalogSync(catalog, files["meta_file"], files["emb_file"])
+    writer = IngestionWriter(encoder, meta_file=files["meta_file"], emb_file=files["emb_file"], compact_ratio=0)
+    return catalog, sync, writer.start(catalog, sync)
+
+
+def test_rows_of_another_worker_keep_string_ids(catalog_files, encoder):
+    _, _, writer = start_worker(catalog_files, encoder)
+    other, sync, other_writer = start_worker(catalog_files, encoder)
+    items = make_items(2, seed=5)
+    items[0]["id"], items[1]["id"] = "007", "1e3"
+    try:
+        assert writer.add_items(items)["status"] == "success"
+        assert sync.maybe_sync()
+    finally:
+        writer.close()
+        other_writer.close()
+    assert len(other) == CATALOG_ROWS + 2
+    assert other.rows_of(["007", "1e3"]) == {"007": [CATALOG_ROWS], "1e3": [CATALOG_ROWS + 1]}
+
+
+def test_reload_after_compaction_runs_off_the_request_thread(catalog_files, encoder):
+    catalog, _, writer = start_worker(catalog_files, encoder)
+    other, sync, other_writer = start_worker(catalog_files, encoder)
+    dead = [str(i) for i in catalog.arrays.ids[:10]]
+    try:
+        for item_id in dead:
+            assert writer.delete_item(item_id)["status"] == "success"
+        assert writer.compact()
+
+        # Request không chờ load lại: vẫn đọc catalog cũ cho tới khi thread nền thay xong
+        assert not sync.maybe_sync()
+        assert other.recommend(make_queries(1)[0], encoder)
+        sync._reload_thread.join()
+        assert not sync.reloading()
+    finally:
+        writer.close()
+        other_writer.close()
+    assert len(other) == CATALOG_ROWS - len(dead)
+    assert not set(dead) & {str(i) for i in other.arrays.ids}
+    assert sync.stats()["generation"] == 1
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.api.services.catalog import Catalog
+from app.api.services.filter_index import RangeIndex, normalize_value
+from app.api.services.recommend_service import preprocess_items, recommend
+from app.tests.fake_catalog import CATALOG_ROWS, make_items, make_queries
+
+QUERY = make_queries(1)[0]
+
+
+def brute_force(catalog, encoder, query, keep, top_k=10, **kwargs):
+    """Kết quả khi xét toàn bộ catalog rồi mới bỏ các row không khớp: filter phải cho cùng kết quả."""
+
+    everything = catalog.recommend(query, encoder, top_k=len(catalog), candidate_k=len(catalog), **kwargs)
+    frame = catalog.df.set_index("id")
+    return [(i, s) for i, s in everything if keep(frame.loc[i])][:top_k]
+
+
+@pytest.mark.parametrize("name, column", [("category", "categoryName"), ("province", "province"),
+                                          ("product", "productName")])
+def test_filter_matches_brute_force(catalog_files, encoder, name, column):
+    catalog = Catalog.load(**catalog_files)
+    value = str(catalog.df[column].iloc[0]).upper()
+    result = catalog.recommend(QUERY, encoder, top_k=10, candidate_k=CATALOG_ROWS, filters={name: value})
+    expected = brute_force(catalog, encoder, QUERY, lambda row: normalize_value(row[column]) == normalize_value(value))
+    assert [i for i, _ in result] == [i for i, _ in expected]
+    np.testing.assert_allclose([s for _, s in result], [s for _, s in expected], rtol=1e-6)
+
+
+@pytest.mark.parametrize("bounds", [{"price_min": 0.3, "price_max": 0.7}, {"price_min": 0.5}, {"qty_max": 0.4},
+                                    {"price_min": 0.2, "qty_min": 0.2, "qty_max": 0.9}])
+def test_range_filter_matches_brute_force(catalog_files, encoder, bounds):
+    catalog = Catalog.load(**catalog_files)
+    # Cận lấy theo quantile của catalog để luôn có row khớp
+    columns = {"price": "price_num", "qty": "quantity_num"}
+    filters = {name: float(np.nanquantile(catalog.df[columns[name.split("_")[0]]], q)) for name, q in bounds.items()}
+
+    def keep(row):
+        for name, value in filters.items():
+            column, side = columns[name.split("_")[0]], name.split("_")[1]
+            if np.isnan(row[column]) or (row[column] < value if side == "min" else row[column] > value):
+                return False
+        return True
+
+    result = catalog.recommend(QUERY, encoder, top_k=20, candidate_k=CATALOG_ROWS, filters=filters)
+    expected = brute_force(catalog, encoder, QUERY, keep, top_k=20)
+    assert result
+    assert [i for i, _ in result] == [i for i, _ in expected]
+
+
+def test_range_index_matches_a_scan():
+    rng = np.random.default_rng(0)
+    values = rng.uniform(0, 100, 5000)
+    values[rng.choice(len(values), 300, replace=False)] = np.nan
+    index = RangeIndex(min_merge=64)
+    # Thêm theo nhiều đợt: 1 phần đã sắp xếp + phần đuôi chưa merge
+    for chunk in np.array_split(values, 37):
+        index.add(chunk)
+    assert 0 < index._sorted[2] < len(values)
+    for low, high in [(None, None), (10, 20), (None, 5), (95, None), (50, 50), (30, 10)]:
+        mask = ~np.isnan(values)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        np.testing.assert_array_equal(np.sort(index.range(low, high)), np.flatnonzero(mask))
+
+
+def test_unknown_filter_value_returns_nothing(catalog_files, encoder):
+    catalog = Catalog.load(**catalog_files)
+    assert catalog.recommend(QUERY, encoder, filters={"category": "không có"}) == []
+
+
+def test_filter_includes_added_rows(catalog_files, encoder):
+    catalog = Catalog.load(**catalog_files)
+    rows = preprocess_items(pd.DataFrame(make_items(5, seed=3, prefix="new")))
+    rows["categoryName"] = "Nấm"
+    catalog.add(rows, encoder.encode(rows["semantic_text"].tolist()))
+    result = catalog.recommend(QUERY, encoder, top_k=10, filters={"category": "nấm"})
+    assert sorted(i for i, _ in result) == sorted(rows["id"])
+
+
+@pytest.mark.parametrize("kwargs", [{"filters": {"product": "cà chua"}}, {"radius_km": 30},
+                                    {"filters": {"category": "Rau củ"}, "radius_km": 30}])
+def test_rows_added_after_the_matrix_was_read_are_skipped(catalog_files, encoder, kwargs):
+    catalog = Catalog.load(**catalog_files)
+    embeddings = catalog.embeddings
+    rows = preprocess_items(pd.DataFrame(make_items(20, seed=4, prefix="new")))
+    catalog.add(rows, encoder.encode(rows["semantic_text"].tolist()))
+    query = {**QUERY, "latitude": rows["latitude"].iloc[0], "longitude": rows["longitude"].iloc[0]}
+
+    # Như 1 query đã lấy ma trận embeddings trước khi add, rồi đọc các index đã có row mới
+    result = recommend(query, embeddings, None, encoder, arrays=catalog.arrays, geo_index=catalog.geo_index,
+                       filter_index=catalog.filter_index, **kwargs)
+    assert not {i for i, _ in result} & set(rows["id"])
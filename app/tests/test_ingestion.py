@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from app.api.services import ingestion
+from app.api.services.catalog import Catalog
+from app.api.services.compaction import tombstone_count
+from app.api.services.ingestion import IngestionWriter
+from app.tests.fake_catalog import CATALOG_ROWS, make_items
+
+
+def writer_for(files, encoder) -> IngestionWriter:
+    return IngestionWriter(encoder, meta_file=files["meta_file"], emb_file=files["emb_file"], compact_ratio=0)
+
+
+def live_ids(catalog: Catalog) -> set:
+    rows = np.arange(len(catalog))
+    if catalog.deleted is not None:
+        rows = rows[~catalog.deleted[:len(catalog)]]
+    return {str(i) for i in catalog.arrays.ids[rows]}
+
+
+def test_recover_after_crash_between_wal_and_checkpoint(catalog_files, encoder, monkeypatch):
+    items = make_items(3, seed=7, prefix="new")
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    # Ghi embeddings lỗi và rollback cũng lỗi: file còn nguyên như khi process chết sau khi ghi CSV
+    monkeypatch.setattr(ingestion, "append_embeddings", fail)
+    monkeypatch.setattr(os, "truncate", fail)
+    writer = writer_for(catalog_files, encoder).start()
+    try:
+        assert writer.add_items(items)["status"] == "error"
+    finally:
+        writer.close()
+    monkeypatch.undo()
+    assert len(pd.read_csv(catalog_files["meta_file"])) == CATALOG_ROWS + len(items)
+    assert len(np.load(catalog_files["emb_file"], mmap_mode="r")) == CATALOG_ROWS
+
+    writer = writer_for(catalog_files, encoder)
+    assert writer.recover() == len(items)
+    assert writer.pending() == []
+    assert len(pd.read_csv(catalog_files["meta_file"])) == CATALOG_ROWS + len(items)
+
+    catalog = Catalog.load(**catalog_files)
+    assert len(catalog) == len(catalog.embeddings) == CATALOG_ROWS + len(items)
+    assert {item["id"] for item in items} <= live_ids(catalog)
+    assert writer_for(catalog_files, encoder).recover() == 0
+
+
+def test_delete_survives_reload(catalog_files, encoder):
+    catalog = Catalog.load(**catalog_files)
+    item_id = str(catalog.arrays.ids[5])
+    writer = writer_for(catalog_files, encoder).start(catalog)
+    try:
+        assert writer.delete_item(item_id) == {"status": "success", "deleted": 1}
+        assert writer.delete_item(item_id)["status"] == "not_found"
+    finally:
+        writer.close()
+    assert item_id not in live_ids(catalog)
+
+    reloaded = Catalog.load(**catalog_files)
+    assert reloaded.n_deleted == 1
+    assert item_id not in live_ids(reloaded)
+    assert reloaded.rows_of([item_id]) == {item_id: []}
+
+
+def test_compaction_reload_has_no_dead_ids(catalog_files, encoder):
+    catalog = Catalog.load(**catalog_files)
+    dead = [str(i) for i in catalog.arrays.ids[:20:2]]
+    writer = writer_for(catalog_files, encoder).start(catalog)
+    try:
+        for item_id in dead:
+            assert writer.delete_item(item_id)["status"] == "success"
+        assert writer.compact()
+    finally:
+        writer.close()
+
+    assert tombstone_count(catalog_files["meta_file"]) == 0
+    for loaded in (catalog, Catalog.load(**catalog_files)):
+        assert len(loaded) == CATALOG_ROWS - len(dead)
+        assert loaded.n_deleted == 0
+        assert not set(dead) & {str(i) for i in loaded.arrays.ids}
@@ -0,0 +1,37 @@
+import threading
+
+from app.core.lifecycle import Startup
+
+
+def test_ready_only_after_every_step():
+    startup = Startup()
+    release = threading.Event()
+    calls = []
+    thread = startup.start([("loading", lambda: calls.append("loading")),
+                            ("warming_up", lambda: release.wait(5))])
+    # Gọi lại trong cùng process không chạy lại các bước
+    assert startup.start([("loading", lambda: calls.append("again"))]) is thread
+
+    assert not startup.wait(0.05)
+    assert startup.live and not startup.ready
+    assert startup.status()["phase"] == "warming_up"
+
+    release.set()
+    assert startup.wait(5)
+    status = startup.status()
+    assert status["ready"] and status["phase"] == "ready" and status["error"] is None
+    assert set(status["timings_s"]) == {"loading", "warming_up"}
+    assert calls == ["loading"]
+
+
+def test_failed_step_is_neither_ready_nor_live():
+    startup = Startup()
+    calls = []
+
+    def fail():
+        raise RuntimeError("no model")
+
+    startup.run([("loading", fail), ("warming_up", lambda: calls.append("warming_up"))])
+    assert not startup.ready and not startup.live
+    assert startup.phase == "failed" and "no model" in startup.error
+    assert calls == []
@@ -0,0 +1,16 @@
+import numpy as np
+
+from app.api.services.catalog_frame import object_nbytes
+
+
+def test_mapped_and_resident_arrays(tmp_path):
+    path = tmp_path / "codes.npy"
+    np.save(path, np.zeros((100, 4), dtype=np.float16))
+    mapped = np.load(path, mmap_mode="r")
+
+    assert object_nbytes(mapped) == (0, 800)
+    assert object_nbytes(mapped[10:20]) == (0, 80)
+    assert object_nbytes(np.asarray(mapped)) == (0, 800)
+    # astype() của memmap trả về np.memmap nằm trong RAM
+    assert object_nbytes(mapped.astype(np.float32)) == (1600, 0)
+    assert object_nbytes(np.zeros(10)) == (80, 0)
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.api.services.recommend_service import append_embeddings, resize_npy_rows
+
+
+@pytest.fixture
+def emb_file(tmp_path):
+    path = tmp_path / "semantic_vectors.npy"
+    np.save(path, np.random.default_rng(0).standard_normal((50, 8)).astype(np.float32))
+    return path
+
+
+def crash_at_first_fsync(monkeypatch):
+    def crash(fd):
+        raise OSError("crash")
+
+    monkeypatch.setattr(os, "fsync", crash)
+
+
+def test_append_in_place(emb_file):
+    before = np.load(emb_file)
+    inode = os.stat(emb_file).st_ino
+    new = np.ones((3, 8), dtype=np.float32)
+    append_embeddings(new, emb_file=emb_file)
+    assert os.stat(emb_file).st_ino == inode
+    np.testing.assert_array_equal(np.load(emb_file), np.vstack([before, new]))
+    np.testing.assert_array_equal(np.load(emb_file, mmap_mode="r"), np.vstack([before, new]))
+
+
+def test_shrink(emb_file):
+    before = np.load(emb_file)
+    assert resize_npy_rows(emb_file, 10)
+    np.testing.assert_array_equal(np.load(emb_file), before[:10])
+    assert os.path.getsize(emb_file) == 128 + 10 * 8 * 4
+
+
+def test_crash_while_appending_keeps_old_rows(emb_file, monkeypatch):
+    before = np.load(emb_file)
+    crash_at_first_fsync(monkeypatch)
+    with pytest.raises(OSError):
+        append_embeddings(np.ones((3, 8), dtype=np.float32), emb_file=emb_file)
+    monkeypatch.undo()
+    np.testing.assert_array_equal(np.load(emb_file, mmap_mode="r"), before)
+    # Byte thừa của lần ghi dở bị ghi đè
+    append_embeddings(np.zeros((1, 8), dtype=np.float32), emb_file=emb_file)
+    np.testing.assert_array_equal(np.load(emb_file), np.vstack([before, np.zeros((1, 8))]))
+
+
+def test_crash_while_shrinking_leaves_a_loadable_file(emb_file, monkeypatch):
+    before = np.load(emb_file)
+    crash_at_first_fsync(monkeypatch)
+    with pytest.raises(OSError):
+        resize_npy_rows(emb_file, 10)
+    monkeypatch.undo()
+    np.testing.assert_array_equal(np.load(emb_file, mmap_mode="r"), before[:10])
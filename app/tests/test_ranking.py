@@ -0,0 +1,77 @@
+from math import atan2, cos, radians, sin, sqrt
+
+import numpy as np
+import pytest
+
+from app.api.services.catalog import Catalog
+from app.api.services.rerank import CatalogArrays, rerank_scores
+from app.api.services.topk import top_k_indices
+from app.tests.fake_catalog import make_queries
+
+
+def legacy_ratio(a, b):
+    # Công thức cũ, tính từng row
+    if np.isnan(a) or np.isnan(b):
+        return 0.0
+    return max(0.0, 1 - abs(a - b) / max(a, b))
+
+
+def legacy_location(lat1, lon1, lat2, lon2, max_km=50):
+    if np.isnan(lat1) or np.isnan(lat2) or np.isnan(lon1) or np.isnan(lon2):
+        return 0.0
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return max(0.0, 1 - 6371 * 2 * atan2(sqrt(a), sqrt(1 - a)) / max_km)
+
+
+@pytest.mark.parametrize("k", [1, 10, 100, 999])
+def test_top_k_matches_a_full_sort(k):
+    scores = np.random.default_rng(k).standard_normal(1000)
+    expected = scores.argsort()[-k:][::-1]
+    np.testing.assert_array_equal(top_k_indices(scores, k), expected)
+    np.testing.assert_array_equal(top_k_indices(scores, k, block_size=64), expected)
+
+
+def test_top_k_orders_ties_by_position():
+    scores = np.array([0.5, 0.9, 0.5, 0.1, 0.9, 0.5])
+    np.testing.assert_array_equal(top_k_indices(scores, 4), [1, 4, 0, 2])
+    np.testing.assert_array_equal(top_k_indices(scores, 4, block_size=2), [1, 4, 0, 2])
+    assert len(top_k_indices(scores, 0)) == 0
+
+
+def test_rerank_matches_the_per_row_scores():
+    rng = np.random.default_rng(0)
+    n = 500
+    price, quantity = rng.uniform(1, 100, n), rng.uniform(0, 50, n)
+    lat, lon = rng.uniform(8, 23, n), rng.uniform(102, 109, n)
+    for column in (price, quantity, lat):
+        column[rng.choice(n, 40, replace=False)] = np.nan
+    quantity[:5] = 0.0
+    arrays = CatalogArrays(np.arange(n), price, quantity, lat, lon)
+    candidates = rng.choice(n, 120, replace=False)
+    semantic = rng.uniform(-1, 1, len(candidates))
+
+    for q_price, q_qty, q_lat, q_lon in [(40.0, 10.0, 21.0, 105.8), (np.nan, 0.0, 10.8, 106.6),
+                                         (5.0, np.nan, np.nan, np.nan)]:
+        scores = rerank_scores(candidates, semantic, arrays, q_price, q_qty, q_lat, q_lon)
+        expected = [0.6 * s + 0.1 * legacy_ratio(q_price, price[i]) + 0.2 * legacy_location(q_lat, q_lon, lat[i], lon[i])
+                    + 0.1 * legacy_ratio(q_qty, quantity[i]) for i, s in zip(candidates, semantic)]
+        np.testing.assert_allclose(scores, expected, rtol=1e-12, atol=1e-12)
+        order = sorted(range(len(expected)), key=lambda j: expected[j], reverse=True)
+        np.testing.assert_array_equal(top_k_indices(scores, 20), order[:20])
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"radius_km": 50}, {"filters": {"category": "Rau củ"}}])
+def test_batch_results_follow_input_order(catalog_files, encoder, kwargs):
+    catalog = Catalog.load(**catalog_files)
+    queries = make_queries(12)
+    queries.append(dict(queries[3]))
+    expected = [catalog.recommend(q, encoder, **kwargs) for q in queries]
+    for batch, single in [(queries, expected), (queries[::-1], expected[::-1])]:
+        results = catalog.recommend_batch(batch, encoder, **kwargs)
+        # Nhân ma trận theo batch có thể lệch ở bit cuối so với từng query
+        assert [[i for i, _ in r] for r in results] == [[i for i, _ in r] for r in single]
+        for result, one in zip(results, single):
+            np.testing.assert_allclose([s for _, s in result], [s for _, s in one], rtol=1e-6)
+    assert catalog.recommend_batch([], encoder, **kwargs) == []
@@ -0,0 +1,43 @@
+from app.api.services.result_cache import ResultCache, etag_for, etag_matches, result_key
+
+QUERY = {"categoryName": "Rau củ", "productName": "Cà chua", "price": "20k/kg", "latitude": 21.0}
+
+
+def test_key_ignores_case_and_whitespace_of_text_fields():
+    noisy = {**QUERY, "productName": "  cà   CHUA ", "categoryName": "rau củ"}
+    assert result_key(noisy, 3, top_k=10) == result_key(QUERY, 3, top_k=10)
+
+
+def test_key_changes_with_catalog_version_and_params():
+    key = result_key(QUERY, 3, top_k=10, filters={"category": None})
+    assert result_key(QUERY, 4, top_k=10, filters={"category": None}) != key
+    assert result_key(QUERY, 3, top_k=5, filters={"category": None}) != key
+    assert result_key(QUERY, 3, top_k=10, filters={"category": "nấm"}) != key
+    assert result_key({**QUERY, "latitude": 21.5}, 3, top_k=10, filters={"category": None}) != key
+
+
+def test_if_none_match():
+    etag = etag_for(result_key(QUERY, 3))
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches(etag_for(result_key(QUERY, 4)), etag)
+
+
+def test_cache_is_a_bounded_lru():
+    cache = ResultCache(maxsize=2)
+    cache.put("a", [1])
+    cache.put("b", [2])
+    assert cache.get("a") == [1]
+    cache.put("c", [3])
+    assert cache.get("b") is None
+    assert cache.get("a") == [1] and cache.get("c") == [3]
+    cache.record_not_modified()
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"], stats["not_modified"]) == (2, 3, 1, 1)
+
+    disabled = ResultCache(maxsize=0)
+    disabled.put("a", [1])
+    assert disabled.get("a") is None and len(disabled) == 0
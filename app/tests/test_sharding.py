@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.api.services.catalog import Catalog
+from app.api.services.recommend_service import preprocess_items
+from app.tests.fake_catalog import make_items, make_queries
+
+QUERIES = make_queries(6)
+SETTINGS = [{}, {"top_k": 5, "candidate_k": 7}, {"radius_km": 80}, {"filters": {"category": "Rau củ"}},
+            {"filters": {"price_min": 10_000, "province": "Hà Nội"}, "radius_km": 200}]
+
+
+def assert_same_results(sharded, reference, encoder):
+    for kwargs in SETTINGS:
+        for query in QUERIES:
+            result, expected = sharded.recommend(query, encoder, **kwargs), reference.recommend(query, encoder, **kwargs)
+            assert [i for i, _ in result] == [i for i, _ in expected], kwargs
+            np.testing.assert_allclose([s for _, s in result], [s for _, s in expected], rtol=1e-6)
+        batch = sharded.recommend_batch(QUERIES, encoder, **kwargs)
+        assert [[i for i, _ in r] for r in batch] == [[i for i, _ in r] for r in reference.recommend_batch(QUERIES, encoder, **kwargs)]
+
+
+@pytest.fixture
+def sharded(catalog_files):
+    catalog = Catalog.load(shards=3, **catalog_files)
+    yield catalog
+    if catalog.shards is not None:
+        catalog.shards.close()
+
+
+def test_sharded_search_matches_in_process(sharded, catalog_files, encoder):
+    reference = Catalog.load(**catalog_files)
+    assert_same_results(sharded, reference, encoder)
+    assert sharded.shards.running
+
+
+def test_sharded_search_after_adds_and_deletes(sharded, catalog_files, encoder):
+    reference = Catalog.load(**catalog_files)
+    rows = preprocess_items(pd.DataFrame(make_items(30, seed=9, prefix="new")))
+    vectors = encoder.encode(rows["semantic_text"].tolist())
+    dead = [3, 50, 120]
+
+    # 1 lần trước khi các shard chạy, 1 lần sau
+    sharded.add(rows[:10], vectors[:10])
+    sharded.delete_rows(dead[:1])
+    sharded.recommend(QUERIES[0], encoder)
+    assert sharded.shards.running
+    sharded.add(rows[10:], vectors[10:])
+    sharded.delete_rows(dead[1:] + [len(reference) + 12])
+
+    reference.add(rows, vectors)
+    reference.delete_rows(dead + [len(reference) - len(rows) + 12])
+    assert_same_results(sharded, reference, encoder)
+    everything = {i for i, _ in sharded.recommend(QUERIES[0], encoder, top_k=1000, candidate_k=1000)}
+    assert not everything & ({str(reference.arrays.ids[r]) for r in dead} | {"new-12"})
+    assert "new-11" in everything
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.api.services.units import parse_price, parse_price_column, parse_quantity, parse_quantity_column
+
+QUANTITIES = {
+    "5kg": 5.0,
+    "100kg": 100.0,
+    "2tấn": 2000.0,
+    "3tạ": 300.0,
+    "1.200kg": 1200.0,
+    "4.779 kg": 4779.0,
+    "1.5 tấn": 1500.0,
+    "3 tạ": 300.0,
+    "2 yến": 20.0,
+    "500g": 0.5,
+    "1200": 1200.0,
+}
+
+PRICES = {
+    "17.059 đ/kg": 17059.0,
+    "15000đ/kg": 15000.0,
+    "15000d/kg": 15000.0,
+    "20.000đ": 20000.0,
+    "30k/kg": 30000.0,
+    "1,2 triệu/tấn": 1200.0,
+    "25 nghìn đ/yến": 2500.0,
+    "12.000 vnđ/kg": 12000.0,
+}
+
+
+@pytest.mark.parametrize("text, expected", QUANTITIES.items())
+def test_parse_quantity(text, expected):
+    assert parse_quantity(text) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("text, expected", PRICES.items())
+def test_parse_price(text, expected):
+    assert parse_price(text) == pytest.approx(expected)
+
+
+def test_missing_number_is_nan():
+    assert np.isnan(parse_quantity("liên hệ"))
+    assert np.isnan(parse_price(None))
+
+
+def test_column_matches_scalar():
+    texts = list(QUANTITIES) + list(PRICES) + ["liên hệ", None]
+    column = pd.Series(texts, dtype=object)
+    np.testing.assert_array_equal(parse_quantity_column(column), [parse_quantity(t) for t in texts])
+    np.testing.assert_array_equal(parse_price_column(column), [parse_price(t) for t in texts])
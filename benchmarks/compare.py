@@ -0,0 +1,74 @@
+"""Compares two `benchmarks.run` result files.
+
+    python -m benchmarks.compare benchmarks/results/<before>.json benchmarks/results/<after>.json --fail-above 10
+
+Prints every metric present in both runs (per catalog size) with its
+relative change. Throughput metrics (`qps`) are better when higher, all
+others (seconds, ms, MB, bytes) when lower. With `--fail-above` the exit
+status is 1 if any metric regressed by more than that many percent.
+"""
+
+import argparse
+import json
+import sys
+
+# Metric không so sánh: tham số / bộ đếm, không phải số đo
+SKIPPED = {"rows", "n", "generate_s", "seq", "groups", "committed", "pending"}
+
+
+def flatten(value, prefix="") -> dict:
+    """{"a": {"b": 1}} -> {"a.b": 1}, numbers only."""
+
+    if isinstance(value, dict):
+        out = {}
+        for key, item in value.items():
+            out.update(flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+        return out
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: float(value)}
+    return {}
+
+
+def higher_is_better(metric: str) -> bool:
+    return metric.rsplit(".", 1)[-1] == "qps"
+
+
+def compare(before: dict, after: dict) -> list:
+    """(rows, metric, before, after, change %, regression %) for every shared metric."""
+
+    rows = []
+    old_by_size = {result["rows"]: flatten(result) for result in before["results"]}
+    for result in after["results"]:
+        old = old_by_size.get(result["rows"])
+        if old is None:
+            continue
+        for metric, new_value in flatten(result).items():
+            if metric not in old or metric.rsplit(".", 1)[-1] in SKIPPED or old[metric] == 0:
+                continue
+            change = (new_value - old[metric]) / abs(old[metric]) * 100
+            regression = -change if higher_is_better(metric) else change
+            rows.append((result["rows"], metric, old[metric], new_value, change, regression))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--fail-above", type=float, help="Exit 1 nếu có metric chậm / tốn hơn quá N %%")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"before: {before['meta'].get('commit')}  after: {after['meta'].get('commit')}")
+    rows = compare(before, after)
+    width = max((len(metric) for _, metric, *_ in rows), default=10)
+    for size, metric, old, new, change, regression in rows:
+        flag = "  <-- regression" if args.fail_above is not None and regression > args.fail_above else ""
+        print(f"{size:>9}  {metric:<{width}}  {old:>12.3f}  {new:>12.3f}  {change:+8.1f}%{flag}")
+
+    if args.fail_above is not None and any(row[5] > args.fail_above for row in rows):
+        sys.exit(1)
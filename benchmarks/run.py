@@ -0,0 +1,336 @@
+"""Benchmarks of the recommendation engine on synthetic catalogs.
+
+    python -m benchmarks.run --sizes 1k,10k,100k,1m
+    python -m benchmarks.run --sizes 10k --ann exact,ivf --model minilm --out before.json
+    python -m benchmarks.compare before.json after.json
+
+Each catalog size runs in a fresh process, so its peak RSS is its own. For
+every size the run records:
+
+- load: `load_data` from the CSV, `Catalog.load` without and with the
+  snapshot / display files;
+- query latency (p50 / p99 / mean, ms) of `Catalog.recommend` (the service
+  path over `recommend_service.recommend`) per ANN backend and scenario:
+  full scan, radius, category filter, price range, and `recommend_batch`;
+- throughput (queries/s and latency under load) at several thread counts;
+- add cost: `process_and_add_item` per listing, `process_and_add_items` and
+  the `IngestionWriter` group commit per 100 listings, on a copy of the files;
+- memory: RSS after load, peak RSS (before and after the adds) and catalog
+  bytes per listing;
+- fork: private memory of workers forked from a loaded catalog (gunicorn
+  `preload_app`) after each applied a few adds, without and with
+  `Catalog.reserve` in the parent.
+
+Results are written as JSON (one document per run, tagged with the git
+commit) so runs of two commits can be diffed with `benchmarks.compare`.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from app.api.services.catalog import Catalog
+from app.api.services.catalog_frame import process_memory
+from app.api.services.ingestion import IngestionWriter
+from app.api.services.recommend_service import load_data, process_and_add_item, process_and_add_items
+from benchmarks.synthetic import RandomEncoder, make_items, make_metadata, make_queries, write_catalog
+
+BENCH_DIR = Path(__file__).parent
+SCENARIOS = {
+    "exact": {},
+    "radius_50km": {"radius_km": 50},
+    "filter_category": {"filters": {"category": "Rau củ"}},
+    "filter_price": {"filters": {"price_min": 20_000, "price_max": 60_000}},
+}
+
+
+def parse_size(text: str) -> int:
+    """"10k" -> 10_000, "1m" -> 1_000_000."""
+
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def latency_stats(seconds) -> dict:
+    ms = np.asarray(seconds, dtype=np.float64) * 1e3
+    return {
+        "n": len(ms),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "max_ms": float(ms.max()),
+    }
+
+
+def rss_mb() -> float:
+    """Current resident set size."""
+
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss: KB trên Linux, byte trên macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def load_model(name: str):
+    if name == "random":
+        return RandomEncoder()
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2" if name == "minilm" else name, device="cpu")
+
+
+# -----------------------------
+# Đo từng phần
+# -----------------------------
+def bench_load(meta_file, emb_file, index_file) -> dict:
+    for derived in meta_file.parent.glob(meta_file.name + ".*"):
+        derived.unlink()
+    _, csv_s = timed(load_data, emb_file, meta_file, snapshot=False)
+    _, cold_s = timed(Catalog.load, emb_file=emb_file, meta_file=meta_file, index_file=index_file)
+    _, warm_s = timed(Catalog.load, emb_file=emb_file, meta_file=meta_file, index_file=index_file)
+    return {"load_data_csv_s": csv_s, "catalog_cold_s": cold_s, "catalog_snapshot_s": warm_s}
+
+
+def bench_queries(catalog, model, queries, batch_size: int) -> dict:
+    results = {}
+    for name, params in SCENARIOS.items():
+        for query in queries[:5]:
+            catalog.recommend(query, model, **params)
+        results[name] = latency_stats([timed(catalog.recommend, q, model, **params)[1] for q in queries])
+
+    batches = [queries[i:i + batch_size] for i in range(0, len(queries) - batch_size + 1, batch_size)]
+    if batches:
+        seconds = [timed(catalog.recommend_batch, batch, model)[1] for batch in batches]
+        results[f"batch_{batch_size}"] = {
+            **latency_stats(seconds),
+            "per_query_ms": float(np.mean(seconds)) * 1e3 / batch_size,
+        }
+    return results
+
+
+def bench_throughput(catalog, model, queries, concurrency) -> dict:
+    results = {}
+    for threads in concurrency:
+        def one(query):
+            return timed(catalog.recommend, query, model)[1]
+
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(one, queries[:threads]))
+            start = time.perf_counter()
+            seconds = list(executor.map(one, queries))
+            elapsed = time.perf_counter() - start
+        results[str(threads)] = {"qps": len(queries) / elapsed, **latency_stats(seconds)}
+    return results
+
+
+def bench_adds(directory, model, rows: int, adds: int, seed: int) -> dict:
+    """Add cost on a copy of the catalog files (the originals stay reusable)."""
+
+    work = directory.parent / (directory.name + "-work")
+    shutil.rmtree(work, ignore_errors=True)
+    shutil.copytree(directory, work, copy_function=shutil.copy2)
+    meta_file, emb_file = work / "product_metadata_nopro.csv", work / "semantic_vectors.npy"
+    try:
+        catalog = Catalog.load(emb_file=emb_file, meta_file=meta_file, index_file=work / "ivf_index.npz")
+        items = make_items(adds + 200, seed + 3)
+
+        seconds = []
+        for item in items[:adds]:
+            result, elapsed = timed(process_and_add_item, item, model, catalog=catalog,
+                                    meta_file=meta_file, emb_file=emb_file)
+            if result["status"] != "success":
+                raise RuntimeError(result["message"])
+            seconds.append(elapsed)
+
+        _, bulk_s = timed(process_and_add_items, items[adds:adds + 100], model, catalog=catalog,
+                          meta_file=meta_file, emb_file=emb_file)
+
+        writer = IngestionWriter(model, meta_file=meta_file, emb_file=emb_file).start(catalog)
+        with ThreadPoolExecutor(16) as executor:
+            start = time.perf_counter()
+            list(executor.map(writer.add_item, items[adds + 100:adds + 200]))
+            writer_s = time.perf_counter() - start
+        writer.close()
+
+        if len(catalog) != rows + adds + 200:
+            raise RuntimeError(f"catalog has {len(catalog)} rows after adds, expected {rows + adds + 200}")
+        return {
+            "process_and_add_item": latency_stats(seconds),
+            "process_and_add_items_100_s": bulk_s,
+            "writer_concurrent_100_s": writer_s,
+            "writer": writer.stats(),
+        }
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def bench_fork_writes(meta_file, emb_file, index_file, workers: int, reserve_rows: int, seed: int) -> dict:
+    """Private MB of each forked worker after it applied 10 listings, as `CatalogSync` does in every worker."""
+
+    rows = make_metadata(10, seed + 4)
+    vectors = RandomEncoder().encode(rows["semantic_text"].tolist())
+    context = mp.get_context("fork")
+    results = {}
+    for reserve in (0, reserve_rows):
+        catalog = Catalog.load(emb_file=emb_file, meta_file=meta_file, index_file=index_file)
+        if reserve:
+            catalog.reserve(reserve)
+        queue = context.Queue()
+
+        def worker():
+            before = process_memory().get("private_bytes", 0)
+            catalog.add(rows, vectors)
+            queue.put((before, process_memory().get("private_bytes", 0)))
+
+        processes = [context.Process(target=worker) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        measured = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        results[f"reserve_{reserve}"] = {
+            "private_mb_after_fork": float(np.mean([b for b, _ in measured])) / 2**20,
+            "private_mb_after_write": float(np.mean([a for _, a in measured])) / 2**20,
+        }
+        del catalog
+    return results
+
+
+def bench_size(rows: int, options: dict) -> dict:
+    """Full benchmark of one catalog size (runs in its own process)."""
+
+    seed = options["seed"]
+    directory = Path(options["data_dir"]) / f"catalog-{rows}-seed{seed}"
+    (meta_file, emb_file), generate_s = timed(write_catalog, directory, rows, seed)
+    model = load_model(options["model"])
+    queries = make_queries(options["queries"], seed + 2)
+
+    result = {"rows": rows, "generate_s": generate_s}
+    result["load"] = bench_load(meta_file, emb_file, directory / "ivf_index.npz")
+
+    result["query"], result["throughput"] = {}, {}
+    for backend in options["ann"]:
+        catalog, load_s = timed(Catalog.load, emb_file=emb_file, meta_file=meta_file, ann_backend=backend,
+                                index_file=directory / "ivf_index.npz")
+        result["load"][f"catalog_{backend}_s"] = load_s
+        result["query"][backend] = bench_queries(catalog, model, queries, options["batch_size"])
+        result["throughput"][backend] = bench_throughput(catalog, model, queries, options["concurrency"])
+
+    result["memory"] = {
+        "rss_after_load_mb": rss_mb(),
+        "catalog_bytes_per_listing": catalog.memory_report()["bytes_per_listing"],
+    }
+    del catalog
+    result["memory"]["peak_rss_mb"] = peak_rss_mb()
+    if options["fork_workers"]:
+        result["fork"] = bench_fork_writes(meta_file, emb_file, directory / "ivf_index.npz",
+                                           options["fork_workers"], options["reserve_rows"], seed)
+    if options["adds"]:
+        result["add"] = bench_adds(directory, model, rows, options["adds"], seed)
+        # Add đầu tiên copy ma trận embeddings (memory map) vào buffer RAM có capacity dư: đỉnh RAM khi add tính riêng
+        result["memory"]["peak_rss_with_adds_mb"] = peak_rss_mb()
+    return result
+
+
+# -----------------------------
+# Chạy
+# -----------------------------
+def git_revision() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=BENCH_DIR, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(status) if status is not None else None}
+
+
+def run(sizes, options: dict) -> dict:
+    report = {
+        "meta": {
+            **git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "options": options,
+        },
+        "results": [],
+    }
+    for rows in sizes:
+        print(f"[bench] {rows} rows ...", flush=True)
+        # Process mới cho mỗi kích thước: peak RSS và cache không lẫn giữa các lần đo
+        with ProcessPoolExecutor(1, mp_context=mp.get_context("spawn")) as executor:
+            result = executor.submit(bench_size, rows, options).result()
+        report["results"].append(result)
+        exact = result["query"].get(options["ann"][0], {}).get("exact", {})
+        print(f"[bench] {rows} rows: p50 {exact.get('p50_ms', float('nan')):.2f} ms, "
+              f"p99 {exact.get('p99_ms', float('nan')):.2f} ms, peak RSS {result['memory']['peak_rss_mb']:.0f} MB",
+              flush=True)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the recommendation engine on synthetic catalogs.")
+    parser.add_argument("--sizes", default="1k,10k,100k,1m", help="Số listing, vd 1k,10k,100k,1m")
+    parser.add_argument("--ann", default="exact", help="ANN backend cần đo, vd exact,ivf")
+    parser.add_argument("--queries", type=int, default=200, help="Số query / scenario")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--concurrency", default="1,4,16", help="Số thread gửi query đồng thời")
+    parser.add_argument("--adds", type=int, default=20, help="Số lần process_and_add_item (0 = bỏ qua)")
+    parser.add_argument("--fork-workers", type=int, default=4, help="Số worker fork để đo RAM riêng (0 = bỏ qua)")
+    parser.add_argument("--reserve-rows", type=int, default=100_000, help="Catalog.reserve trước khi fork")
+    parser.add_argument("--model", default="random",
+                        help="random (vector ngẫu nhiên theo text, không đo model), minilm hoặc tên model")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=str(BENCH_DIR / "data"), help="Nơi lưu catalog đã sinh")
+    parser.add_argument("--out", help="File JSON kết quả (mặc định benchmarks/results/<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    options = {
+        "ann": [b.strip() for b in args.ann.split(",") if b.strip()],
+        "queries": args.queries,
+        "batch_size": args.batch_size,
+        "concurrency": [int(c) for c in args.concurrency.split(",")],
+        "adds": args.adds,
+        "fork_workers": args.fork_workers,
+        "reserve_rows": args.reserve_rows,
+        "model": args.model,
+        "seed": args.seed,
+        "data_dir": args.data_dir,
+    }
+    report = run([parse_size(s) for s in args.sizes.split(",")], options)
+
+    out = Path(args.out) if args.out else BENCH_DIR / "results" / (
+        f"{(report['meta']['commit'] or 'nogit')[:10]}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"[bench] results: {out}")
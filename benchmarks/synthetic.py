@@ -0,0 +1,197 @@
+"""Synthetic catalogs in the schema of `product_metadata_nopro.csv`.
+
+Rows are drawn from fixed Vietnamese vocabularies (categories / products,
+provinces with their coordinates, street names) with the price and quantity
+formats seen in real listings, and every row gets a random normalized 384-d
+vector. A catalog is fully determined by (rows, seed) and is written once
+under the data directory, then reused by later runs.
+"""
+
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.api.services.recommend_service import META_COLUMNS, extract_province
+from app.api.services.units import parse_price_column, parse_quantity_column
+
+DIM = 384
+
+PRODUCTS = {
+    "Cây ăn quả": [
+        "vải thiều", "cam sành", "mít Thái", "dưa hấu", "thanh long ruột đỏ", "sầu riêng Ri6",
+        "bưởi da xanh", "xoài cát Hòa Lộc", "nhãn lồng", "chuối già hương",
+    ],
+    "Rau củ": [
+        "cà chua", "đậu cô ve", "rau cải xanh", "bắp cải", "cải bó xôi", "dưa leo", "bí đỏ",
+        "mướp hương", "rau muống", "cà rốt",
+    ],
+    "Cây công nghiệp": [
+        "hạt điều nhân", "cao su thiên nhiên", "cọ dầu", "hạt tiêu đen", "cà phê nhân Robusta",
+        "điều tươi", "mía nguyên liệu", "chè xanh", "cà phê Arabica",
+    ],
+}
+
+# Tỉnh -> (quận / huyện, lat, lon)
+PROVINCES = {
+    "Hà Nội": ("Quận Hoàn Kiếm", 21.0285, 105.8542),
+    "Hải Phòng": ("Quận Lê Chân", 20.8449, 106.6881),
+    "Thừa Thiên Huế": ("TP. Huế", 16.4637, 107.5909),
+    "Đà Nẵng": ("Quận Hải Châu", 16.0544, 108.2022),
+    "TP. Hồ Chí Minh": ("Quận 1", 10.7769, 106.7009),
+    "Cần Thơ": ("Quận Ninh Kiều", 10.0452, 105.7469),
+    "Đắk Lắk": ("TP. Buôn Ma Thuột", 12.6667, 108.0500),
+    "Lâm Đồng": ("TP. Đà Lạt", 11.9404, 108.4583),
+    "Bắc Giang": ("Huyện Lục Ngạn", 21.3729, 106.6262),
+    "Tiền Giang": ("Huyện Cái Bè", 10.3350, 106.0327),
+    "Bình Thuận": ("TP. Phan Thiết", 10.9289, 108.1021),
+    "Sơn La": ("TP. Sơn La", 21.3256, 103.9188),
+    "Nghệ An": ("TP. Vinh", 18.6796, 105.6813),
+    "Bến Tre": ("TP. Bến Tre", 10.2434, 106.3756),
+    "Gia Lai": ("TP. Pleiku", 13.9833, 108.0000),
+}
+
+STREETS = ["Hoàng Diệu", "Quang Trung", "Hùng Vương", "Lê Lợi", "Trần Phú", "Nguyễn Huệ", "Lý Thường Kiệt",
+           "Hai Bà Trưng", "Điện Biên Phủ", "Phan Chu Trinh"]
+
+
+def _vi_number(values: np.ndarray) -> list:
+    """Integers with "." as the thousands separator ("14.952")."""
+
+    return [f"{v:,}".replace(",", ".") for v in values.tolist()]
+
+
+def _price_strings(values: np.ndarray, rng) -> np.ndarray:
+    # Phần lớn "14.952 đ/kg", thêm vài cách viết khác mà units.py hiểu được
+    out = np.array([s + " đ/kg" for s in _vi_number(values)], dtype=object)
+    style = rng.random(len(values))
+    short = style < 0.1
+    out[short] = [f"{v // 1000}k/kg" for v in values[short].tolist()]
+    per_ton = (style >= 0.1) & (style < 0.15)
+    out[per_ton] = [f"{v / 1000:.1f}".replace(".", ",") + " triệu/tấn" for v in values[per_ton].tolist()]
+    return out
+
+
+def _quantity_strings(values: np.ndarray, rng) -> np.ndarray:
+    out = np.array([s + " kg" for s in _vi_number(values)], dtype=object)
+    tons = (rng.random(len(values)) < 0.1) & (values >= 1000)
+    out[tons] = [f"{v / 1000:.1f} tấn" for v in values[tons].tolist()]
+    return out
+
+
+def make_metadata(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Preprocessed metadata rows (META_COLUMNS) of a synthetic catalog."""
+
+    rng = np.random.default_rng(seed)
+    pairs = [(category, product) for category, products in PRODUCTS.items() for product in products]
+    pair_idx = rng.integers(0, len(pairs), rows)
+    provinces = list(PROVINCES)
+    province_idx = rng.integers(0, len(provinces), rows)
+
+    raw = rng.bytes(16 * rows).hex()
+    ids = [f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:32]}" for h in (raw[i:i + 32] for i in range(0, len(raw), 32))]
+
+    centers = np.array([PROVINCES[p][1:] for p in provinces])[province_idx]
+    coords = np.round(centers + rng.normal(0.0, 0.15, (rows, 2)), 4)
+
+    streets = np.array(STREETS, dtype=object)[rng.integers(0, len(STREETS), rows)]
+    numbers = rng.integers(1, 300, rows)
+    wards = rng.integers(1, 20, rows)
+    addresses = [
+        f"Số {n} {s}, Phường {w}, {PROVINCES[provinces[p]][0]}, {provinces[p]}, Việt Nam"
+        for n, s, w, p in zip(numbers.tolist(), streets.tolist(), wards.tolist(), province_idx.tolist())
+    ]
+
+    prices = rng.integers(5_000, 120_000, rows)
+    quantities = rng.integers(100, 5_000, rows)
+    categories = np.array([pairs[i][0] for i in range(len(pairs))], dtype=object)[pair_idx]
+    products = np.array([pairs[i][1] for i in range(len(pairs))], dtype=object)[pair_idx]
+
+    df = pd.DataFrame({
+        "id": ids,
+        "categoryName": categories,
+        "productName": products,
+        "price": _price_strings(prices, rng),
+        "quantity": _quantity_strings(quantities, rng),
+        "latitude": coords[:, 0],
+        "longitude": coords[:, 1],
+        "address": addresses,
+    })
+    # Cùng cách tiền xử lý với preprocess_items, nhưng tính 1 lần trên mỗi tỉnh
+    province_names = {p: extract_province(f"Phường 1, {PROVINCES[p][0]}, {p}, Việt Nam") for p in provinces}
+    df["province"] = [province_names[provinces[p]] for p in province_idx.tolist()]
+    df["price_num"] = parse_price_column(df["price"])
+    df["quantity_num"] = parse_quantity_column(df["quantity"])
+    df["semantic_text"] = df["categoryName"] + " | " + df["productName"]
+    return df[META_COLUMNS]
+
+
+def write_catalog(directory, rows: int, seed: int = 0, chunk_rows: int = 100_000):
+    """Writes `product_metadata_nopro.csv` and `semantic_vectors.npy` for (rows, seed) into `directory`.
+
+    Returns the (metadata, embeddings) paths; existing files are reused.
+    """
+
+    directory = Path(directory)
+    meta_file = directory / "product_metadata_nopro.csv"
+    emb_file = directory / "semantic_vectors.npy"
+    if meta_file.exists() and emb_file.exists():
+        return meta_file, emb_file
+
+    directory.mkdir(parents=True, exist_ok=True)
+    make_metadata(rows, seed).to_csv(meta_file, index=False)
+
+    # Ghi theo khối để catalog 1M row (~1.5 GB vector) không cần nằm hết trong RAM
+    rng = np.random.default_rng(seed + 1)
+    vectors = np.lib.format.open_memmap(emb_file, mode="w+", dtype=np.float32, shape=(rows, DIM))
+    for start in range(0, rows, chunk_rows):
+        block = rng.standard_normal((min(chunk_rows, rows - start), DIM), dtype=np.float32)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        vectors[start:start + len(block)] = block
+    vectors.flush()
+    del vectors
+    return meta_file, emb_file
+
+
+def make_items(rows: int, seed: int) -> list:
+    """Raw listings in the /recommend/add-item format."""
+
+    df = make_metadata(rows, seed)
+    return [
+        {"title": f"Bán {row['productName']}", "content": "Hàng mới thu hoạch", **row}
+        for row in df.drop(columns=["province", "price_num", "quantity_num", "semantic_text"]).to_dict("records")
+    ]
+
+
+def make_queries(rows: int, seed: int) -> list:
+    """Query dicts in the /recommend/ format."""
+
+    return [
+        {key: item[key] for key in ("categoryName", "productName", "price", "quantity", "latitude", "longitude",
+                                    "address")}
+        for item in make_items(rows, seed)
+    ]
+
+
+class RandomEncoder:
+    """Stand-in for the SentenceTransformer: a fixed random unit vector per text.
+
+    Keeps model inference out of the measurements, so the benchmark times
+    the recommendation engine itself.
+    """
+
+    def __init__(self, dim: int = DIM):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, sentences, normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            vector = np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(self.dim)
+            vectors[i] = vector / np.linalg.norm(vector)
+        return vectors[0] if single else vectors
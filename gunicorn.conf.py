@@ -0,0 +1,46 @@
+"""Gunicorn config: several UvicornWorker processes sharing one preloaded catalog.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+The model, embeddings, DataFrame and indexes are loaded once in the master
+(`preload_app`) and the workers are forked from it, so their pages are shared
+copy-on-write instead of being loaded once per worker. Listings added through
+any worker reach the others via `CatalogSync`; the master reserves room for
+CATALOG_RESERVE_ROWS of them first (`Catalog.reserve`), so applying them does
+not give each worker a private copy of the grown buffers. Each worker then
+warms up in the background (`recommender.start`) and reports ready on
+/health/ready.
+"""
+
+import gc
+import multiprocessing
+import os
+
+bind = f"{os.getenv('APP_HOST', '0.0.0.0')}:{os.getenv('APP_PORT', '9001')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
+
+
+def when_ready(server):
+    # Load model + catalog trong master trước khi fork để các worker dùng chung; warm-up (torch, shard,
+    # thread encode) chạy trong từng worker sau fork, /health/ready của worker báo ready khi xong
+    from app.core import recommender
+    from app.core.config import CATALOG_RESERVE_ROWS
+
+    recommender.load()
+    # Chỗ trống cho listing mới: worker ghi vào đó (chỉ các page mới thành riêng), không copy cả catalog
+    recommender.catalog.reserve(CATALOG_RESERVE_ROWS)
+    # Các object đã load xong không được GC của worker quét lại: quét sẽ ghi vào header object
+    # và làm copy page dùng chung
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Chia core giữa các worker thay vì mỗi worker chạy torch trên mọi core
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(max(1, multiprocessing.cpu_count() // server.num_workers))